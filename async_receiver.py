@@ -0,0 +1,149 @@
+import asyncio
+import logging
+from frame_assembler import FrameAssembler
+from psn_socket import open_multicast_socket, MULTICAST_GROUP, PORT, SOCKET_RCVBUF
+from psn_decoder import parse_chunks, data_frame
+from tracker_registry import TrackerRegistry
+
+logger = logging.getLogger('PSNReceiver')
+
+
+# One async iterator over the frames of an AsyncPSNReceiver. Only the newest frame of
+# each source is kept, so a consumer that falls behind skips frames instead of queueing
+# them. A frame is reused by the receiver later on; copy anything needed across an await.
+class FrameSubscription:
+    def __init__(self, receiver):
+        self._receiver = receiver
+        self._latest = {}
+        self._ready = asyncio.Event()
+        self.skipped = 0
+
+    def _push(self, frame):
+        if frame.source in self._latest:
+            self.skipped += 1
+        self._latest[frame.source] = frame
+        self._ready.set()
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        while not self._latest:
+            if self._receiver.closed:
+                raise StopAsyncIteration
+            self._ready.clear()
+            await self._ready.wait()
+        source = next(iter(self._latest))
+        return self._latest.pop(source)
+
+    def close(self):
+        self._receiver._subscriptions.discard(self)
+        self._ready.set()
+
+
+class PSNProtocol(asyncio.DatagramProtocol):
+    def __init__(self, receiver):
+        self._receiver = receiver
+
+    def datagram_received(self, data, addr):
+        try:
+            self._receiver._handle_packet(data, addr[0])
+        except Exception as e:
+            logger.error("Error handling packet from %s: %s", addr[0], e)
+
+    def error_received(self, exc):
+        logger.error("Error receiving data: %s", exc)
+
+    def connection_lost(self, exc):
+        self._receiver._close()
+
+
+# asyncio counterpart of receiver.start_udp_receiver. Joins the same multicast group,
+# decodes and reassembles data frames on the event loop thread and hands them to any
+# number of async iterators:
+#
+#     psn = AsyncPSNReceiver()
+#     await psn.start()
+#     async for frame in psn.frames():
+#         ...
+class AsyncPSNReceiver:
+    def __init__(self, group=MULTICAST_GROUP, port=PORT, rcvbuf=SOCKET_RCVBUF):
+        self.group = group
+        self.port = port
+        self.rcvbuf = rcvbuf
+        self.assembler = FrameAssembler()
+        self.registry = TrackerRegistry()
+        self.closed = True
+        self._subscriptions = set()
+        self._transport = None
+        self._expire_handle = None
+
+    async def start(self):
+        loop = asyncio.get_running_loop()
+        sock = open_multicast_socket(self.group, self.port, rcvbuf=self.rcvbuf, blocking=False)
+        self._transport, _ = await loop.create_datagram_endpoint(lambda: PSNProtocol(self), sock=sock)
+        self.closed = False
+        self._schedule_expire()
+        logger.info("Async PSN receiver listening on %s:%d", self.group, self.port)
+
+    def close(self):
+        if self._transport is not None:
+            self._transport.close()
+        self._close()
+
+    def frames(self):
+        subscription = FrameSubscription(self)
+        self._subscriptions.add(subscription)
+        return subscription
+
+    async def __aenter__(self):
+        await self.start()
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self.close()
+
+    def _handle_packet(self, data, ip_address):
+        for chunk_type, chunk_data in parse_chunks(data):
+            if chunk_type == 'PSN_INFO_PACKET':
+                info = dict(chunk_data)
+                header = info.get('PSN_INFO_PACKET_HEADER')
+                self.registry.update(ip_address, info.get('PSN_INFO_SYSTEM_NAME'),
+                                     info.get('PSN_INFO_TRACKER_LIST', []),
+                                     header.frame_id if header else 0,
+                                     header.frame_packet_count if header else 1)
+            elif chunk_type == 'PSN_DATA_PACKET':
+                if any(sub_chunk_type == 'PSN_DATA_PACKET_HEADER' for sub_chunk_type, _ in chunk_data):
+                    self._publish(self.assembler.add(data_frame, ip_address))
+
+    def _publish(self, frames):
+        for frame in frames:
+            for subscription in self._subscriptions:
+                subscription._push(frame)
+
+    def _schedule_expire(self):
+        loop = asyncio.get_running_loop()
+        self._expire_handle = loop.call_later(self.assembler.timeout, self._expire)
+
+    def _expire(self):
+        self._publish(self.assembler.expire())
+        if not self.closed:
+            self._schedule_expire()
+
+    def _close(self):
+        if self.closed:
+            return
+        self.closed = True
+        if self._expire_handle is not None:
+            self._expire_handle.cancel()
+        for subscription in self._subscriptions:
+            subscription._ready.set()
+
+
+async def main():
+    async with AsyncPSNReceiver() as psn:
+        async for frame in psn.frames():
+            logger.info("Frame from %s: %s", frame.source, frame)
+
+if __name__ == "__main__":
+    asyncio.run(main())
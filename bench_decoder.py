@@ -0,0 +1,80 @@
+import argparse
+import importlib
+import time
+from psn_decoder import CHUNK_HEADER
+from psn_encoder import encode_info_packets
+from psn_generator import SyntheticShow, encode_data_packets
+
+# Decoder throughput benchmark. Builds one PSN info packet and one PSN data packet with
+# the given number of trackers and reports how many of each the decoder parses per second.
+#
+#     python bench_decoder.py --trackers 100 --seconds 2
+#     python bench_decoder.py --module receiver    # any module exposing parse_chunks
+
+
+# Largest PSN packet: the 15-bit length of the outer chunk plus its header
+MAX_BENCH_PACKET_SIZE = 0x7FFF + CHUNK_HEADER.size
+
+
+# The packets come from the same encoder as psn_generator's traffic, each holding every
+# tracker in a single packet
+def build_info_packet(tracker_count):
+    names = {tracker_id: f"Tracker {tracker_id}" for tracker_id in range(tracker_count)}
+    return single_packet(encode_info_packets('Benchmark Server', names, 1000, 1, MAX_BENCH_PACKET_SIZE))
+
+
+def build_data_packet(tracker_count):
+    tracker_chunks = SyntheticShow(tracker_count).at(0.0, 1000)
+    return single_packet(encode_data_packets(tracker_chunks, 1000, 1, MAX_BENCH_PACKET_SIZE))
+
+
+def single_packet(packets):
+    if len(packets) != 1:
+        raise ValueError(f"The trackers need {len(packets)} packets; use fewer to benchmark single packets")
+    return packets[0]
+
+
+def measure(parse, packet, seconds):
+    count = 0
+    start = time.perf_counter()
+    deadline = start + seconds
+    while True:
+        for _ in range(100):
+            parse(packet)
+        count += 100
+        now = time.perf_counter()
+        if now >= deadline:
+            return count / (now - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark PSN packet decoding')
+    parser.add_argument('--module', default='psn_decoder', help='module providing parse_chunks')
+    parser.add_argument('--trackers', type=int, default=100)
+    parser.add_argument('--seconds', type=float, default=2.0)
+    args = parser.parse_args()
+
+    module = importlib.import_module(args.module)
+    parse = module.parse_chunks
+    try:
+        info_packet = build_info_packet(args.trackers)
+        data_packet = build_data_packet(args.trackers)
+    except ValueError as e:
+        parser.error(str(e))
+
+    runs = [('info', parse, info_packet), ('data', parse, data_packet)]
+    cache = getattr(module, 'info_cache', None)
+    if cache is not None:
+        # Repeated info packets are served from the cache; also measure a changed one
+        def parse_uncached(packet):
+            cache.clear()
+            return parse(packet)
+        runs.insert(1, ('info (uncached)', parse_uncached, info_packet))
+
+    for name, run, packet in runs:
+        rate = measure(run, packet, args.seconds)
+        print(f"{args.module} {name:15} packet ({args.trackers} trackers, {len(packet)} bytes): "
+              f"{rate:10.0f} packets/s  {1e6 / rate:8.1f} us/packet")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,161 @@
+import argparse
+import os
+import subprocess
+import sys
+import threading
+import time
+import numpy as np
+from bench_decoder import measure
+from psn_decoder import parse_chunks
+from subscription_hub import iter_subscription, HUB_ADDRESS
+from psn_generator import PSNGenerator, multicast_sender
+from tracker_frame import MAX_TRACKERS
+
+# Regression benchmarks built on psn_generator:
+#   decode    decoder packets/s for data frames of several sizes
+#   latency   send -> receiver.py -> data_parser.py, from the PSN packet timestamps
+#   capacity  largest tracker count whose frames all make it through data_parser.py
+#
+#     python bench_suite.py                       # all of them
+#     python bench_suite.py decode --seconds 1
+#     python bench_suite.py capacity --rate 120
+#
+# latency and capacity start receiver.py and data_parser.py, so neither may be running
+# already, and read the frames data_parser.py passes on from its subscription hub
+# (RUN_SUBSCRIPTION_HUB, on by default). Latencies therefore include the hub's hop to
+# this process, and a hub subscriber that falls behind has frames coalesced.
+
+GROUP = '236.10.10.10'
+PORT = 56565
+CONNECT_TIMEOUT = 10.0
+# A step of the capacity benchmark passes when this share of frames arrives complete
+CAPACITY_THRESHOLD = 0.99
+
+BENCHMARKS = ['decode', 'latency', 'capacity']
+
+
+def bench_decode(tracker_counts, seconds):
+    for tracker_count in tracker_counts:
+        packets = [packet for packet in PSNGenerator(tracker_count, info_interval=float('inf')).frame(0.0)]
+        rate = measure(lambda frame: [parse_chunks(packet) for packet in frame], packets, seconds)
+        print(f"decode {tracker_count:5} trackers ({len(packets)} packets): {rate * len(packets):10.0f} packets/s "
+              f"{rate * tracker_count:12.0f} trackers/s  {1e6 / rate:8.1f} us/frame")
+
+
+# Subscribes to data_parser.py's subscription hub and records, for every frame that came
+# through receiver.py and data_parser.py, whether it was complete and how long after its
+# packet timestamp it arrived
+class FrameCollector:
+    def __init__(self, address=HUB_ADDRESS):
+        self.address = address
+        self.connected = threading.Event()
+        self.latencies = []
+        self.complete = 0
+        self.partial = 0
+        threading.Thread(target=self._run, daemon=True).start()
+
+    def _run(self):
+        while True:
+            try:
+                for source, packet_timestamp, frame_id, packet_count, packets_received, rows in \
+                        iter_subscription(self.address):
+                    now = time.time_ns() // 1000
+                    self.connected.set()
+                    if packets_received == packet_count:
+                        self.complete += 1
+                    else:
+                        self.partial += 1
+                    self.latencies.append(now - packet_timestamp)
+                return
+            except OSError:
+                # data_parser.py is not listening yet
+                time.sleep(0.2)
+
+    def reset(self):
+        self.latencies = []
+        self.complete = 0
+        self.partial = 0
+
+
+def start_script(name):
+    here = os.path.dirname(os.path.abspath(__file__))
+    return subprocess.Popen([sys.executable, os.path.join(here, name)], cwd=here,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
+def run_traffic(collector, tracker_count, rate, seconds):
+    collector.reset()
+    generator = PSNGenerator(tracker_count, rate)
+    generator.run(multicast_sender(GROUP, PORT), seconds)
+    time.sleep(0.5)  # let the last frames through
+    return generator
+
+
+def bench_latency(collector, tracker_count, rate, seconds):
+    generator = run_traffic(collector, tracker_count, rate, seconds)
+    latencies = np.array(collector.latencies, dtype=np.float64)
+    if not len(latencies):
+        print(f"latency {tracker_count:5} trackers at {rate:g} Hz: no frames received")
+        return
+    p50, p99 = np.percentile(latencies, [50, 99])
+    print(f"latency {tracker_count:5} trackers at {rate:g} Hz: {len(latencies)}/{generator.frames} frames  "
+          f"p50 {p50:8.0f} us  p99 {p99:8.0f} us  max {latencies.max():8.0f} us")
+
+
+# Doubles the tracker count up to what a receiver frame can hold (MAX_TRACKERS)
+def bench_capacity(collector, rate, seconds, start=32, limit=MAX_TRACKERS):
+    best = 0
+    tracker_count = start
+    while tracker_count <= limit:
+        generator = run_traffic(collector, tracker_count, rate, seconds)
+        delivered = collector.complete / generator.frames
+        print(f"capacity {tracker_count:5} trackers at {rate:g} Hz: {collector.complete}/{generator.frames} "
+              f"complete frames ({collector.partial} partial)")
+        if delivered < CAPACITY_THRESHOLD:
+            break
+        best = tracker_count
+        tracker_count *= 2
+    print(f"capacity: {best} trackers sustained at {rate:g} Hz")
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description='PSN decoder and receiver benchmarks')
+    parser.add_argument('benchmarks', nargs='*', default=BENCHMARKS, help=f"any of {', '.join(BENCHMARKS)} (default: all)")
+    parser.add_argument('--trackers', type=int, nargs='+', default=[10, 100, 1000])
+    parser.add_argument('--rate', type=float, default=60.0, help='frames per second')
+    parser.add_argument('--seconds', type=float, default=3.0)
+    args = parser.parse_args()
+    for name in args.benchmarks:
+        if name not in BENCHMARKS:
+            parser.error(f"unknown benchmark: {name}")
+
+    if 'decode' in args.benchmarks:
+        bench_decode(args.trackers, args.seconds)
+    if 'latency' not in args.benchmarks and 'capacity' not in args.benchmarks:
+        return
+
+    processes = [start_script('data_parser.py'), start_script('receiver.py')]
+    collector = FrameCollector()
+    try:
+        # Ready once a frame made it all the way through; the receiver only connects to
+        # the data parser when it has a frame to forward
+        deadline = time.monotonic() + CONNECT_TIMEOUT
+        while not collector.connected.is_set() and time.monotonic() < deadline:
+            multicast_sender(GROUP, PORT)(PSNGenerator(1).frame(0.0)[-1])
+            collector.connected.wait(0.2)
+        if not collector.connected.is_set():
+            print("No frames came through receiver.py and data_parser.py")
+            return
+        if 'latency' in args.benchmarks:
+            for tracker_count in args.trackers:
+                bench_latency(collector, tracker_count, args.rate, args.seconds)
+        if 'capacity' in args.benchmarks:
+            bench_capacity(collector, args.rate, args.seconds)
+    finally:
+        for process in processes:
+            process.terminate()
+            process.wait()
+
+if __name__ == "__main__":
+    main()
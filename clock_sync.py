@@ -0,0 +1,362 @@
+import time
+from array import array
+import numpy as np
+
+# Maps the packet timestamps of each PSN server onto the local time.monotonic_ns() clock
+# and measures how late tracker data is.
+#
+# A PSN server stamps every packet with its own clock in microseconds. The difference
+# between a packet's local arrival time and its server timestamp is the clock offset
+# plus the network delay; the smallest differences come from packets that met no
+# queueing, so ClockEstimator follows the lower envelope of those differences. The
+# window is split into blocks, the minimum of each block is taken and a line fitted
+# through them gives the offset and the drift of the server's clock against ours.
+#
+# The minimum path delay itself cannot be told apart from the offset, so delays measured
+# against the fitted clock are delays above the fastest packet of the window: they show
+# queueing, jitter and processing, not cable and switch time.
+
+# Samples kept for the fit, and the number of blocks the window is split into
+CLOCK_WINDOW = 1024
+CLOCK_BLOCKS = 16
+# Samples between two fits
+REFIT_INTERVAL = 128
+# A server timestamp this far behind the newest one means the server's clock was reset
+CLOCK_RESET_NS = 1000000000
+# Values kept by RollingStats
+STATS_WINDOW = 1024
+# Gain of the RFC 3550 interarrival jitter filter
+JITTER_GAIN = 1 / 16
+QUANTILES = (0.5, 0.9, 0.99)
+# Observations buffered before they are processed, and the longest time they stay
+# buffered when traffic is light (seconds)
+OBSERVATION_BATCH = 512
+FLUSH_INTERVAL = 0.5
+
+
+class ClockEstimator:
+    def __init__(self, window=CLOCK_WINDOW, blocks=CLOCK_BLOCKS, refit_interval=REFIT_INTERVAL):
+        self.window = window
+        self.blocks = blocks
+        self.refit_interval = refit_interval
+        # Rings are plain arrays, cheap to write one value at a time, and read through
+        # zero-copy NumPy views when fitting
+        self.server = array('q', bytes(8 * window))
+        self.delta = array('q', bytes(8 * window))
+        self._server = np.frombuffer(self.server, dtype=np.int64)
+        self._delta = np.frombuffer(self.delta, dtype=np.int64)
+        self.resets = 0
+        self.reset()
+
+    def reset(self):
+        self.head = 0
+        self.count = 0
+        self.newest = None
+        # local = server + offset + drift * (server - reference), all in nanoseconds
+        self.offset = None
+        self.drift = 0.0
+        self.reference = 0
+        self._since_fit = 0
+
+    # Adds one (server timestamp in microseconds, local arrival in monotonic ns) sample
+    def observe(self, server_us, arrival_ns):
+        server_ns = server_us * 1000
+        newest = self.newest
+        if newest is not None and server_ns < newest - CLOCK_RESET_NS:
+            self.resets += 1
+            self.reset()
+            newest = None
+        if newest is None or server_ns > newest:
+            self.newest = server_ns
+        delta = arrival_ns - server_ns
+        head = self.head
+        self.server[head] = server_ns
+        self.delta[head] = delta
+        self.head = (head + 1) % self.window
+        if self.count < self.window:
+            self.count += 1
+        self._since_fit += 1
+        if self.count < self.blocks * 2:
+            # Not enough samples for a fit yet: the smallest difference so far
+            if self.offset is None or delta < self.offset:
+                self.offset = delta
+                self.reference = server_ns
+        elif self._since_fit >= self.refit_interval or self.count == self.blocks * 2:
+            self.fit()
+
+    # observe() for arrays of samples, fitting at most once at the end. A batch with a
+    # clock reset in it goes through observe() one sample at a time.
+    def observe_many(self, server_us, arrival_ns):
+        server_ns = server_us * 1000
+        start = server_ns[0] if self.newest is None else self.newest
+        # Newest server timestamp seen before each sample
+        previous = np.maximum.accumulate(np.concatenate(([start], server_ns[:-1])))
+        if (server_ns < previous - CLOCK_RESET_NS).any():
+            for server, arrival in zip(server_us.tolist(), arrival_ns.tolist()):
+                self.observe(server, arrival)
+            return
+        self.newest = int(max(previous[-1], server_ns[-1]))
+        delta = arrival_ns - server_ns
+
+        count = len(delta)
+        warmup = self.blocks * 2
+        previous_count = self.count
+        if previous_count < warmup - 1:
+            # Not enough samples for a fit yet: the smallest difference so far
+            early = delta[:warmup - 1 - previous_count]
+            lowest = int(early.argmin())
+            if self.offset is None or early[lowest] < self.offset:
+                self.offset = int(early[lowest])
+                self.reference = int(server_ns[lowest])
+        kept = min(count, self.window)
+        positions = (self.head + count - kept + np.arange(kept)) % self.window
+        self._server[positions] = server_ns[count - kept:]
+        self._delta[positions] = delta[count - kept:]
+        self.head = (self.head + count) % self.window
+        self.count = min(previous_count + count, self.window)
+        self._since_fit += count
+        if self.count >= warmup and (self._since_fit >= self.refit_interval or previous_count < warmup):
+            self.fit()
+
+    def fit(self):
+        self._since_fit = 0
+        count = self.count - self.count % self.blocks
+        order = (self.head - count + np.arange(count)) % self.window
+        server = self._server[order].reshape(self.blocks, -1)
+        delta = self._delta[order].reshape(self.blocks, -1)
+        lowest = delta.argmin(axis=1)
+        rows = np.arange(self.blocks)
+        server = server[rows, lowest]
+        delta = delta[rows, lowest].astype(np.float64)
+        reference = int(server[-1])
+        x = (server - reference).astype(np.float64)
+        x_mean = x.mean()
+        spread = ((x - x_mean) ** 2).sum()
+        if spread > 0:
+            drift = float(((x - x_mean) * (delta - delta.mean())).sum() / spread)
+            offset = float(delta.mean() - drift * x_mean)
+        else:
+            drift, offset = 0.0, float(delta.min())
+        # Lower the line until no block minimum lies below it
+        offset -= max(0.0, float(np.max(offset + drift * x - delta)))
+        self.offset = offset
+        self.drift = drift
+        self.reference = reference
+
+    # Local monotonic ns for a server timestamp in microseconds (scalar or array)
+    def to_local(self, server_us):
+        server_ns = np.asarray(server_us, dtype=np.int64) * 1000
+        return server_ns + (self.offset + self.drift * (server_ns - self.reference)).astype(np.int64)
+
+    # Delay of a packet above the fastest one, in ns
+    def delay(self, server_us, arrival_ns):
+        server_ns = server_us * 1000
+        return arrival_ns - server_ns - (self.offset + self.drift * (server_ns - self.reference))
+
+    @property
+    def ready(self):
+        return self.offset is not None
+
+
+# The last window values of one measurement, summarized on demand
+class RollingStats:
+    def __init__(self, window=STATS_WINDOW):
+        self.window = window
+        self.ring = array('d', bytes(8 * window))
+        self.values = np.frombuffer(self.ring, dtype=np.float64)
+        self.head = 0
+        self.count = 0
+
+    def add(self, value):
+        self.ring[self.head] = value
+        self.head = (self.head + 1) % self.window
+        if self.count < self.window:
+            self.count += 1
+
+    def add_many(self, values):
+        count = len(values)
+        kept = min(count, self.window)
+        positions = (self.head + count - kept + np.arange(kept)) % self.window
+        self.values[positions] = values[count - kept:]
+        self.head = (self.head + count) % self.window
+        self.count = min(self.count + count, self.window)
+
+    def quantiles(self, quantiles=QUANTILES):
+        if not self.count:
+            return [np.nan] * len(quantiles)
+        return np.quantile(self.values[:self.count], quantiles).tolist()
+
+    def summary(self):
+        values = self.values[:self.count]
+        if not self.count:
+            return {'count': 0}
+        p50, p90, p99 = np.quantile(values, (0.5, 0.9, 0.99)).tolist()
+        return {'count': self.count, 'mean': float(values.mean()), 'std': float(values.std()), 'p50': p50,
+                'p90': p90, 'p99': p99, 'max': float(values.max())}
+
+
+class SourceLatency:
+    def __init__(self):
+        self.clock = ClockEstimator()
+        self.network = RollingStats()
+        self.processing = RollingStats()
+        self.age = RollingStats()
+        self.jitter = 0.0
+        self.last_timestamp = None
+        self.last_transit = None
+        self.last_arrival = 0
+
+
+# Splits buffered (source, value, ...) records into {source: (positions, values, ...)}:
+# the positions of the source's records in the buffer, then each value column, all as
+# int64 arrays. A buffer from a single source, the usual case, is not searched.
+def group_by_source(records):
+    if not records:
+        return {}
+    sources, *columns = zip(*records)
+    columns = [np.fromiter(column, np.int64, len(records)) for column in columns]
+    first = sources[0]
+    if sources.count(first) == len(sources):
+        return {first: (np.arange(len(records)), *columns)}
+    keys = np.array(sources, dtype=object)
+    groups = {}
+    for source in dict.fromkeys(sources):
+        positions = np.flatnonzero(keys == source)
+        groups[source] = (positions, *[column[positions] for column in columns])
+    return groups
+
+
+# Per-source clock alignment and latency statistics, all in nanoseconds:
+#
+#   network     frame arrival (kernel timestamp of its first packet) minus its aligned
+#               server timestamp
+#   processing  frame output minus the arrival of the source's latest packet
+#   age         frame output minus its aligned server timestamp: how stale the
+#               positions are when they leave the receiver
+#   jitter      RFC 3550 interarrival jitter of the frames
+#
+# packet() is called for every data packet and frame() for every frame passed on. Both
+# only buffer their arguments; tick(), called by the receive loop on every wakeup, hands
+# them to flush() once OBSERVATION_BATCH packets are waiting or FLUSH_INTERVAL has
+# passed, and flush() works through each source's share of the batch with NumPy. That
+# was about 2.5 us per packet done one call at a time; batched it is 3 to 5 times less
+# once a flush covers a hundred packets or more. Below about 30 packets per flush, which
+# only happens under light traffic, it costs about the same or more. Statistics lag by
+# up to FLUSH_INTERVAL.
+class LatencyMonitor:
+    def __init__(self):
+        self.sources = {}
+        self._packets = []
+        self._frames = []
+        self._next_flush = time.monotonic() + FLUSH_INTERVAL
+
+    def _source(self, source):
+        state = self.sources.get(source)
+        if state is None:
+            state = self.sources[source] = SourceLatency()
+        return state
+
+    def packet(self, source, server_us, arrival_ns):
+        self._packets.append((source, server_us, arrival_ns))
+
+    # The number of packets buffered so far tells flush() which packet came last
+    def frame(self, source, server_us, output_ns):
+        self._frames.append((source, server_us, output_ns, len(self._packets)))
+
+    def tick(self, now=None):
+        if now is None:
+            now = time.monotonic()
+        if now >= self._next_flush or len(self._packets) >= OBSERVATION_BATCH:
+            self.flush(now)
+
+    def flush(self, now=None):
+        if now is None:
+            now = time.monotonic()
+        self._next_flush = now + FLUSH_INTERVAL
+        packets, self._packets = self._packets, []
+        frames, self._frames = self._frames, []
+        # Source -> (buffer positions, arrivals) of its packets, for the processing delays
+        arrivals = {}
+        for source, (positions, server_us, arrival_ns) in group_by_source(packets).items():
+            state = self._source(source)
+            arrivals[source] = (positions, arrival_ns, state.last_arrival)
+            self._packets_of(state, server_us, arrival_ns)
+        for source, (_, server_us, output_ns, position) in group_by_source(frames).items():
+            state = self.sources.get(source)
+            if state is None or not state.clock.ready:
+                continue
+            state.age.add_many(output_ns - state.clock.to_local(server_us))
+            if source in arrivals:
+                packet_positions, arrival_ns, last_arrival = arrivals[source]
+                latest = np.searchsorted(packet_positions, position) - 1
+                arrival_ns = np.where(latest >= 0, arrival_ns[latest], last_arrival)
+            else:
+                arrival_ns = state.last_arrival
+            state.processing.add_many((output_ns - arrival_ns).astype(np.float64))
+
+    # Only the first packet of every frame is measured: the rest of the frame shares its
+    # timestamp but leaves the server later
+    def _packets_of(self, state, server_us, arrival_ns):
+        state.last_arrival = int(arrival_ns[-1])
+        previous = np.empty_like(server_us)
+        previous[0] = -1 if state.last_timestamp is None else state.last_timestamp
+        previous[1:] = server_us[:-1]
+        first = server_us != previous
+        state.last_timestamp = int(server_us[-1])
+        if not first.any():
+            return
+        server_us = server_us[first]
+        arrival_ns = arrival_ns[first]
+        clock = state.clock
+        clock.observe_many(server_us, arrival_ns)
+        state.network.add_many(clock.delay(server_us, arrival_ns))
+        # Differences of transit times cancel the clock offset. The RFC 3550 filter
+        # j += (|d| - j) * gain is applied to the whole run at once.
+        transit = arrival_ns - server_us * 1000
+        if state.last_transit is not None:
+            transit_changes = np.abs(np.diff(transit, prepend=state.last_transit))
+        else:
+            transit_changes = np.abs(np.diff(transit))
+        if len(transit_changes):
+            decay = 1 - JITTER_GAIN
+            weights = JITTER_GAIN * decay ** np.arange(len(transit_changes) - 1, -1, -1)
+            state.jitter = float(state.jitter * decay ** len(transit_changes) + (weights * transit_changes).sum())
+        state.last_transit = int(transit[-1])
+
+    # Local monotonic ns of a source's server timestamp, or None before its first packet
+    def to_local(self, source, server_us):
+        state = self.sources.get(source)
+        if state is None or not state.clock.ready:
+            return None
+        return int(state.clock.to_local(server_us))
+
+    def summary(self, source):
+        state = self.sources[source]
+        clock = state.clock
+        return {'offset_ns': clock.offset, 'drift_ppm': clock.drift * 1e6, 'clock_resets': clock.resets,
+                'jitter_ns': state.jitter, 'network_ns': state.network.summary(),
+                'processing_ns': state.processing.summary(), 'age_ns': state.age.summary()}
+
+    # Prometheus text for ReceiverMetrics.add_renderer
+    def render(self, lines):
+        sources = sorted(self.sources.items())
+        lines.append("# HELP psn_clock_drift_ppm Drift of each PSN server's clock against the local clock")
+        lines.append("# TYPE psn_clock_drift_ppm gauge")
+        for source, state in sources:
+            lines.append(f'psn_clock_drift_ppm{{source="{source}"}} {state.clock.drift * 1e6:.3f}')
+        lines.append("# HELP psn_jitter_seconds RFC 3550 interarrival jitter of each PSN server's frames")
+        lines.append("# TYPE psn_jitter_seconds gauge")
+        for source, state in sources:
+            lines.append(f'psn_jitter_seconds{{source="{source}"}} {state.jitter / 1e9:.9f}')
+        for name, description, attribute in (
+                ('psn_network_delay_seconds', 'Packet arrival after its aligned server timestamp', 'network'),
+                ('psn_processing_delay_seconds', 'Frame output after the arrival of its latest packet', 'processing'),
+                ('psn_frame_age_seconds', 'Frame output after its aligned server timestamp', 'age')):
+            lines.append(f"# HELP {name} {description}, over the last {STATS_WINDOW} values")
+            lines.append(f"# TYPE {name} summary")
+            for source, state in sources:
+                stats = getattr(state, attribute)
+                for quantile, value in zip(QUANTILES, stats.quantiles()):
+                    lines.append(f'{name}{{source="{source}",quantile="{quantile:g}"}} {value / 1e9:.9f}')
+                lines.append(f'{name}_sum{{source="{source}"}} {stats.values[:stats.count].sum() / 1e9:.9f}')
+                lines.append(f'{name}_count{{source="{source}"}} {stats.count}')
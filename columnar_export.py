@@ -0,0 +1,296 @@
+import argparse
+import math
+import mmap
+import os
+import socket
+import struct
+import time
+import numpy as np
+from tracker_frame import TRACKER_DTYPE, MAX_TRACKERS
+from psn_decoder import parse_chunks, data_frame
+from frame_assembler import FrameAssembler
+from recording import SessionFile
+
+# Columnar exports of tracker data for offline analysis.
+#
+# An export is a sequence of row groups, each holding the rows of frames_per_group frames
+# one column after the other, so a column of a group is a single contiguous array that
+# NumPy reads straight from the file. A file starts with FILE_HEADER; every group starts
+# with GROUP_HEADER (row and frame counts, first and last frame time, lowest and highest
+# tracker ID) followed by one block per column of COLUMNS, each padded to 8 bytes. There
+# is no footer: groups are found by walking their headers, so a file cut short by a crash
+# is readable up to its last whole group.
+#
+# Every row is one tracker of one frame: 'time' is the wall clock time the frame was
+# received (ns since the epoch), 'packet_timestamp', 'source' (IPv4 address as a
+# big-endian integer, see source_address) and 'frame_id' come from the frame, and the
+# rest are the TRACKER_DTYPE fields, vectors as (rows, 3) columns.
+#
+#     python columnar_export.py psn_session.rec psn_session.psncol   # convert a recording
+#     python columnar_export.py psn_session.psncol                     # summarize an export
+
+MAGIC = b'PSNCOL01'
+FORMAT_VERSION = 1
+# Magic, format version
+FILE_HEADER = struct.Struct('<8sI4x')
+# Rows, frames, time of the first and last frame (ns since the epoch), lowest and
+# highest tracker ID
+GROUP_HEADER = struct.Struct('<IIqqHH4x')
+GROUP_DTYPE = np.dtype([('offset', '<i8'), ('rows', '<i8'), ('frames', '<i8'), ('first', '<i8'), ('last', '<i8'),
+                        ('id_min', '<u2'), ('id_max', '<u2')])
+
+FRAME_COLUMNS = [('time', np.dtype('<i8')), ('packet_timestamp', np.dtype('<u8')), ('source', np.dtype('>u4')),
+                 ('frame_id', np.dtype('u1'))]
+COLUMNS = FRAME_COLUMNS + [(name, TRACKER_DTYPE.fields[name][0]) for name in TRACKER_DTYPE.names]
+COLUMN_NAMES = [name for name, _ in COLUMNS]
+ALIGNMENT = 8
+
+# Frames per row group: one second of a 60 Hz server, a few MB for hundreds of trackers
+FRAMES_PER_GROUP = 60
+WRITE_BUFFER_SIZE = 1024 * 1024
+
+
+def _padded(size):
+    return -(-size // ALIGNMENT) * ALIGNMENT
+
+
+def source_address(value):
+    return socket.inet_ntoa(struct.pack('>I', int(value)))
+
+
+def source_value(address):
+    return struct.unpack('>I', socket.inet_aton(address))[0]
+
+
+# Writes frames to a columnar export. Rows are copied into one buffer until a group is
+# complete, so memory holds at most frames_per_group frames whatever the session length.
+class ColumnarWriter:
+    def __init__(self, path, frames_per_group=FRAMES_PER_GROUP, buffer_size=WRITE_BUFFER_SIZE):
+        self.path = path
+        self.frames_per_group = frames_per_group
+        self.frames = 0
+        self.rows = 0
+        self.groups = 0
+        self._file = open(path, 'wb', buffering=buffer_size)
+        self._file.write(FILE_HEADER.pack(MAGIC, FORMAT_VERSION))
+        self._buffer = np.zeros(frames_per_group * 64, dtype=TRACKER_DTYPE)
+        self._count = 0
+        self._pending = []
+        self._sources = {}
+
+    # Adds the rows (TRACKER_DTYPE) of one frame, received at time_ns (default: now)
+    def add(self, source, packet_timestamp, frame_id, rows, time_ns=None):
+        if time_ns is None:
+            time_ns = time.time_ns()
+        value = self._sources.get(source)
+        if value is None:
+            value = self._sources[source] = source_value(source)
+        count = self._count
+        end = count + len(rows)
+        if end > len(self._buffer):
+            grown = np.zeros(max(end, 2 * len(self._buffer)), dtype=TRACKER_DTYPE)
+            grown[:count] = self._buffer[:count]
+            self._buffer = grown
+        self._buffer[count:end] = rows
+        self._count = end
+        self._pending.append((time_ns, packet_timestamp, value, frame_id, len(rows)))
+        if len(self._pending) >= self.frames_per_group:
+            self.flush_group()
+
+    def add_frame(self, frame, time_ns=None):
+        self.add(frame.source, frame.packet_timestamp, frame.frame_id, frame.active(), time_ns)
+
+    # Writes the frames added so far as one group
+    def flush_group(self):
+        if not self._pending:
+            return
+        rows = self._buffer[:self._count]
+        frames = np.array(self._pending, dtype=[(name, dtype) for name, dtype in FRAME_COLUMNS] + [('count', '<i8')])
+        ids = rows['id']
+        write = self._file.write
+        write(GROUP_HEADER.pack(len(rows), len(frames), int(frames['time'].min()), int(frames['time'].max()),
+                                int(ids.min()) if len(rows) else 0, int(ids.max()) if len(rows) else 0))
+        for name, dtype in COLUMNS:
+            if name in frames.dtype.names:
+                column = np.repeat(frames[name], frames['count'])
+            else:
+                column = np.ascontiguousarray(rows[name])
+            write(column.data)
+            size = len(rows) * dtype.itemsize
+            write(bytes(_padded(size) - size))
+        self.frames += len(frames)
+        self.rows += len(rows)
+        self.groups += 1
+        self._pending.clear()
+        self._count = 0
+
+    def close(self):
+        if not self._file.closed:
+            self.flush_group()
+            self._file.close()
+
+
+# Read-only view of a columnar export through mmap. Columns of a group are NumPy arrays
+# over the mapping; only the groups a query touches are read from disk.
+class ColumnarFile:
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, 'rb')
+        # mmap cannot map an empty file, and a file shorter than its header was cut off
+        # before the writer wrote anything
+        if os.fstat(self._file.fileno()).st_size < FILE_HEADER.size:
+            self._file.close()
+            raise ValueError(f"{path} is an empty or truncated PSN columnar export")
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        self._view = memoryview(self._map)
+        magic, version = FILE_HEADER.unpack_from(self._view)
+        if magic != MAGIC or version != FORMAT_VERSION:
+            self.close()
+            raise ValueError(f"{path} is not a PSN columnar export")
+        self.groups = np.array(list(self._scan()), dtype=GROUP_DTYPE)
+        self.rows = int(self.groups['rows'].sum())
+        self.frames = int(self.groups['frames'].sum())
+        self.start_time_ns = int(self.groups['first'][0]) if len(self.groups) else 0
+        self.duration = (int(self.groups['last'].max()) - self.start_time_ns) / 1e9 if len(self.groups) else 0.0
+
+    def _scan(self):
+        view = self._view
+        offset = FILE_HEADER.size
+        while offset + GROUP_HEADER.size <= len(view):
+            rows, frames, first, last, id_min, id_max = GROUP_HEADER.unpack_from(view, offset)
+            end = offset + GROUP_HEADER.size + sum(_padded(rows * dtype.itemsize) for _, dtype in COLUMNS)
+            if end > len(view):
+                break  # truncated by a crash while exporting
+            yield offset, rows, frames, first, last, id_min, id_max
+            offset = end
+
+    # The columns of one group (a GROUP_DTYPE entry), as arrays over the mapping
+    def group_columns(self, group, columns=None):
+        rows = int(group['rows'])
+        offset = int(group['offset']) + GROUP_HEADER.size
+        result = {}
+        for name, dtype in COLUMNS:
+            size = rows * dtype.itemsize
+            if columns is None or name in columns:
+                result[name] = np.frombuffer(self._view, dtype=dtype, count=rows, offset=offset)
+            offset += _padded(size)
+        return result
+
+    # Yields the requested columns group by group, keeping the rows between start and end
+    # (seconds since the first frame) of the given trackers and sources. Groups that
+    # cannot hold a matching row are skipped without being read.
+    def iter_groups(self, columns=None, start=None, end=None, trackers=None, sources=None):
+        columns = COLUMN_NAMES if columns is None else list(columns)
+        unknown = set(columns) - set(COLUMN_NAMES)
+        if unknown:
+            raise ValueError(f"Unknown columns: {sorted(unknown)}")
+        groups = self.groups
+        selected = np.ones(len(groups), dtype=bool)
+        start_ns = None if start is None else self.start_time_ns + int(start * 1e9)
+        end_ns = None if end is None else self.start_time_ns + int(end * 1e9)
+        if start_ns is not None:
+            selected &= groups['last'] >= start_ns
+        if end_ns is not None:
+            selected &= groups['first'] < end_ns
+        if trackers is not None:
+            trackers = np.unique(np.asarray(trackers, dtype=np.int64))
+            # Groups whose ID range holds none of the trackers
+            first_inside = np.searchsorted(trackers, groups['id_min'])
+            selected &= (first_inside < len(trackers)) & \
+                (trackers[np.minimum(first_inside, len(trackers) - 1)] <= groups['id_max'])
+        if sources is not None:
+            sources = np.array([source_value(source) for source in sources], dtype=np.int64)
+        needed = set(columns) | {name for name, condition in (('time', start_ns is not None or end_ns is not None),
+                                                              ('id', trackers is not None),
+                                                              ('source', sources is not None)) if condition}
+        for group in groups[selected]:
+            data = self.group_columns(group, needed)
+            keep = None
+            if start_ns is not None:
+                keep = data['time'] >= start_ns
+            if end_ns is not None:
+                keep = _both(keep, data['time'] < end_ns)
+            if trackers is not None:
+                keep = _both(keep, np.isin(data['id'], trackers))
+            if sources is not None:
+                keep = _both(keep, np.isin(data['source'], sources))
+            if keep is None:
+                yield {name: data[name] for name in columns}
+            elif keep.any():
+                yield {name: data[name][keep] for name in columns}
+
+    # The rows matching the query as one array per column
+    def read(self, columns=None, start=None, end=None, trackers=None, sources=None):
+        columns = COLUMN_NAMES if columns is None else list(columns)
+        parts = {name: [] for name in columns}
+        for data in self.iter_groups(columns, start, end, trackers, sources):
+            for name in columns:
+                parts[name].append(data[name])
+        dtypes = dict(COLUMNS)
+        return {name: np.concatenate(arrays) if arrays else np.zeros(0, dtype=dtypes[name])
+                for name, arrays in parts.items()}
+
+    # Every tracker ID in the export, read one group at a time
+    def tracker_ids(self):
+        seen = np.zeros(1 << 16, dtype=bool)
+        for data in self.iter_groups(['id']):
+            seen[data['id']] = True
+        return np.flatnonzero(seen)
+
+    def close(self):
+        self._view.release()
+        self._map.close()
+        self._file.close()
+
+
+def _both(mask, condition):
+    return condition if mask is None else mask & condition
+
+
+# Streams a session recording through the decoder and frame assembler into an export.
+# Frames are stamped with the recording's receive times. Returns the frames written.
+def convert_recording(session, writer, start=0.0, capacity=MAX_TRACKERS):
+    assembler = FrameAssembler(capacity)
+    frames = 0
+    for elapsed, source, data in session.packets(start):
+        for chunk_type, _ in parse_chunks(data):
+            if chunk_type == 'PSN_DATA_PACKET':
+                time_ns = session.start_time_ns + int(elapsed * 1e9)
+                for frame in assembler.add(data_frame, source, elapsed):
+                    writer.add_frame(frame, time_ns)
+                    frames += 1
+    for frame in assembler.expire(math.inf):
+        writer.add_frame(frame, session.start_time_ns + int(session.duration * 1e9))
+        frames += 1
+    return frames
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Convert a PSN session recording to a columnar export, '
+                                                 'or summarize an export')
+    parser.add_argument('path', help='recording to convert, or export to summarize')
+    parser.add_argument('output', nargs='?', help='export to write')
+    parser.add_argument('--start', type=float, default=0.0, help='seconds into the recording')
+    parser.add_argument('--frames-per-group', type=int, default=FRAMES_PER_GROUP)
+    args = parser.parse_args()
+
+    if args.output is None:
+        export = ColumnarFile(args.path)
+        print(f"{args.path}: {export.duration:.1f}s, {export.frames} frames, {export.rows} rows "
+              f"in {len(export.groups)} groups")
+        print(f"Trackers: {len(export.tracker_ids())}")
+        export.close()
+        return
+
+    session = SessionFile(args.path)
+    writer = ColumnarWriter(args.output, args.frames_per_group)
+    started = time.perf_counter()
+    frames = convert_recording(session, writer, args.start)
+    writer.close()
+    session.close()
+    elapsed = time.perf_counter() - started
+    print(f"Wrote {frames} frames, {writer.rows} rows in {writer.groups} groups to {args.output} "
+          f"in {elapsed:.2f}s")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,214 @@
+import json
+import os
+from collections import OrderedDict
+import numpy as np
+from tracker_frame import FIELD_POS, FIELD_SPEED, FIELD_ORI, FIELD_ACCEL, FIELD_TRGTPOS
+
+# Named coordinate spaces, each a 4x4 transform from PSN coordinates (metres), defined in
+# the "spaces" section of config.json:
+#
+#   "spaces": {
+#       "stage": {"translate": [0, -4.5, 0], "rotate": [0, 0, 90]},
+#       "truss": {"parent": "stage", "translate": [0, 0, -6.2]},
+#       "camera": {"matrix": [[1, 0, 0, 0], [0, 0, 1, 0], [0, -1, 0, 0], [0, 0, 0, 1]]},
+#       "console": {"parent": "stage", "axes": "x,z,-y", "units": "mm"}
+#   }
+#
+# A space applies, in order: its parent's transform, then "matrix", or "scale", "rotate"
+# (degrees about x, then y, then z) and "translate", then the "axes" convention (which
+# input axis, and sign, becomes each output axis) and finally the "units".
+#
+# transform_rows() moves whole TRACKER_DTYPE arrays at once: pos and trgtpos through the
+# full transform, speed and accel through its linear part, and ori by composing the
+# rotation with each tracker's. CoordinateSpaces keeps the results per (frame, space), so
+# any number of consumers asking for the same space cost one transform.
+
+CONFIG_FILE = 'config.json'
+# Transformed frames kept by CoordinateSpaces
+CACHE_SIZE = 64
+
+UNITS = {'m': 1.0, 'cm': 100.0, 'mm': 1000.0, 'ft': 1 / 0.3048, 'in': 1 / 0.0254}
+AXIS_NAMES = {'x': 0, 'y': 1, 'z': 2}
+
+
+# Rotation vectors <-> unit quaternions (w, x, y, z)
+def rotation_vectors_to_quaternions(vectors):
+    angle = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    scale = np.where(angle > 1e-12, np.sin(angle / 2) / np.maximum(angle, 1e-12), 0.5)
+    return np.concatenate([np.cos(angle / 2), vectors * scale], axis=-1)
+
+
+def quaternions_to_rotation_vectors(quaternions):
+    quaternions = np.where(quaternions[..., :1] < 0, -quaternions, quaternions)
+    sine = np.linalg.norm(quaternions[..., 1:], axis=-1, keepdims=True)
+    angle = 2 * np.arctan2(sine, quaternions[..., :1])
+    scale = np.where(sine > 1e-12, angle / np.maximum(sine, 1e-12), 2.0)
+    return quaternions[..., 1:] * scale
+
+
+def multiply_quaternions(a, b):
+    aw, ax, ay, az = np.moveaxis(a, -1, 0)
+    bw, bx, by, bz = np.moveaxis(b, -1, 0)
+    return np.stack([aw * bw - ax * bx - ay * by - az * bz,
+                     aw * bx + ax * bw + ay * bz - az * by,
+                     aw * by - ax * bz + ay * bw + az * bx,
+                     aw * bz + ax * by - ay * bx + az * bw], axis=-1)
+
+
+def matrix_to_quaternion(rotation):
+    trace = np.trace(rotation)
+    if trace > 0:
+        s = 2 * np.sqrt(trace + 1)
+        return np.array([s / 4, (rotation[2, 1] - rotation[1, 2]) / s, (rotation[0, 2] - rotation[2, 0]) / s,
+                         (rotation[1, 0] - rotation[0, 1]) / s])
+    i = int(np.argmax(np.diag(rotation)))
+    j, k = (i + 1) % 3, (i + 2) % 3
+    s = 2 * np.sqrt(1 + rotation[i, i] - rotation[j, j] - rotation[k, k])
+    quaternion = np.empty(4)
+    quaternion[0] = (rotation[k, j] - rotation[j, k]) / s
+    quaternion[1 + i] = s / 4
+    quaternion[1 + j] = (rotation[j, i] + rotation[i, j]) / s
+    quaternion[1 + k] = (rotation[k, i] + rotation[i, k]) / s
+    return quaternion
+
+
+# 4x4 matrix m with m @ q == multiply_quaternions(quaternion, q), which turns composing
+# one rotation with many into a single matrix product
+def left_multiplication_matrix(quaternion):
+    w, x, y, z = quaternion
+    return np.array([[w, -x, -y, -z], [x, w, -z, y], [y, z, w, -x], [z, -y, x, w]])
+
+
+def rotation_matrix(degrees):
+    x, y, z = np.radians(degrees)
+    rx = np.array([[1, 0, 0], [0, np.cos(x), -np.sin(x)], [0, np.sin(x), np.cos(x)]])
+    ry = np.array([[np.cos(y), 0, np.sin(y)], [0, 1, 0], [-np.sin(y), 0, np.cos(y)]])
+    rz = np.array([[np.cos(z), -np.sin(z), 0], [np.sin(z), np.cos(z), 0], [0, 0, 1]])
+    return rz @ ry @ rx
+
+
+# "x,z,-y": output x is input x, output y is input z, output z is minus input y
+def axes_matrix(axes):
+    names = [name.strip().lower() for name in axes.split(',')]
+    matrix = np.zeros((3, 3))
+    for row, name in enumerate(names):
+        sign = -1.0 if name.startswith('-') else 1.0
+        name = name.lstrip('+-')
+        if len(names) != 3 or name not in AXIS_NAMES:
+            raise ValueError(f"Invalid axes {axes!r}, expected something like 'x,z,-y'")
+        matrix[row, AXIS_NAMES[name]] = sign
+    if abs(np.linalg.det(matrix)) != 1:
+        raise ValueError(f"Axes {axes!r} repeat an axis")
+    return matrix
+
+
+def _affine(linear=None, translation=None):
+    matrix = np.eye(4)
+    if linear is not None:
+        matrix[:3, :3] = linear
+    if translation is not None:
+        matrix[:3, 3] = translation
+    return matrix
+
+
+# 4x4 matrix of one space definition, without its parent
+def definition_matrix(definition):
+    if 'matrix' in definition:
+        matrix = np.asarray(definition['matrix'], dtype=np.float64).reshape(4, 4)
+    else:
+        linear = rotation_matrix(definition.get('rotate', (0, 0, 0))) * definition.get('scale', 1.0)
+        matrix = _affine(linear, definition.get('translate', (0, 0, 0)))
+    if 'axes' in definition:
+        matrix = _affine(axes_matrix(definition['axes'])) @ matrix
+    if 'units' in definition:
+        if definition['units'] not in UNITS:
+            raise ValueError(f"Unknown units {definition['units']!r}, expected one of {sorted(UNITS)}")
+        matrix = _affine(np.eye(3) * UNITS[definition['units']]) @ matrix
+    return matrix
+
+
+# Applies a 4x4 transform to TRACKER_DTYPE rows in place. The linear part should be a
+# rotation (possibly mirrored by an axis convention) times a uniform scale. Orientations
+# are composed with the rotation; under a mirrored convention, where no rotation maps
+# one handedness onto the other, the rotation vectors are mirrored as axial vectors.
+def transform_rows(rows, matrix):
+    fields = rows['fields']
+    linear = matrix[:3, :3]
+    offset = matrix[:3, 3]
+    for name, bit, moves in (('pos', FIELD_POS, True), ('trgtpos', FIELD_TRGTPOS, True),
+                             ('speed', FIELD_SPEED, False), ('accel', FIELD_ACCEL, False)):
+        if (fields & bit).any():
+            rows[name] = rows[name] @ linear.T + offset if moves else rows[name] @ linear.T
+    if (fields & FIELD_ORI).any():
+        determinant = np.linalg.det(linear)
+        rotation = linear / np.cbrt(abs(determinant))
+        if determinant > 0:
+            quaternions = rotation_vectors_to_quaternions(rows['ori'].astype(np.float64))
+            composition = left_multiplication_matrix(matrix_to_quaternion(rotation))
+            rows['ori'] = quaternions_to_rotation_vectors(quaternions @ composition.T)
+        else:
+            rows['ori'] = -(rows['ori'] @ rotation.T)
+    return rows
+
+
+class CoordinateSpaces:
+    def __init__(self, definitions=None, cache_size=CACHE_SIZE):
+        self.definitions = dict(definitions or {})
+        self.matrices = {}
+        for name in self.definitions:
+            self.matrices[name] = self._resolve(name, ())
+        self.cache_size = cache_size
+        self.hits = 0
+        self.misses = 0
+        self._cache = OrderedDict()
+
+    def _resolve(self, name, chain):
+        if name in chain:
+            raise ValueError(f"Coordinate spaces {' -> '.join(chain + (name,))} form a loop")
+        definition = self.definitions.get(name)
+        if definition is None:
+            raise ValueError(f"Unknown coordinate space {name!r}")
+        matrix = definition_matrix(definition)
+        parent = definition.get('parent')
+        if parent is not None:
+            matrix = matrix @ self._resolve(parent, chain + (name,))
+        return matrix
+
+    def __contains__(self, name):
+        return name in self.matrices
+
+    # Copy of rows in the named space, cached under key (for a frame, its source, packet
+    # timestamp and frame ID). The array returned is shared by every caller with the same
+    # key and space, so it must not be modified.
+    def transform(self, rows, space, key=None):
+        matrix = self.matrices.get(space)
+        if matrix is None:
+            raise ValueError(f"Unknown coordinate space {space!r}")
+        if key is None:
+            return transform_rows(rows.copy(), matrix)
+        cache_key = (key, space)
+        cache = self._cache
+        result = cache.get(cache_key)
+        if result is not None:
+            self.hits += 1
+            cache.move_to_end(cache_key)
+            return result
+        self.misses += 1
+        result = transform_rows(rows.copy(), matrix)
+        result.flags.writeable = False
+        cache[cache_key] = result
+        if len(cache) > self.cache_size:
+            cache.popitem(last=False)
+        return result
+
+    # The active rows of a TrackerFrame in the named space
+    def transform_frame(self, frame, space):
+        return self.transform(frame.active(), space, (frame.source, frame.packet_timestamp, frame.frame_id))
+
+
+# The spaces of the "spaces" section of config.json
+def load_spaces(path=CONFIG_FILE):
+    if not os.path.exists(path) or os.path.getsize(path) == 0:
+        return CoordinateSpaces()
+    with open(path) as f:
+        return CoordinateSpaces(json.load(f).get('spaces', {}))
@@ -1,40 +1,108 @@
+import atexit
 import logging
+import time
 from multiprocessing.connection import Listener
+from log_setup import setup_logging, install_verbosity_toggle, PacketSummary
+from shared_table import SharedTrackerTable, SHARED_TABLE_NAME
+from forwarder import iter_records, decode_frame, RECORD_TRACKER_FRAME
+from subscription_hub import SubscriptionHub, HUB_ADDRESS
+from coordinate_spaces import load_spaces, CONFIG_FILE
+from columnar_export import ColumnarWriter, FRAMES_PER_GROUP
 
 # Configuration for logging
 LOG_TO_FILE = False
 LOG_TO_CONSOLE = True
 LOG_FILE = 'data_parser.log'
+# Per-frame details are logged at DEBUG; send SIGUSR1 to toggle DEBUG at runtime
+LOG_LEVEL = logging.INFO
+FRAME_SUMMARY_INTERVAL = 5.0
+# Read tracker state from the receiver's shared memory table instead of a connection
+USE_SHARED_TABLE = False
+SHARED_TABLE_POLL_INTERVAL = 0.005
+# Serve the frames to TCP subscribers (see subscription_hub.py)
+RUN_SUBSCRIPTION_HUB = True
+# Write the frames to a columnar export for offline analysis (see columnar_export.py)
+EXPORT_COLUMNAR = False
+EXPORT_FILE = 'psn_session.psncol'
+EXPORT_FRAMES_PER_GROUP = FRAMES_PER_GROUP
 
 # Set up logging
-logger = logging.getLogger('DataParser')
-logger.setLevel(logging.DEBUG)
-formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
-
-if LOG_TO_FILE:
-    file_handler = logging.FileHandler(LOG_FILE)
-    file_handler.setFormatter(formatter)
-    logger.addHandler(file_handler)
-
-if LOG_TO_CONSOLE:
-    console_handler = logging.StreamHandler()
-    console_handler.setFormatter(formatter)
-    logger.addHandler(console_handler)
+logger = setup_logging('DataParser', LOG_FILE if LOG_TO_FILE else None, LOG_TO_CONSOLE, LOG_LEVEL)
+frame_summary = PacketSummary(logger, FRAME_SUMMARY_INTERVAL, label='Frames')
 
 def start_data_parser():
     address = ('localhost', 6001)  # Address and port to listen on
     listener = Listener(address, authkey=b'secret password')
 
+    hub = None
+    if RUN_SUBSCRIPTION_HUB:
+        hub = SubscriptionHub(HUB_ADDRESS, spaces=load_spaces(CONFIG_FILE))
+        hub.start()
+
+    exporter = None
+    if EXPORT_COLUMNAR:
+        exporter = ColumnarWriter(EXPORT_FILE, EXPORT_FRAMES_PER_GROUP)
+        atexit.register(exporter.close)
+        logger.info("Exporting frames to %s", EXPORT_FILE)
+
+    install_verbosity_toggle('DataParser')
     logger.info("DataParser started and waiting for connections...")
     while True:
         try:
             with listener.accept() as conn:
-                logger.info(f"Connection accepted from {listener.last_accepted}")
+                logger.info("Connection accepted from %s", listener.last_accepted)
                 while True:
-                    data = conn.recv()
-                    logger.info(f"Received raw data: {data}")
+                    batch = conn.recv_bytes()
+                    debug = logger.isEnabledFor(logging.DEBUG)
+                    for kind, payload in iter_records(batch):
+                        if kind != RECORD_TRACKER_FRAME:
+                            frame_summary.count('ignored records')
+                            continue
+                        source, packet_timestamp, frame_id, packet_count, packets_received, rows = decode_frame(payload)
+                        frame_summary.count('frames', source)
+                        frame_summary.count('trackers', amount=len(rows))
+                        if hub:
+                            hub.publish(payload)
+                        if exporter:
+                            exporter.add(source, packet_timestamp, frame_id, rows)
+                        if debug:
+                            logger.debug("Frame %d from %s (%d/%d packets, timestamp %d): %d trackers", frame_id,
+                                         source, packets_received, packet_count, packet_timestamp, len(rows))
+                    frame_summary.tick()
         except Exception as e:
-            logger.error(f"Error: {e}")
+            logger.error("Error: %s", e)
+
+def start_table_reader():
+    table = None
+    while table is None:
+        try:
+            table = SharedTrackerTable(SHARED_TABLE_NAME)
+        except FileNotFoundError:
+            logger.info("Waiting for the receiver to create the shared tracker table...")
+            time.sleep(1)
+
+    logger.info("Attached to shared tracker table '%s'", SHARED_TABLE_NAME)
+    last_generation = table.generation
+    last_generations = {}
+    while True:
+        if table.generation == last_generation:
+            time.sleep(SHARED_TABLE_POLL_INTERVAL)
+            continue
+        last_generation = table.generation
+        for source in table.sources():
+            generation = table.generation_of(source)
+            if last_generations.get(source) == generation:
+                continue
+            rows, token = table.snapshot(source)
+            active = rows[rows['fields'] != 0]
+            if table.is_valid(token):
+                last_generations[source] = generation
+                frame_summary.count('generations', source)
+                logger.debug("Tracker table generation %d of %s: %d trackers", generation, source, len(active))
+        frame_summary.tick()
 
 if __name__ == "__main__":
-    start_data_parser()
+    if USE_SHARED_TABLE:
+        start_table_reader()
+    else:
+        start_data_parser()
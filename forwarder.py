@@ -0,0 +1,180 @@
+import logging
+import socket
+import struct
+import threading
+from collections import deque
+from multiprocessing import AuthenticationError
+from multiprocessing.connection import Client
+import numpy as np
+from tracker_frame import TRACKER_DTYPE
+
+logger = logging.getLogger('PSNReceiver')
+
+# What to do when the queue is full: discard the oldest queued record or the new one
+DROP_OLDEST = 'drop-oldest'
+DROP_NEWEST = 'drop-newest'
+
+# Record kinds carried in a batch
+RECORD_PSN_PACKET = 1      # raw PSN datagram
+RECORD_TRACKER_FRAME = 2   # FRAME_HEADER followed by the frame's active TRACKER_DTYPE rows
+RECORD_SOURCE_PACKET = 3   # source IPv4 address followed by the raw PSN datagram
+RECORD_WORKER_STATS = 4    # receive counters of a worker process (see receive_workers.py)
+
+# Every record in a batch is prefixed with its payload length and kind
+RECORD_HEADER = struct.Struct('<IB')
+# Source IPv4 address, packet timestamp, frame ID, frame packet count, packets received
+FRAME_HEADER = struct.Struct('<4sQBBB')
+
+
+def encode_frame(frame):
+    rows = frame.active()
+    header = FRAME_HEADER.pack(socket.inet_aton(frame.source), frame.packet_timestamp, frame.frame_id,
+                               frame.frame_packet_count, frame.packets_received)
+    return header + rows.tobytes()
+
+
+def encode_source_packet(source, data):
+    return socket.inet_aton(source) + bytes(data)
+
+
+def decode_source_packet(payload):
+    return socket.inet_ntoa(payload[:4]), payload[4:]
+
+
+# Returns (source, packet_timestamp, frame_id, frame_packet_count, packets_received, rows)
+# where rows is a read-only TRACKER_DTYPE array over the payload
+def decode_frame(payload):
+    source, packet_timestamp, frame_id, frame_packet_count, packets_received = FRAME_HEADER.unpack_from(payload)
+    rows = np.frombuffer(payload, dtype=TRACKER_DTYPE, offset=FRAME_HEADER.size)
+    return socket.inet_ntoa(source), packet_timestamp, frame_id, frame_packet_count, packets_received, rows
+
+
+def iter_records(batch):
+    mv = memoryview(batch)
+    offset = 0
+    while offset + RECORD_HEADER.size <= len(mv):
+        length, kind = RECORD_HEADER.unpack_from(mv, offset)
+        offset += RECORD_HEADER.size
+        if offset + length > len(mv):
+            raise ValueError(f"Truncated record: {length} bytes at offset {offset} of {len(mv)}")
+        yield kind, mv[offset:offset + length]
+        offset += length
+
+
+# Ships records to a multiprocessing.connection Listener from a background thread.
+#
+# submit() only appends to a bounded deque, so the receive loop never waits on the
+# consumer. The sender thread coalesces everything queued (up to batch_size records)
+# into one length-prefixed send_bytes() call and reconnects after failures. Records
+# dropped for a full queue are counted by the submitting thread and records lost with a
+# failed send by the sender thread, each in its own counter, so neither update races.
+class IPCForwarder:
+    def __init__(self, address, authkey, name='forwarder', max_queue=4096, policy=DROP_OLDEST,
+                 batch_size=256, reconnect_interval=1.0):
+        if policy not in (DROP_OLDEST, DROP_NEWEST):
+            raise ValueError(f"Unknown drop policy: {policy}")
+        self.address = address
+        self.authkey = authkey
+        self.name = name
+        self.max_queue = max_queue
+        self.policy = policy
+        self.batch_size = batch_size
+        self.reconnect_interval = reconnect_interval
+        self.sent = 0
+        self.batches = 0
+        self.connected = False
+        self._dropped_full = 0
+        self._dropped_unsent = 0
+        self._batch_records = 0
+        self._queue = deque()
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+        self._running = False
+        self._thread = None
+
+    # Records discarded for a full queue or lost with a failed send
+    @property
+    def dropped(self):
+        return self._dropped_full + self._dropped_unsent
+
+    # Records waiting to be sent
+    @property
+    def queued(self):
+        return len(self._queue)
+
+    def start(self):
+        self._running = True
+        self._stopping.clear()
+        self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=1.0):
+        self._running = False
+        self._stopping.set()
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def submit(self, kind, payload):
+        queue = self._queue
+        if len(queue) >= self.max_queue:
+            self._dropped_full += 1
+            if self.policy == DROP_NEWEST:
+                return False
+            try:
+                queue.popleft()
+            except IndexError:
+                pass
+        queue.append((kind, payload))
+        self._wakeup.set()
+        return True
+
+    def _run(self):
+        conn = None
+        while self._running:
+            if conn is None:
+                conn = self._connect()
+                if conn is None:
+                    self._stopping.wait(self.reconnect_interval)
+                    continue
+
+            self._wakeup.wait()
+            self._wakeup.clear()
+            while self._queue:
+                batch = self._take_batch()
+                try:
+                    conn.send_bytes(batch)
+                except (OSError, EOFError) as e:
+                    logger.error("%s: lost connection to %s: %s", self.name, self.address, e)
+                    self._dropped_unsent += self._batch_records
+                    self.connected = False
+                    conn.close()
+                    conn = None
+                    break
+                self.sent += self._batch_records
+                self.batches += 1
+        if conn is not None:
+            conn.close()
+
+    def _connect(self):
+        try:
+            conn = Client(self.address, authkey=self.authkey)
+        except (OSError, EOFError, AuthenticationError) as e:
+            logger.debug("%s: cannot connect to %s: %s", self.name, self.address, e)
+            return None
+        logger.info("%s: connected to %s", self.name, self.address)
+        self.connected = True
+        return conn
+
+    def _take_batch(self):
+        queue = self._queue
+        parts = []
+        count = 0
+        pack = RECORD_HEADER.pack
+        while queue and count < self.batch_size:
+            kind, payload = queue.popleft()
+            parts.append(pack(len(payload), kind))
+            parts.append(payload)
+            count += 1
+        self._batch_records = count
+        return b''.join(parts)
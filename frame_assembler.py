@@ -0,0 +1,139 @@
+import time
+import numpy as np
+from tracker_frame import TrackerFrame, MAX_TRACKERS
+from metrics import FrameSequence
+
+# Maximum number of partially received frames held at once (across all sources)
+MAX_PENDING_FRAMES = 8
+# Seconds to wait for the remaining packets of a frame before emitting it as partial
+FRAME_TIMEOUT = 0.05
+
+# Set in a row's 'fields' mask when the tracker was not received in this frame and the
+# row holds the last known values carried over from the previous frame
+FIELD_STALE = 0x8000
+
+
+class PendingFrame:
+    def __init__(self, frame, source, frame_id, packet_count, started):
+        self.frame = frame
+        self.source = source
+        self.frame_id = frame_id
+        self.packet_count = packet_count
+        self.packets_received = 0
+        self.started = started
+
+
+# Collects the packets of multi-packet PSN data frames and emits whole frames.
+#
+# Packets are merged into a pooled TrackerFrame per (source, frame_id). A frame is
+# emitted once frame_packet_count packets have arrived, or as a partial frame when it
+# times out or is evicted to make room for newer ones. Emitted frames carry 'source',
+# 'complete' and 'packets_received' attributes, and in partial frames the trackers that
+# were missed hold their previous values with FIELD_STALE set. An emitted frame is
+# never written to again until the next frame from the same source is emitted.
+#
+# Frames leave in frame ID order per source: a packet for a frame ID at or behind the
+# last one emitted (a late packet of a frame already emitted or expired) is dropped
+# rather than starting a frame of older data, and counted in late_packets. A source
+# whose IDs stay behind because its server restarted is resynchronized after a few
+# frames (see FrameSequence).
+class FrameAssembler:
+    def __init__(self, capacity=MAX_TRACKERS, max_pending=MAX_PENDING_FRAMES, timeout=FRAME_TIMEOUT):
+        self.capacity = capacity
+        self.max_pending = max_pending
+        self.timeout = timeout
+        self.pending = []
+        self.latest = {}
+        self.frames_completed = 0
+        self.frames_partial = 0
+        self.late_packets = 0
+        self.sequence = FrameSequence()
+        # Every source holds one emitted frame and each pending frame holds one more
+        self._pool = [TrackerFrame(capacity) for _ in range(max_pending + 1)]
+
+    # Merge one decoded data packet from source and return the frames it completed
+    def add(self, packet_frame, source, now=None):
+        if now is None:
+            now = time.monotonic()
+        emitted = self.expire(now)
+
+        pending = None
+        for candidate in self.pending:
+            if candidate.source == source and candidate.frame_id == packet_frame.frame_id:
+                pending = candidate
+                break
+        if pending is None:
+            sequence = self.sequence
+            distance = sequence.distance(source, packet_frame.frame_id)
+            if distance is not None and distance <= 0:
+                self.late_packets += 1
+                if distance == 0 or not sequence.reject(source, packet_frame.frame_id):
+                    return emitted
+            if len(self.pending) >= self.max_pending:
+                self._emit(self.pending[0], emitted)
+            pending = PendingFrame(self._take_frame(), source, packet_frame.frame_id,
+                                   max(packet_frame.frame_packet_count, 1), now)
+            pending.frame.packet_timestamp = packet_frame.packet_timestamp
+            pending.frame.frame_id = packet_frame.frame_id
+            pending.frame.frame_packet_count = pending.packet_count
+            self.pending.append(pending)
+
+        rows = np.flatnonzero(packet_frame.trackers['fields'])
+        pending.frame.trackers[rows] = packet_frame.trackers[rows]
+        pending.frame.errors += packet_frame.errors
+        pending.packets_received += 1
+
+        if pending.packets_received >= pending.packet_count:
+            # Anything still pending from this source is older and lost its packets
+            for older in [p for p in self.pending if p.source == source and p is not pending]:
+                self._emit(older, emitted)
+            self._emit(pending, emitted)
+        return emitted
+
+    # Emit every pending frame older than the timeout as a partial frame
+    def expire(self, now=None):
+        if now is None:
+            now = time.monotonic()
+        emitted = []
+        while self.pending and now - self.pending[0].started >= self.timeout:
+            self._emit(self.pending[0], emitted)
+        return emitted
+
+    def _take_frame(self):
+        if self._pool:
+            return self._pool.pop()
+        return TrackerFrame(self.capacity)
+
+    def _emit(self, pending, emitted):
+        self.pending.remove(pending)
+        frame = pending.frame
+        distance = self.sequence.distance(pending.source, pending.frame_id)
+        if distance is not None and distance <= 0:
+            # Overtaken by a newer frame of its source while pending
+            self.late_packets += pending.packets_received
+            frame.reset()
+            frame.errors = 0
+            self._pool.append(frame)
+            return
+        self.sequence.accept(pending.source, pending.frame_id)
+        frame.source = pending.source
+        frame.packets_received = pending.packets_received
+        frame.complete = pending.packets_received >= pending.packet_count
+
+        previous = self.latest.get(pending.source)
+        if frame.complete:
+            self.frames_completed += 1
+        else:
+            self.frames_partial += 1
+            if previous is not None:
+                fields = frame.trackers['fields']
+                missing = np.flatnonzero((fields == 0) & (previous.trackers['fields'] != 0))
+                frame.trackers[missing] = previous.trackers[missing]
+                fields[missing] |= FIELD_STALE
+
+        self.latest[pending.source] = frame
+        if previous is not None:
+            previous.reset()
+            previous.errors = 0
+            self._pool.append(previous)
+        emitted.append(frame)
@@ -1,135 +1,87 @@
 import logging
-import struct
-import re
 from multiprocessing.connection import Listener
+from log_setup import setup_logging, install_verbosity_toggle, PacketSummary
+from forwarder import iter_records, decode_source_packet, RECORD_PSN_PACKET, RECORD_SOURCE_PACKET
+from psn_decoder import PSNChunkHeader, parse_psn_info_packet, format_tracker_list, PSN_INFO_PACKET
 
 # Configuration for logging
 LOG_TO_FILE = False
 LOG_TO_CONSOLE = True
 LOG_FILE = 'info_parser.log'
+# Repeated info packets are only counted; their details are logged at DEBUG
+LOG_LEVEL = logging.INFO
+PACKET_SUMMARY_INTERVAL = 30.0
 
 # Set up logging
-logger = logging.getLogger('InfoParser')
-logger.setLevel(logging.DEBUG)
-formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = setup_logging('InfoParser', LOG_FILE if LOG_TO_FILE else None, LOG_TO_CONSOLE, LOG_LEVEL)
+packet_summary = PacketSummary(logger, PACKET_SUMMARY_INTERVAL, label='Info packets')
 
-if LOG_TO_FILE:
-    file_handler = logging.handlers.RotatingFileHandler(LOG_FILE, maxBytes=1024*1024, backupCount=5)
-    file_handler.setFormatter(formatter)
-    logger.addHandler(file_handler)
+# Info packets already logged, by source. A server may split its tracker list over the
+# packets of one info frame, so every part of its latest frame is remembered (up to
+# frame_packet_count of them) and a packet is only new when it matches none of them.
+# Parts are compared by identity: the decoder's info cache returns the same chunk
+# objects while a part does not change.
+class LoggedInfo:
+    def __init__(self):
+        self.parts = {}
 
-if LOG_TO_CONSOLE:
-    console_handler = logging.StreamHandler()
-    console_handler.setFormatter(formatter)
-    logger.addHandler(console_handler)
-
-class PSNChunkHeader:
-    def __init__(self, raw_header):
-        try:
-            header = struct.unpack('<I', raw_header)[0]
-            self.id = header & 0xFFFF
-            self.data_len = (header >> 16) & 0x7FFF
-            self.has_subchunks = (header >> 31) & 0x01
-        except struct.error as e:
-            logger.error(f"Failed to unpack PSNChunkHeader: {e}")
-            self.id = 0
-            self.data_len = 0
-            self.has_subchunks = 0
-
-    def __str__(self):
-        return f"Chunk ID: {self.id}, Data Length: {self.data_len}, Has Subchunks: {self.has_subchunks}"
-
-class PSNInfoPacketHeader:
-    def __init__(self, data):
-        try:
-            self.timestamp, = struct.unpack('<Q', data[:8])
-            self.version_high, = struct.unpack('<B', data[8:9])
-            self.version_low, = struct.unpack('<B', data[9:10])
-            self.frame_id, = struct.unpack('<B', data[10:11])
-            self.frame_packet_count, = struct.unpack('<B', data[11:12])
-        except struct.error as e:
-            logger.error(f"Failed to unpack PSNInfoPacketHeader: {e}")
-            self.timestamp = 0
-            self.version_high = 0
-            self.version_low = 0
-            self.frame_id = 0
-            self.frame_packet_count = 0
-
-    def __str__(self):
-        return (f"Timestamp: {self.timestamp}, Version High: {self.version_high}, "
-                f"Version Low: {self.version_low}, Frame ID: {self.frame_id}, "
-                f"Frame Packet Count: {self.frame_packet_count}")
-
-def parse_psn_info_packet(data):
-    chunks = []
-    offset = 0
-    while offset < len(data):
-        try:
-            chunk_header = PSNChunkHeader(data[offset:offset+4])
-            offset += 4
-            chunk_data = data[offset:offset + chunk_header.data_len]
-            offset += chunk_header.data_len
-            if chunk_header.id == 0x0000:
-                chunks.append(('PSN_INFO_PACKET_HEADER', PSNInfoPacketHeader(chunk_data)))
-            elif chunk_header.id == 0x0001:
-                chunks.append(('PSN_INFO_SYSTEM_NAME', chunk_data.decode('utf-8').strip('\x00')))
-            elif chunk_header.id == 0x0002:
-                chunks.append(('PSN_INFO_TRACKER_LIST', parse_psn_info_tracker_list(chunk_data)))
-            else:
-                chunks.append(('UNKNOWN_CHUNK', chunk_data))
-        except Exception as e:
-            logger.error(f"Error parsing PSN info packet: {e}")
-            break
-    return chunks
-
-def parse_psn_info_tracker_list(data):
-    chunks = []
-    offset = 0
-    while offset < len(data):
-        try:
-            chunk_header = PSNChunkHeader(data[offset:offset+4])
-            offset += 4
-            chunk_data = data[offset:offset + chunk_header.data_len]
-            offset += chunk_header.data_len
-            tracker_id = chunk_header.id
-            tracker_name = re.sub(r'[^\x20-\x7E]+', '', chunk_data.decode('utf-8')).strip()
-            chunks.append((tracker_name, tracker_id))
-        except Exception as e:
-            logger.error(f"Error parsing PSN info tracker list: {e}")
-            break
-    return chunks
-
-def format_tracker_list(tracker_list):
-    formatted_list = []
-    for tracker_name, tracker_id in tracker_list:
-        formatted_list.append(f"    TrackerID: {tracker_id:<5} Name: {tracker_name}")
-    return "\n".join(formatted_list)
+    def changed(self, source, packet_count, content):
+        parts = self.parts.setdefault(source, [])
+        for part in parts:
+            if len(part) == len(content) and all(a is b for a, b in zip(part, content)):
+                return False
+        parts.append(content)
+        del parts[:-max(packet_count, 1)]
+        return True
 
 def start_info_parser():
     listener = Listener(('localhost', 6000), authkey=b'psn_secret_key')
+    install_verbosity_toggle('InfoParser')
     logger.info("InfoParser started and waiting for connections...")
+    logged = LoggedInfo()
     while True:
         with listener.accept() as conn:
             logger.info('Connection accepted from receiver')
             while True:
                 try:
-                    packet = conn.recv()
-                    if packet == 'CLOSE':
-                        break
-                    parsed_info = parse_psn_info_packet(packet)
-                    for sub_chunk_type, sub_chunk_data in parsed_info:
-                        if sub_chunk_type == 'PSN_INFO_PACKET_HEADER':
-                            logger.info(f"  {sub_chunk_type}: {sub_chunk_data}")
-                        elif sub_chunk_type == 'PSN_INFO_SYSTEM_NAME':
-                            logger.info(f"  PSN_INFO_SYSTEM_NAME: {sub_chunk_data}")
-                        elif sub_chunk_type == 'PSN_INFO_TRACKER_LIST':
-                            logger.info("  PSN_INFO_TRACKER_LIST:\n" + format_tracker_list(sub_chunk_data))
+                    batch = conn.recv_bytes()
+                    for kind, packet in iter_records(batch):
+                        if kind == RECORD_SOURCE_PACKET:
+                            source, packet = decode_source_packet(packet)
+                        elif kind == RECORD_PSN_PACKET:
+                            source = None
+                        else:
+                            packet_summary.count('ignored records')
+                            continue
+                        # Records are whole datagrams; skip the outer PSN_INFO_PACKET chunk header
+                        chunk_header = PSNChunkHeader(packet)
+                        if chunk_header.id != PSN_INFO_PACKET:
+                            continue
+                        parsed_info = parse_psn_info_packet(packet, 4, min(4 + chunk_header.data_len, len(packet)))
+                        content = [sub_chunk_data for sub_chunk_type, sub_chunk_data in parsed_info
+                                   if sub_chunk_type != 'PSN_INFO_PACKET_HEADER']
+                        packet_count = max([sub_chunk_data.frame_packet_count for sub_chunk_type, sub_chunk_data
+                                            in parsed_info if sub_chunk_type == 'PSN_INFO_PACKET_HEADER'],
+                                           default=1)
+                        changed = logged.changed(source, packet_count, content)
+                        packet_summary.count('changed' if changed else 'unchanged', source)
+                        if changed:
+                            level = logging.INFO
+                            logger.info("Info packet from %s changed:", source or 'unknown source')
+                        elif logger.isEnabledFor(logging.DEBUG):
+                            level = logging.DEBUG
                         else:
-                            logger.info(f"  {sub_chunk_type}: {sub_chunk_data}")
+                            continue
+                        for sub_chunk_type, sub_chunk_data in parsed_info:
+                            if sub_chunk_type == 'PSN_INFO_TRACKER_LIST':
+                                logger.log(level, "  PSN_INFO_TRACKER_LIST:\n%s", format_tracker_list(sub_chunk_data))
+                            else:
+                                logger.log(level, "  %s: %s", sub_chunk_type, sub_chunk_data)
+                    packet_summary.tick()
                 except EOFError:
                     break
                 except Exception as e:
-                    logger.error(f"Error processing packet: {e}")
+                    logger.error("Error processing packet: %s", e)
                     break
 
 if __name__ == "__main__":
@@ -0,0 +1,100 @@
+import atexit
+import logging
+import queue
+import signal
+import time
+from collections import Counter
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+
+LOG_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+
+_listeners = {}
+
+
+# Configure a logger whose records are formatted and written by a QueueListener thread.
+# The calling thread only enqueues the record, so slow consoles or disks never stall the
+# receive loop. Messages should use %-style arguments so they are only formatted when
+# the level is enabled.
+def setup_logging(name, log_file=None, log_to_console=True, level=logging.INFO,
+                  max_bytes=1024*1024, backup_count=5):
+    logger = logging.getLogger(name)
+    logger.setLevel(level)
+    if name in _listeners:
+        return logger
+
+    formatter = logging.Formatter(LOG_FORMAT)
+    handlers = []
+    if log_file:
+        file_handler = RotatingFileHandler(log_file, maxBytes=max_bytes, backupCount=backup_count)
+        file_handler.setFormatter(formatter)
+        handlers.append(file_handler)
+    if log_to_console:
+        console_handler = logging.StreamHandler()
+        console_handler.setFormatter(formatter)
+        handlers.append(console_handler)
+
+    log_queue = queue.SimpleQueue()
+    logger.addHandler(QueueHandler(log_queue))
+    logger.propagate = False
+    listener = QueueListener(log_queue, *handlers, respect_handler_level=True)
+    listener.start()
+    _listeners[name] = listener
+    atexit.register(listener.stop)
+    return logger
+
+
+def set_verbosity(name, level):
+    logging.getLogger(name).setLevel(level)
+
+
+# Toggle a logger between its configured level and DEBUG on SIGUSR1, so a running
+# process can be made verbose without restarting it (POSIX only)
+def install_verbosity_toggle(name, signum=getattr(signal, 'SIGUSR1', None)):
+    if signum is None:
+        return False
+    logger = logging.getLogger(name)
+    normal_level = logger.level
+
+    def toggle(signum, frame):
+        level = normal_level if logger.level == logging.DEBUG else logging.DEBUG
+        logger.setLevel(level)
+        logger.warning("Log level set to %s", logging.getLevelName(level))
+
+    try:
+        signal.signal(signum, toggle)
+    except ValueError:
+        # Signal handlers can only be installed from the main thread
+        return False
+    return True
+
+
+# Counts per-packet events and logs one summary line at most every interval seconds,
+# in place of a log line per packet. count() is a Counter increment; the summary is
+# only formatted when it is due.
+class PacketSummary:
+    def __init__(self, logger, interval=5.0, label='packets'):
+        self.logger = logger
+        self.interval = interval
+        self.label = label
+        self.counts = Counter()
+        self.sources = set()
+        self._started = time.monotonic()
+
+    def count(self, kind, source=None, amount=1):
+        self.counts[kind] += amount
+        if source is not None:
+            self.sources.add(source)
+
+    def tick(self, now=None):
+        if now is None:
+            now = time.monotonic()
+        elapsed = now - self._started
+        if elapsed < self.interval:
+            return
+        if self.counts and self.logger.isEnabledFor(logging.INFO):
+            details = ', '.join(f"{kind} {count}" for kind, count in sorted(self.counts.items()))
+            self.logger.info("%s in last %.1fs from %d sources: %s",
+                             self.label, elapsed, len(self.sources), details)
+        self.counts.clear()
+        self.sources.clear()
+        self._started = now
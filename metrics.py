@@ -0,0 +1,285 @@
+import time
+from bisect import bisect_left
+import numpy as np
+
+# Latency histogram bucket upper bounds in nanoseconds, 1 us to 100 ms
+LATENCY_BUCKETS_NS = (1000, 2500, 5000, 10000, 25000, 50000, 100000, 250000, 500000,
+                      1000000, 2500000, 5000000, 10000000, 25000000, 100000000)
+NS_PER_SECOND = 1e9
+
+# PSN frame IDs are a single byte and wrap around
+FRAME_ID_MODULO = 256
+# Different frame IDs behind the latest one, in a row, after which a source is taken to
+# have restarted (or paused for more than half the ID range) and its sequence starts over
+RESYNC_FRAMES = 3
+
+# Packets whose observations are buffered before they are binned, and the longest time
+# they stay buffered when traffic is light (seconds)
+PACKET_BATCH = 512
+FLUSH_INTERVAL = 0.5
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# All metrics are written by the receive thread only and read by the web server thread.
+# Every update is a plain int/list/dict operation under the GIL, so no locks are taken;
+# a scrape may see a histogram whose sum and bucket counts are one batch apart.
+
+
+class Histogram:
+    def __init__(self, name, description, buckets=LATENCY_BUCKETS_NS, scale=NS_PER_SECOND):
+        self.name = name
+        self.description = description
+        self.buckets = tuple(buckets)
+        self.scale = scale
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0
+        self._bounds = np.array(self.buckets)
+
+    # The observation count is the total of the bucket counts, worked out when rendering
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+
+    # observe() for every value of an array, binned with NumPy. The counts list is
+    # replaced rather than updated in place, so a scrape never sees half a batch.
+    def observe_many(self, values):
+        binned = np.bincount(np.searchsorted(self._bounds, values, side='left'), minlength=len(self.counts))
+        self.counts = [count + added for count, added in zip(self.counts, binned.tolist())]
+        self.sum += int(values.sum())
+
+    def render(self, lines):
+        counts = list(self.counts)
+        lines.append(f"# HELP {self.name} {self.description}")
+        lines.append(f"# TYPE {self.name} histogram")
+        cumulative = 0
+        for bound, count in zip(self.buckets, counts):
+            cumulative += count
+            lines.append(f'{self.name}_bucket{{le="{bound / self.scale:g}"}} {cumulative}')
+        cumulative += counts[-1]
+        lines.append(f'{self.name}_bucket{{le="+Inf"}} {cumulative}')
+        lines.append(f"{self.name}_sum {self.sum / self.scale:.9f}")
+        lines.append(f"{self.name}_count {cumulative}")
+
+
+# Packet and byte counters per PSN source IP, kept together as one [packets, bytes]
+# list per source so a packet costs a single dict lookup
+class SourceCounters:
+    def __init__(self):
+        self.totals = {}
+
+    def count(self, source, nbytes, packets=1):
+        totals = self.totals.get(source)
+        if totals is None:
+            totals = self.totals[source] = [0, 0]
+        totals[0] += packets
+        totals[1] += nbytes
+
+    # count() for packets from the given sources with the given sizes; a batch from a
+    # single source, the usual case, is added up in one go
+    def count_many(self, sources, sizes):
+        first = sources[0]
+        if sources.count(first) == len(sources):
+            self.count(first, sum(sizes), len(sources))
+        else:
+            for source, nbytes in zip(sources, sizes):
+                self.count(source, nbytes)
+
+    def render(self, lines):
+        totals = sorted(self.totals.items())
+        for name, description, index in (('psn_packets_total', 'PSN packets received', 0),
+                                         ('psn_bytes_total', 'PSN bytes received', 1)):
+            lines.append(f"# HELP {name} {description}")
+            lines.append(f"# TYPE {name} counter")
+            for source, values in totals:
+                lines.append(f'{name}{{source="{source}"}} {values[index]}')
+
+
+# Orders the frame IDs of each source. distance() is how far an ID is ahead of the last
+# accepted one (negative when behind, None when there is none). IDs behind are rejected
+# until resync_frames different ones in a row were: then the source restarted or paused
+# too long for its IDs to be compared, and reject() forgets it so the new IDs start a
+# new sequence instead of being dropped until the counter wraps past the old one.
+class FrameSequence:
+    def __init__(self, modulo=FRAME_ID_MODULO, resync_frames=RESYNC_FRAMES):
+        self.modulo = modulo
+        self.resync_frames = resync_frames
+        self.last = {}
+        self.resyncs = 0
+        self._behind = {}
+
+    def distance(self, source, frame_id):
+        last = self.last.get(source)
+        if last is None:
+            return None
+        distance = (frame_id - last) % self.modulo
+        return distance - self.modulo if distance > self.modulo // 2 else distance
+
+    def accept(self, source, frame_id):
+        self.last[source] = frame_id
+        self._behind.pop(source, None)
+
+    # Records an ID that is behind; returns True when it resynchronized the source, after
+    # which frame_id is to be handled as the source's first
+    def reject(self, source, frame_id):
+        previous, count = self._behind.get(source, (None, 0))
+        if frame_id != previous:
+            count += 1
+        if count < self.resync_frames:
+            self._behind[source] = (frame_id, count)
+            return False
+        del self.last[source]
+        self._behind.pop(source, None)
+        self.resyncs += 1
+        return True
+
+
+# Infers lost frames from gaps in each source's frame IDs. Packets of one frame share its
+# ID, so only a change of ID is checked. An ID behind the current one (a late or
+# duplicated packet) is counted as out of order rather than as a wrap-around gap, until
+# the FrameSequence resynchronizes a source that restarted.
+class FrameGapDetector:
+    def __init__(self, modulo=FRAME_ID_MODULO):
+        self.sequence = FrameSequence(modulo)
+        self.last = self.sequence.last
+        self.lost = {}
+        self.out_of_order = {}
+
+    def observe(self, source, frame_id):
+        sequence = self.sequence
+        distance = sequence.distance(source, frame_id)
+        if distance == 0:
+            return 0
+        if distance is not None and distance < 0:
+            self.out_of_order[source] = self.out_of_order.get(source, 0) + 1
+            if not sequence.reject(source, frame_id):
+                return 0
+            distance = None
+        sequence.accept(source, frame_id)
+        if distance is None or distance == 1:
+            return 0
+        self.lost[source] = self.lost.get(source, 0) + distance - 1
+        return distance - 1
+
+    # observe() for a run of frame IDs of one source, returning the frames lost. A run
+    # that never steps back, the usual case, is counted with NumPy in one go; anything
+    # else goes through observe() one ID at a time.
+    def observe_many(self, source, frame_ids):
+        modulo = self.sequence.modulo
+        ids = np.asarray(frame_ids, dtype=np.int64)
+        last = self.last.get(source)
+        previous = np.empty_like(ids)
+        previous[0] = ids[0] if last is None else last
+        previous[1:] = ids[:-1]
+        steps = (ids - previous) % modulo
+        steps = steps[steps != 0]
+        if (steps > modulo // 2).any():
+            return sum(self.observe(source, frame_id) for frame_id in frame_ids)
+        if last is None or len(steps):
+            self.sequence.accept(source, int(ids[-1]))
+        lost = int(steps.sum()) - len(steps)
+        if lost:
+            self.lost[source] = self.lost.get(source, 0) + lost
+        return lost
+
+    def render(self, lines):
+        for name, description, values in (
+                ('psn_frames_lost_total', 'Frames missing from the frame ID sequence', self.lost),
+                ('psn_frames_out_of_order_total', 'Packets whose frame ID is behind the latest one',
+                 self.out_of_order)):
+            lines.append(f"# HELP {name} {description}")
+            lines.append(f"# TYPE {name} counter")
+            for source in sorted(self.last):
+                lines.append(f'{name}{{source="{source}"}} {values.get(source, 0)}')
+
+
+# Everything the receiver measures. packet() is called once per packet with the
+# time.perf_counter_ns() readings taken by the receive loop, and frame() with the frame
+# ID of every data packet. Both only buffer their arguments, and tick(), called by the
+# receive loop on every wakeup, hands them to flush() once PACKET_BATCH packets are
+# waiting or FLUSH_INTERVAL has passed, so scrapes lag by at most that long. flush()
+# bins the latencies and counts the frame IDs of the whole batch with NumPy.
+# Measured with their share of the flushes, packet() costs about 0.5 us and frame()
+# about 0.3 us, against 1 us and 0.5 us when every call was binned and checked on its
+# own; most of what is left is turning Python ints into arrays. Counters owned by other
+# objects (receive ring, assembler, forwarders) are registered with add_counter and
+# add_gauge and only read when the metrics are rendered.
+class ReceiverMetrics:
+    def __init__(self):
+        self.sources = SourceCounters()
+        self.receive_to_decode = Histogram('psn_receive_to_decode_seconds',
+                                           'Time from receiving a packet to starting to decode it')
+        self.decode = Histogram('psn_decode_seconds', 'Time to decode a packet')
+        self.forward = Histogram('psn_forward_seconds', 'Time to apply, publish and forward a decoded packet')
+        self.frame_gaps = FrameGapDetector()
+        self.started = time.time()
+        self._packets = []
+        self._frames = []
+        self._next_flush = time.monotonic() + FLUSH_INTERVAL
+        # Name -> (description, kind, read); registering a name again replaces it, so a
+        # receiver that is started again reports its new forwarders once
+        self._collected = {}
+        self._renderers = []
+
+    def packet(self, source, nbytes, received, started, decoded, finished):
+        self._packets.append((source, nbytes, received, started, decoded, finished))
+
+    def frame(self, source, frame_id):
+        self._frames.append((source, frame_id))
+
+    def tick(self, now=None):
+        if now is None:
+            now = time.monotonic()
+        if now >= self._next_flush or len(self._packets) >= PACKET_BATCH:
+            self.flush(now)
+
+    def flush(self, now=None):
+        if now is None:
+            now = time.monotonic()
+        self._next_flush = now + FLUSH_INTERVAL
+        packets, self._packets = self._packets, []
+        frames, self._frames = self._frames, []
+        if packets:
+            count = len(packets)
+            sources, sizes, *readings = zip(*packets)
+            self.sources.count_many(sources, sizes)
+            stages = np.diff([np.fromiter(column, np.int64, count) for column in readings], axis=0)
+            self.receive_to_decode.observe_many(stages[0])
+            self.decode.observe_many(stages[1])
+            self.forward.observe_many(stages[2])
+        if frames:
+            sources, frame_ids = zip(*frames)
+            first = sources[0]
+            if sources.count(first) == len(sources):
+                self.frame_gaps.observe_many(first, frame_ids)
+            else:
+                for source in dict.fromkeys(sources):
+                    self.frame_gaps.observe_many(source, [frame_id for frame_source, frame_id in frames
+                                                          if frame_source == source])
+
+    def add_counter(self, name, description, read):
+        self._collected[name] = (description, 'counter', read)
+
+    def add_gauge(self, name, description, read):
+        self._collected[name] = (description, 'gauge', read)
+
+    # render(lines) appends the metrics of another object, such as labelled per-source values
+    def add_renderer(self, render):
+        self._renderers.append(render)
+
+    def render(self):
+        lines = []
+        self.sources.render(lines)
+        self.frame_gaps.render(lines)
+        self.receive_to_decode.render(lines)
+        self.decode.render(lines)
+        self.forward.render(lines)
+        for render in self._renderers:
+            render(lines)
+        for name, (description, kind, read) in self._collected.items():
+            lines.append(f"# HELP {name} {description}")
+            lines.append(f"# TYPE {name} {kind}")
+            lines.append(f"{name} {read()}")
+        lines.append("# HELP psn_receiver_start_time_seconds Unix time the receiver started")
+        lines.append("# TYPE psn_receiver_start_time_seconds gauge")
+        lines.append(f"psn_receiver_start_time_seconds {self.started:.3f}")
+        return '\n'.join(lines) + '\n'
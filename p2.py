@@ -1,50 +1,26 @@
 # Import necessary modules
 import pypsn
-from flask import Flask, render_template_string
-from threading import Thread
+from flask import Flask, Response, request, jsonify
+from threading import Thread, Condition
 import time
 import socket
+from collections import namedtuple
 
 # Initialize Flask app
 app = Flask(__name__)
 
-# Lists to store system information and tracker names
-system_info = {}
-trackers_list = []
+# Minimum seconds between two pushes to a live dashboard; changes in between are merged
+PUSH_INTERVAL = 0.5
+# Seconds between keep-alive comments on an idle event stream
+KEEPALIVE_INTERVAL = 15.0
 
 # Define a function to convert bytes to string
 def bytes_to_str(b):
     return b.decode('utf-8') if isinstance(b, bytes) else b
 
-# Define a callback function to handle the received PSN data
-def callback_function(data):
-    global system_info, trackers_list
-    if isinstance(data, pypsn.psn_info_packet):
-        info = data.info
-        system_info = {
-            'server_name': bytes_to_str(data.name),
-            'packet_timestamp': info.timestamp,
-            'version_high': info.version_high,
-            'version_low': info.version_low,
-            'frame_id': info.frame_id,
-            'frame_packet_count': info.packet_count,
-            'ip_address': data.ip_address if hasattr(data, 'ip_address') else 'N/A'
-        }
-        trackers_list = [{'tracker_name': bytes_to_str(tracker.tracker_name)} for tracker in data.trackers]
-
-# Create a receiver object with the callback function
-receiver = pypsn.receiver(callback_function)
-
-# Define route to display system info and available trackers in tables
-@app.route('/', methods=['GET'])
-def display_info():
-    html_template = """
-    <!DOCTYPE html>
-    <html>
-    <head>
-        <title>PSN System Info and Trackers</title>
-    </head>
-    <body>
+# Tables showing the system info and available trackers. Compiled once; the page embeds
+# the rendered tables and replaces them with the ones pushed over /events.
+tables_template = app.jinja_env.from_string("""
         <h1>System Information</h1>
         <table border="1">
             <tr>
@@ -55,10 +31,6 @@ def display_info():
                 <th>IP Address</th>
                 <td>{{ system_info.ip_address }}</td>
             </tr>
-            <tr>
-                <th>Packet Timestamp</th>
-                <td>{{ system_info.packet_timestamp }}</td>
-            </tr>
             <tr>
                 <th>Version High</th>
                 <td>{{ system_info.version_high }}</td>
@@ -67,10 +39,6 @@ def display_info():
                 <th>Version Low</th>
                 <td>{{ system_info.version_low }}</td>
             </tr>
-            <tr>
-                <th>Frame ID</th>
-                <td>{{ system_info.frame_id }}</td>
-            </tr>
             <tr>
                 <th>Frame Packet Count</th>
                 <td>{{ system_info.frame_packet_count }}</td>
@@ -87,15 +55,141 @@ def display_info():
             </tr>
             {% endfor %}
         </table>
+""")
+
+page_template = app.jinja_env.from_string("""
+    <!DOCTYPE html>
+    <html>
+    <head>
+        <title>PSN System Info and Trackers</title>
+    </head>
+    <body>
+        <div id="tables">{{ tables|safe }}</div>
+        <script>
+            // Replace the tables whenever the server pushes a new snapshot
+            if (window.EventSource) {
+                new EventSource('/events').addEventListener('snapshot', function (event) {
+                    document.getElementById('tables').innerHTML = event.data;
+                });
+            }
+        </script>
     </body>
     </html>
-    """
-    return render_template_string(html_template, system_info=system_info, trackers=trackers_list)
+""")
+
+
+# One version of the system info and tracker list. Never modified once published.
+DashboardSnapshot = namedtuple('DashboardSnapshot', 'version system_info trackers')
+
+
+# Latest system info and tracker list. The receiver thread builds every new snapshot
+# aside and publishes it by replacing self.snapshot in one assignment, so readers take
+# it without locks and always see a system info and tracker list that belong together;
+# the condition only wakes up the event streams. The page, its ETag and the server-sent
+# event are rendered once per version and shared by every request until the next change.
+class DashboardState:
+    def __init__(self):
+        self._changed = Condition()
+        self._epoch = int(time.time())
+        self.snapshot = DashboardSnapshot(0, {}, [])
+        self._rendered = None
+        # Timestamp and frame ID of the latest info packet, outside the versioned snapshot
+        self.last_packet = {}
+
+    def update(self, system_info, trackers):
+        snapshot = self.snapshot
+        if system_info == snapshot.system_info and trackers == snapshot.trackers:
+            return False
+        with self._changed:
+            self.snapshot = DashboardSnapshot(snapshot.version + 1, system_info, trackers)
+            self._changed.notify_all()
+        return True
+
+    # Wait until the version differs from the given one; returns the current version
+    def wait_for_change(self, version, timeout):
+        with self._changed:
+            self._changed.wait_for(lambda: self.snapshot.version != version, timeout)
+            return self.snapshot.version
+
+    # Returns (version, etag, page, event) for the current snapshot. Two requests racing
+    # on a new version may both render it; either result is the same.
+    def rendered(self):
+        snapshot = self.snapshot
+        rendered = self._rendered
+        if rendered is None or rendered[0] != snapshot.version:
+            tables = tables_template.render(system_info=snapshot.system_info, trackers=snapshot.trackers)
+            page = page_template.render(tables=tables)
+            event = f"id: {snapshot.version}\nevent: snapshot\n"
+            event += ''.join(f"data: {line}\n" for line in tables.splitlines()) + "\n"
+            etag = f"{self._epoch}-{snapshot.version}"
+            rendered = self._rendered = (snapshot.version, etag, page, event)
+        return rendered
+
+dashboard = DashboardState()
+
+# Define a callback function to handle the received PSN data
+def callback_function(data):
+    if isinstance(data, pypsn.psn_info_packet):
+        info = data.info
+        # The timestamp and frame ID change with every packet; they are kept apart so the
+        # tables are only re-rendered and pushed when the system or its trackers change
+        dashboard.last_packet = {'packet_timestamp': info.timestamp, 'frame_id': info.frame_id}
+        system_info = {
+            'server_name': bytes_to_str(data.name),
+            'version_high': info.version_high,
+            'version_low': info.version_low,
+            'frame_packet_count': info.packet_count,
+            'ip_address': data.ip_address if hasattr(data, 'ip_address') else 'N/A'
+        }
+        trackers = [{'tracker_name': bytes_to_str(tracker.tracker_name)} for tracker in data.trackers]
+        dashboard.update(system_info, trackers)
+
+# Create a receiver object with the callback function
+receiver = pypsn.receiver(callback_function)
+
+# Define route to display system info and available trackers in tables
+@app.route('/', methods=['GET'])
+def display_info():
+    version, etag, page, event = dashboard.rendered()
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+    else:
+        response = Response(page, mimetype='text/html')
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+# Timestamp and frame ID of the latest info packet, never cached
+@app.route('/packet', methods=['GET'])
+def latest_packet():
+    response = jsonify(dashboard.last_packet)
+    response.headers['Cache-Control'] = 'no-store'
+    return response
+
+# Push the tables to the browser whenever they change, at most once per PUSH_INTERVAL
+@app.route('/events', methods=['GET'])
+def stream_events():
+    def generate():
+        version = None
+        last_push = 0.0
+        while True:
+            if dashboard.wait_for_change(version, KEEPALIVE_INTERVAL) == version:
+                yield ": keep-alive\n\n"
+                continue
+            delay = last_push + PUSH_INTERVAL - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            version, etag, page, event = dashboard.rendered()
+            last_push = time.monotonic()
+            yield event
+
+    return Response(generate(), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
 
 # Function to run Flask app
 def run_flask():
     print("Starting Flask server...")
-    app.run(host='0.0.0.0', port=5000, debug=True, use_reloader=False)
+    app.run(host='0.0.0.0', port=5000, debug=True, use_reloader=False, threaded=True)
 
 # Start the receiver and Flask server in separate threads
 if __name__ == '__main__':
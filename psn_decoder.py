@@ -0,0 +1,256 @@
+import struct
+from collections import Counter, OrderedDict
+from tracker_frame import TrackerFrame
+
+# Top-level chunk IDs
+PSN_DATA_PACKET = 0x6755
+PSN_INFO_PACKET = 0x6756
+
+# PSN_INFO_PACKET sub-chunk IDs
+PSN_INFO_PACKET_HEADER = 0x0000
+PSN_INFO_SYSTEM_NAME = 0x0001
+PSN_INFO_TRACKER_LIST = 0x0002
+PSN_INFO_TRACKER_NAME = 0x0000
+
+# PSN_DATA_PACKET sub-chunk IDs
+PSN_DATA_PACKET_HEADER = 0x0000
+PSN_DATA_TRACKER_LIST = 0x0001
+
+CHUNK_HEADER = struct.Struct('<I')
+# Timestamp, version high, version low, frame ID, frame packet count
+PACKET_HEADER = struct.Struct('<QBBBB')
+
+# Malformed input is skipped and counted here by location instead of raising
+decode_errors = Counter()
+
+# Number of distinct info packet bodies kept decoded
+INFO_CACHE_SIZE = 64
+
+
+class PSNChunkHeader:
+    def __init__(self, raw_header, offset=0):
+        if len(raw_header) - offset < CHUNK_HEADER.size:
+            decode_errors['chunk_header'] += 1
+            self.id = 0
+            self.data_len = 0
+            self.has_subchunks = 0
+            return
+        header, = CHUNK_HEADER.unpack_from(raw_header, offset)
+        self.id = header & 0xFFFF
+        self.data_len = (header >> 16) & 0x7FFF
+        self.has_subchunks = (header >> 31) & 0x01
+
+    def __str__(self):
+        return f"Chunk ID: {self.id}, Data Length: {self.data_len}, Has Subchunks: {self.has_subchunks}"
+
+
+class PSNInfoPacketHeader:
+    def __init__(self, data, offset=0, end=None):
+        if end is None:
+            end = len(data)
+        if end - offset != PACKET_HEADER.size:
+            decode_errors['info_packet_header'] += 1
+            self.timestamp = self.version_high = self.version_low = 0
+            self.frame_id = self.frame_packet_count = 0
+            return
+        (self.timestamp, self.version_high, self.version_low,
+         self.frame_id, self.frame_packet_count) = PACKET_HEADER.unpack_from(data, offset)
+
+    def __str__(self):
+        return (f"Timestamp: {self.timestamp}, Version High: {self.version_high}, "
+                f"Version Low: {self.version_low}, Frame ID: {self.frame_id}, "
+                f"Frame Packet Count: {self.frame_packet_count}")
+
+
+class PSNDataPacketHeader:
+    def __init__(self, data, offset=0, end=None):
+        if end is None:
+            end = len(data)
+        if end - offset != PACKET_HEADER.size:
+            decode_errors['data_packet_header'] += 1
+            self.packet_timestamp = self.version_high = self.version_low = 0
+            self.frame_id = self.frame_packet_count = 0
+            return
+        (self.packet_timestamp, self.version_high, self.version_low,
+         self.frame_id, self.frame_packet_count) = PACKET_HEADER.unpack_from(data, offset)
+
+    def __str__(self):
+        return (f"Packet Timestamp: {self.packet_timestamp}, Version High: {self.version_high}, "
+                f"Version Low: {self.version_low}, Frame ID: {self.frame_id}, "
+                f"Frame Packet Count: {self.frame_packet_count}")
+
+
+# Walk the chunks between offset and end, yielding (chunk ID, data start, data end).
+# A chunk whose length runs past end stops the walk and is counted under where.
+def iter_chunks(mv, offset, end, where):
+    unpack = CHUNK_HEADER.unpack_from
+    while offset + 4 <= end:
+        header, = unpack(mv, offset)
+        data_end = offset + 4 + ((header >> 16) & 0x7FFF)
+        if data_end > end:
+            decode_errors[where] += 1
+            return
+        yield header & 0xFFFF, offset + 4, data_end
+        offset = data_end
+    if offset != end:
+        decode_errors[where] += 1
+
+
+def _as_memoryview(data):
+    return data if isinstance(data, memoryview) else memoryview(data)
+
+
+def _decode_string(mv, start, end):
+    return str(mv[start:end], 'utf-8', 'replace').strip('\x00')
+
+
+def parse_chunks(data, offset=0):
+    mv = _as_memoryview(data)
+    chunks = []
+    for chunk_id, start, end in iter_chunks(mv, offset, len(mv), 'packet'):
+        entry = PACKET_PARSERS.get(chunk_id)
+        if entry is not None:
+            chunks.append((entry[0], entry[1](mv, start, end)))
+    return chunks
+
+
+# LRU cache of decoded info packet bodies. PSN servers repeat the same system name and
+# tracker list about once a second, so everything after the packet header chunk is looked
+# up by its bytes and only decoded when it changed. Hits return the same chunk objects
+# every time, which lets consumers skip unchanged tracker lists with an identity check;
+# callers must not modify them.
+class InfoPacketCache:
+    def __init__(self, max_entries=INFO_CACHE_SIZE):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+
+    def lookup(self, mv, start, end):
+        key = bytes(mv[start:end])
+        entries = self._entries
+        chunks = entries.get(key)
+        if chunks is not None:
+            self.hits += 1
+            entries.move_to_end(key)
+            return chunks
+        self.misses += 1
+        chunks = _parse_info_chunks(mv, start, end)
+        entries[key] = chunks
+        if len(entries) > self.max_entries:
+            entries.popitem(last=False)
+        return chunks
+
+    def clear(self):
+        self._entries.clear()
+
+
+info_cache = InfoPacketCache()
+
+
+def _parse_info_chunks(mv, offset, end):
+    chunks = []
+    for chunk_id, start, chunk_end in iter_chunks(mv, offset, end, 'info_packet'):
+        entry = INFO_PARSERS.get(chunk_id)
+        if entry is None:
+            chunks.append(('UNKNOWN_CHUNK', bytes(mv[start:chunk_end])))
+        else:
+            chunks.append((entry[0], entry[1](mv, start, chunk_end)))
+    return chunks
+
+
+def parse_psn_info_packet(data, offset=0, end=None, cache=None):
+    mv = _as_memoryview(data)
+    if end is None:
+        end = len(mv)
+    if cache is None:
+        cache = info_cache
+    # The header carries the timestamp and frame ID and changes with every packet, so it is
+    # decoded on its own when it comes first and the rest goes through the cache
+    if offset + 4 <= end:
+        header, = CHUNK_HEADER.unpack_from(mv, offset)
+        header_end = offset + 4 + ((header >> 16) & 0x7FFF)
+        if header & 0xFFFF == PSN_INFO_PACKET_HEADER and header_end <= end:
+            chunks = [('PSN_INFO_PACKET_HEADER', PSNInfoPacketHeader(mv, offset + 4, header_end))]
+            chunks.extend(cache.lookup(mv, header_end, end))
+            return chunks
+    return _parse_info_chunks(mv, offset, end)
+
+
+def parse_psn_info_tracker_list(data, offset=0, end=None):
+    mv = _as_memoryview(data)
+    if end is None:
+        end = len(mv)
+    unpack = CHUNK_HEADER.unpack_from
+    chunks = []
+    while offset + 4 <= end:
+        header, = unpack(mv, offset)
+        tracker_id = header & 0xFFFF
+        tracker_end = offset + 4 + ((header >> 16) & 0x7FFF)
+        if tracker_end > end:
+            decode_errors['info_tracker_list'] += 1
+            return chunks
+        tracker_name = ''
+        offset += 4
+        while offset + 4 <= tracker_end:
+            header, = unpack(mv, offset)
+            name_end = offset + 4 + ((header >> 16) & 0x7FFF)
+            if name_end > tracker_end:
+                decode_errors['info_tracker'] += 1
+                break
+            if header & 0xFFFF == PSN_INFO_TRACKER_NAME:
+                tracker_name = str(mv[offset + 4:name_end], 'utf-8', 'replace').strip('\x00').strip()
+            offset = name_end
+        offset = tracker_end
+        chunks.append((tracker_name, tracker_id))
+    if offset != end:
+        decode_errors['info_tracker_list'] += 1
+    return chunks
+
+
+# Decoded trackers of the latest data packet, reused for every packet
+data_frame = TrackerFrame()
+
+
+def parse_psn_data_packet(data, frame=None, offset=0, end=None):
+    if frame is None:
+        frame = data_frame
+    mv = _as_memoryview(data)
+    if end is None:
+        end = len(mv)
+    frame.reset()
+    chunks = []
+    for chunk_id, start, chunk_end in iter_chunks(mv, offset, end, 'data_packet'):
+        if chunk_id == PSN_DATA_TRACKER_LIST:
+            # Tracker sub-chunks are copied straight from the packet into the frame
+            frame.decode_tracker_list(mv, start, chunk_end)
+            chunks.append(('PSN_DATA_TRACKER_LIST', frame))
+        elif chunk_id == PSN_DATA_PACKET_HEADER:
+            header = PSNDataPacketHeader(mv, start, chunk_end)
+            frame.packet_timestamp = header.packet_timestamp
+            frame.frame_id = header.frame_id
+            frame.frame_packet_count = header.frame_packet_count
+            chunks.append(('PSN_DATA_PACKET_HEADER', header))
+        else:
+            chunks.append(('UNKNOWN_CHUNK', bytes(mv[start:chunk_end])))
+    return chunks
+
+
+def format_tracker_list(tracker_list):
+    formatted_list = []
+    for tracker_name, tracker_id in tracker_list:
+        formatted_list.append(f"    TrackerID: {tracker_id:<5} Name: {tracker_name}")
+    return "\n".join(formatted_list)
+
+
+# Chunk ID -> (chunk type, parser(mv, start, end))
+PACKET_PARSERS = {
+    PSN_INFO_PACKET: ('PSN_INFO_PACKET', parse_psn_info_packet),
+    PSN_DATA_PACKET: ('PSN_DATA_PACKET', lambda mv, start, end: parse_psn_data_packet(mv, None, start, end)),
+}
+
+INFO_PARSERS = {
+    PSN_INFO_PACKET_HEADER: ('PSN_INFO_PACKET_HEADER', PSNInfoPacketHeader),
+    PSN_INFO_SYSTEM_NAME: ('PSN_INFO_SYSTEM_NAME', _decode_string),
+    PSN_INFO_TRACKER_LIST: ('PSN_INFO_TRACKER_LIST', parse_psn_info_tracker_list),
+}
@@ -0,0 +1,185 @@
+import numpy as np
+from psn_decoder import (CHUNK_HEADER, PACKET_HEADER, PSN_DATA_PACKET, PSN_INFO_PACKET, PSN_DATA_PACKET_HEADER,
+                         PSN_DATA_TRACKER_LIST, PSN_INFO_PACKET_HEADER, PSN_INFO_SYSTEM_NAME, PSN_INFO_TRACKER_LIST,
+                         PSN_INFO_TRACKER_NAME)
+from tracker_frame import TRACKER_DTYPE, ROW_SIZE, TRACKER_SUBCHUNKS, MAX_TRACKERS
+
+# Encoder for PSN packets: the wire constants and chunk helpers, info packets, and
+# PSNEncoder, the inverse of parse_psn_data_packet, which turns TRACKER_DTYPE rows back
+# into the data packets of one frame.
+#
+# Every tracker is written with the sub-chunks of its 'fields' mask. Rows are grouped by
+# mask, and all trackers of a group share one chunk layout, so a group is encoded by
+# copying byte columns from the rows into a (trackers, chunk size) block, the reverse of
+# TrackerFrame._decode_uniform. Chunks go to a preallocated scratch buffer and packets to
+# preallocated bytearrays; encode() allocates nothing per tracker.
+
+# PSN version written into packet headers
+VERSION_HIGH = 2
+VERSION_LOW = 3
+MAX_PACKET_SIZE = 1500
+# Seconds between info packets of a PSN stream
+INFO_INTERVAL = 1.0
+
+# Field bits that map to a sub-chunk; any others (such as FIELD_STALE) are not encoded
+FIELD_MASK = 0
+for _layout in TRACKER_SUBCHUNKS.values():
+    FIELD_MASK |= _layout[2]
+# Largest tracker chunk: the tracker header and every sub-chunk
+MAX_CHUNK_SIZE = CHUNK_HEADER.size + sum(CHUNK_HEADER.size + length for _, length, _ in TRACKER_SUBCHUNKS.values())
+# Packet chunk, packet header chunk and tracker list chunk headers
+PACKET_OVERHEAD = 3 * CHUNK_HEADER.size + PACKET_HEADER.size
+# A frame has at most 255 packets (frame_packet_count is a u8)
+MAX_FRAME_PACKETS = 0xFF
+
+
+def chunk_header(chunk_id, data_len, has_subchunks=False):
+    return chunk_id | (data_len << 16) | (int(has_subchunks) << 31)
+
+
+def encode_chunk(chunk_id, payload, has_subchunks=False):
+    return CHUNK_HEADER.pack(chunk_header(chunk_id, len(payload), has_subchunks)) + payload
+
+
+def encode_packet_header(timestamp, frame_id, frame_packet_count):
+    return encode_chunk(PSN_DATA_PACKET_HEADER,
+                        PACKET_HEADER.pack(timestamp, VERSION_HIGH, VERSION_LOW, frame_id, frame_packet_count))
+
+
+# Splits encoded tracker chunks into groups that fit a packet of max_packet_size bytes
+# after the given per-packet overhead
+def split_trackers(tracker_chunks, overhead, max_packet_size):
+    groups = []
+    group = []
+    size = overhead
+    for tracker_chunk in tracker_chunks:
+        if group and size + len(tracker_chunk) > max_packet_size:
+            groups.append(group)
+            group = []
+            size = overhead
+        group.append(tracker_chunk)
+        size += len(tracker_chunk)
+    groups.append(group)
+    return groups
+
+
+# Info packets announcing trackers ({tracker ID: name}) as one frame
+def encode_info_packets(system_name, trackers, timestamp=0, frame_id=0, max_packet_size=MAX_PACKET_SIZE):
+    system_name_chunk = encode_chunk(PSN_INFO_SYSTEM_NAME, system_name.encode())
+    tracker_chunks = [encode_chunk(tracker_id, encode_chunk(PSN_INFO_TRACKER_NAME, name.encode()), True)
+                      for tracker_id, name in sorted(trackers.items())]
+    overhead = 3 * CHUNK_HEADER.size + PACKET_HEADER.size + len(system_name_chunk) + CHUNK_HEADER.size
+    groups = split_trackers(tracker_chunks, overhead, max_packet_size)
+    packets = []
+    for group in groups:
+        header = encode_chunk(PSN_INFO_PACKET_HEADER,
+                              PACKET_HEADER.pack(timestamp, VERSION_HIGH, VERSION_LOW, frame_id, len(groups)))
+        tracker_list = encode_chunk(PSN_INFO_TRACKER_LIST, b''.join(group), True)
+        packets.append(encode_chunk(PSN_INFO_PACKET, header + system_name_chunk + tracker_list, True))
+    return packets
+
+
+# Chunk layout of the trackers with one fields mask: the chunk size, a template row
+# holding the constant sub-chunk headers, and (offset in chunk, offset in row, length)
+# for each payload
+class ChunkLayout:
+    def __init__(self, fields):
+        self.copies = []
+        template = [0]
+        position = CHUNK_HEADER.size
+        for subchunk_id, (row_offset, length, bit) in sorted(TRACKER_SUBCHUNKS.items()):
+            if fields & bit:
+                template.append(chunk_header(subchunk_id, length))
+                template.extend([0] * (length // 4))
+                self.copies.append((position + CHUNK_HEADER.size, row_offset, length))
+                position += CHUNK_HEADER.size + length
+        self.size = position
+        self.header = chunk_header(0, position - CHUNK_HEADER.size, True)
+        self.template = np.array(template, dtype='<u4').view(np.uint8)
+
+
+class PSNEncoder:
+    def __init__(self, max_packet_size=MAX_PACKET_SIZE, capacity=MAX_TRACKERS):
+        if max_packet_size < PACKET_OVERHEAD + MAX_CHUNK_SIZE:
+            raise ValueError(f"max_packet_size {max_packet_size} cannot hold a tracker")
+        self.max_packet_size = max_packet_size
+        self._scratch = np.zeros(capacity * MAX_CHUNK_SIZE, dtype=np.uint8)
+        self._buffers = []
+        self._arrays = []
+        self._layouts = {}
+        self.frames = 0
+        self.packets = 0
+
+    def _layout(self, fields):
+        layout = self._layouts.get(fields)
+        if layout is None:
+            layout = self._layouts[fields] = ChunkLayout(fields)
+        return layout
+
+    # Encodes TRACKER_DTYPE rows as one frame and returns the packets as memoryviews into
+    # the encoder's buffers, valid until the next encode(). Rows without any encodable
+    # field are skipped.
+    def encode(self, rows, timestamp, frame_id):
+        fields = rows['fields'] & FIELD_MASK
+        keep = fields != 0
+        if not keep.all():
+            rows, fields = rows[keep], fields[keep]
+        if len(rows) * MAX_CHUNK_SIZE > len(self._scratch):
+            self._scratch = np.zeros(len(rows) * MAX_CHUNK_SIZE, dtype=np.uint8)
+
+        # One contiguous run of chunks per fields mask
+        order = np.argsort(fields, kind='stable')
+        masks, starts, counts = np.unique(fields[order], return_index=True, return_counts=True)
+        row_bytes = np.ascontiguousarray(rows, dtype=TRACKER_DTYPE).view(np.uint8).reshape(-1, ROW_SIZE)
+        sizes = np.empty(len(rows), dtype=np.int64)
+        offset = 0
+        for mask, start, count in zip(masks.tolist(), starts.tolist(), counts.tolist()):
+            layout = self._layout(mask)
+            group = order[start:start + count]
+            block = self._scratch[offset:offset + count * layout.size].reshape(count, layout.size)
+            block[:] = layout.template
+            block[:, :4].view('<u4')[:, 0] = rows['id'][group].astype(np.uint32) | layout.header
+            source = row_bytes[group]
+            for position, row_offset, length in layout.copies:
+                block[:, position:position + length] = source[:, row_offset:row_offset + length]
+            sizes[start:start + count] = layout.size
+            offset += count * layout.size
+
+        # Greedy split: each packet takes as many whole chunks as fit
+        ends = np.cumsum(sizes)
+        room = self.max_packet_size - PACKET_OVERHEAD
+        bounds = [0]
+        while bounds[-1] < len(rows):
+            used = ends[bounds[-1] - 1] if bounds[-1] else 0
+            bounds.append(int(np.searchsorted(ends, used + room, side='right')))
+        if len(bounds) == 1:
+            bounds.append(0)
+        packet_count = len(bounds) - 1
+        if packet_count > MAX_FRAME_PACKETS:
+            raise ValueError(f"{len(rows)} trackers need {packet_count} packets, more than a frame can have")
+
+        packets = []
+        for index in range(packet_count):
+            first, last = bounds[index], bounds[index + 1]
+            chunk_start = int(ends[first - 1]) if first else 0
+            chunk_end = int(ends[last - 1]) if last else 0
+            packets.append(self._packet(index, timestamp, frame_id, packet_count, chunk_start, chunk_end))
+        self.frames += 1
+        self.packets += packet_count
+        return packets
+
+    def _packet(self, index, timestamp, frame_id, packet_count, chunk_start, chunk_end):
+        while len(self._buffers) <= index:
+            buffer = bytearray(self.max_packet_size)
+            self._buffers.append(buffer)
+            self._arrays.append(np.frombuffer(buffer, dtype=np.uint8))
+        buffer = self._buffers[index]
+        list_length = chunk_end - chunk_start
+        size = PACKET_OVERHEAD + list_length
+        pack = CHUNK_HEADER.pack_into
+        pack(buffer, 0, chunk_header(PSN_DATA_PACKET, size - CHUNK_HEADER.size, True))
+        pack(buffer, 4, chunk_header(PSN_DATA_PACKET_HEADER, PACKET_HEADER.size))
+        PACKET_HEADER.pack_into(buffer, 8, timestamp, VERSION_HIGH, VERSION_LOW, frame_id & 0xFF, packet_count)
+        pack(buffer, 8 + PACKET_HEADER.size, chunk_header(PSN_DATA_TRACKER_LIST, list_length, True))
+        self._arrays[index][PACKET_OVERHEAD:size] = self._scratch[chunk_start:chunk_end]
+        return memoryview(buffer)[:size]
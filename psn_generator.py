@@ -0,0 +1,180 @@
+import argparse
+import random
+import socket
+import time
+import numpy as np
+from psn_decoder import CHUNK_HEADER, PACKET_HEADER, PSN_DATA_PACKET, PSN_DATA_TRACKER_LIST
+from psn_encoder import (chunk_header, encode_chunk, encode_packet_header, encode_info_packets, MAX_PACKET_SIZE,
+                         INFO_INTERVAL)
+
+# Synthetic PSN traffic: valid info and data packets for any number of moving trackers,
+# split across packets like a media server does, with optional loss and reordering.
+#
+#     python psn_generator.py --trackers 200 --rate 60                # send to the PSN group
+#     python psn_generator.py --trackers 50 --loss 0.01 --reorder 0.01
+
+# Every data tracker chunk carries all sub-chunks, so its layout is fixed and a frame is
+# encoded by filling columns of a structured array. Each sub-chunk is its header word
+# followed by the payload the decoder expects.
+TRACKER_CHUNK_DTYPE = np.dtype([
+    ('header', '<u4'),
+    ('pos_header', '<u4'), ('pos', '<f4', 3),
+    ('speed_header', '<u4'), ('speed', '<f4', 3),
+    ('ori_header', '<u4'), ('ori', '<f4', 3),
+    ('status_header', '<u4'), ('status', '<f4'),
+    ('accel_header', '<u4'), ('accel', '<f4', 3),
+    ('trgtpos_header', '<u4'), ('trgtpos', '<f4', 3),
+    ('timestamp_header', '<u4'), ('timestamp', '<u8'),
+])
+TRACKER_SUBCHUNK_IDS = (('pos', 0), ('speed', 1), ('ori', 2), ('status', 3), ('accel', 4), ('trgtpos', 5),
+                        ('timestamp', 6))
+
+
+# Data packets carrying a TRACKER_CHUNK_DTYPE array as one frame
+def encode_data_packets(tracker_chunks, timestamp=0, frame_id=0, max_packet_size=MAX_PACKET_SIZE):
+    overhead = 3 * CHUNK_HEADER.size + PACKET_HEADER.size + CHUNK_HEADER.size
+    per_packet = max(1, (max_packet_size - overhead) // TRACKER_CHUNK_DTYPE.itemsize)
+    packet_count = max(1, -(-len(tracker_chunks) // per_packet))
+    if packet_count > 0xFF:
+        raise ValueError(f"{len(tracker_chunks)} trackers need {packet_count} packets, more than a frame can have")
+    header = encode_packet_header(timestamp, frame_id, packet_count)
+    packets = []
+    for start in range(0, max(len(tracker_chunks), 1), per_packet):
+        tracker_list = tracker_chunks[start:start + per_packet].tobytes()
+        body = header + CHUNK_HEADER.pack(chunk_header(PSN_DATA_TRACKER_LIST, len(tracker_list), True)) + tracker_list
+        packets.append(encode_chunk(PSN_DATA_PACKET, body, True))
+    return packets
+
+
+def new_tracker_chunks(tracker_ids):
+    chunks = np.zeros(len(tracker_ids), dtype=TRACKER_CHUNK_DTYPE)
+    chunks['header'] = [chunk_header(tracker_id, TRACKER_CHUNK_DTYPE.itemsize - CHUNK_HEADER.size, True)
+                        for tracker_id in tracker_ids]
+    for name, subchunk_id in TRACKER_SUBCHUNK_IDS:
+        chunks[name + '_header'] = chunk_header(subchunk_id, TRACKER_CHUNK_DTYPE.fields[name][0].itemsize)
+    return chunks
+
+
+# Trackers moving on circles of different radii and speeds around the stage centre
+class SyntheticShow:
+    def __init__(self, tracker_count, seed=0):
+        rng = np.random.default_rng(seed)
+        self.tracker_ids = list(range(tracker_count))
+        self.names = {tracker_id: f"Tracker {tracker_id}" for tracker_id in self.tracker_ids}
+        self.radius = rng.uniform(1.0, 10.0, tracker_count).astype(np.float32)
+        self.angular_speed = rng.uniform(0.2, 2.0, tracker_count).astype(np.float32)
+        self.phase = rng.uniform(0.0, 2 * np.pi, tracker_count).astype(np.float32)
+        self.height = rng.uniform(0.0, 2.0, tracker_count).astype(np.float32)
+        self.chunks = new_tracker_chunks(self.tracker_ids)
+        self.chunks['status'] = 1.0
+
+    # Fills the tracker chunks with every tracker's state at time t (seconds)
+    def at(self, t, timestamp=0):
+        angle = self.angular_speed * t + self.phase
+        cos, sin = np.cos(angle), np.sin(angle)
+        chunks = self.chunks
+        chunks['pos'][:, 0] = self.radius * cos
+        chunks['pos'][:, 1] = self.radius * sin
+        chunks['pos'][:, 2] = self.height
+        chunks['speed'][:, 0] = -self.radius * self.angular_speed * sin
+        chunks['speed'][:, 1] = self.radius * self.angular_speed * cos
+        chunks['accel'][:, 0] = -self.radius * self.angular_speed ** 2 * cos
+        chunks['accel'][:, 1] = -self.radius * self.angular_speed ** 2 * sin
+        chunks['ori'][:, 2] = angle
+        chunks['trgtpos'] = chunks['pos']
+        chunks['timestamp'] = timestamp
+        return chunks
+
+
+# Produces the packets of a SyntheticShow frame by frame. loss is the probability of
+# dropping a packet and reorder the probability of swapping it with the next one.
+# Packet timestamps are microseconds of the wall clock, so a receiver on the same host
+# can measure latency from them.
+class PSNGenerator:
+    def __init__(self, tracker_count, frame_rate=60.0, system_name='PSN Generator', max_packet_size=MAX_PACKET_SIZE,
+                 loss=0.0, reorder=0.0, info_interval=INFO_INTERVAL, seed=0):
+        self.show = SyntheticShow(tracker_count, seed)
+        self.frame_rate = frame_rate
+        self.system_name = system_name
+        self.max_packet_size = max_packet_size
+        self.loss = loss
+        self.reorder = reorder
+        self.info_interval = info_interval
+        self.frame_id = 0
+        self.frames = 0
+        self.packets = 0
+        self.dropped = 0
+        self._random = random.Random(seed)
+        self._next_info = 0.0
+
+    def frame(self, t):
+        timestamp = time.time_ns() // 1000
+        packets = []
+        if t >= self._next_info:
+            packets += encode_info_packets(self.system_name, self.show.names, timestamp, self.frame_id,
+                                           self.max_packet_size)
+            self._next_info = t + self.info_interval
+        packets += encode_data_packets(self.show.at(t, timestamp), timestamp, self.frame_id, self.max_packet_size)
+        self.frame_id = (self.frame_id + 1) & 0xFF
+        self.frames += 1
+        return self._impair(packets)
+
+    def _impair(self, packets):
+        if self.loss:
+            kept = [packet for packet in packets if self._random.random() >= self.loss]
+            self.dropped += len(packets) - len(kept)
+            packets = kept
+        if self.reorder:
+            for i in range(len(packets) - 1):
+                if self._random.random() < self.reorder:
+                    packets[i], packets[i + 1] = packets[i + 1], packets[i]
+        self.packets += len(packets)
+        return packets
+
+    # Sends frames at frame_rate through send(packet) for the given number of seconds
+    def run(self, send, seconds=None):
+        interval = 1.0 / self.frame_rate
+        start = time.perf_counter()
+        frame = 0
+        while seconds is None or frame * interval < seconds:
+            delay = start + frame * interval - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            for packet in self.frame(frame * interval):
+                send(packet)
+            frame += 1
+
+
+def multicast_sender(group, port, ttl=1):
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_UDP)
+    sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_TTL, ttl)
+    destination = (group, port)
+
+    def send(packet):
+        sock.sendto(packet, destination)
+    return send
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Send synthetic PSN traffic')
+    parser.add_argument('--trackers', type=int, default=10)
+    parser.add_argument('--rate', type=float, default=60.0, help='frames per second')
+    parser.add_argument('--seconds', type=float, default=None)
+    parser.add_argument('--packet-size', type=int, default=MAX_PACKET_SIZE)
+    parser.add_argument('--loss', type=float, default=0.0)
+    parser.add_argument('--reorder', type=float, default=0.0)
+    parser.add_argument('--group', default='236.10.10.10')
+    parser.add_argument('--port', type=int, default=56565)
+    args = parser.parse_args()
+
+    generator = PSNGenerator(args.trackers, args.rate, max_packet_size=args.packet_size, loss=args.loss,
+                             reorder=args.reorder)
+    print(f"Sending {args.trackers} trackers at {args.rate:g} Hz to {args.group}:{args.port}")
+    try:
+        generator.run(multicast_sender(args.group, args.port), args.seconds)
+    except KeyboardInterrupt:
+        pass
+    print(f"Sent {generator.frames} frames in {generator.packets} packets ({generator.dropped} dropped)")
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,9 @@
 import socket
 import struct
 import logging
-from logging.handlers import RotatingFileHandler
-import re
+from log_setup import setup_logging, install_verbosity_toggle, PacketSummary
+from tracker_registry import TrackerRegistry
+from psn_decoder import parse_chunks, format_tracker_list
 
 MULTICAST_GROUP = '236.10.10.10'
 PORT = 56565
@@ -13,124 +14,25 @@ LOG_TO_FILE = False
 LOG_TO_CONSOLE = True
 DISPLAY_TRACKER_UPDATES = True
 LOG_FILE = 'psn_receiver.log'
+# Per-packet details are logged at DEBUG; send SIGUSR1 to toggle DEBUG at runtime
+LOG_LEVEL = logging.INFO
+PACKET_SUMMARY_INTERVAL = 5.0
 
 # Set up logging
-logger = logging.getLogger('PSNReceiver')
-logger.setLevel(logging.DEBUG)
-formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
-
-if LOG_TO_FILE:
-    file_handler = RotatingFileHandler(LOG_FILE, maxBytes=1024*1024, backupCount=5)
-    file_handler.setFormatter(formatter)
-    logger.addHandler(file_handler)
-
-if LOG_TO_CONSOLE:
-    console_handler = logging.StreamHandler()
-    console_handler.setFormatter(formatter)
-    logger.addHandler(console_handler)
-
-class PSNChunkHeader:
-    def __init__(self, raw_header):
-        try:
-            header = struct.unpack('<I', raw_header)[0]
-            self.id = header & 0xFFFF
-            self.data_len = (header >> 16) & 0x7FFF
-            self.has_subchunks = (header >> 31) & 0x01
-        except struct.error as e:
-            logger.error(f"Failed to unpack PSNChunkHeader: {e}")
-            self.id = 0
-            self.data_len = 0
-            self.has_subchunks = 0
-
-    def __str__(self):
-        return f"Chunk ID: {self.id}, Data Length: {self.data_len}, Has Subchunks: {self.has_subchunks}"
-
-class PSNInfoPacketHeader:
-    def __init__(self, data):
-        try:
-            self.timestamp, = struct.unpack('<Q', data[:8])
-            self.version_high, = struct.unpack('<B', data[8:9])
-            self.version_low, = struct.unpack('<B', data[9:10])
-            self.frame_id, = struct.unpack('<B', data[10:11])
-            self.frame_packet_count, = struct.unpack('<B', data[11:12])
-        except struct.error as e:
-            logger.error(f"Failed to unpack PSNInfoPacketHeader: {e}")
-            self.timestamp = 0
-            self.version_high = 0
-            self.version_low = 0
-            self.frame_id = 0
-            self.frame_packet_count = 0
-
-    def __str__(self):
-        return (f"Timestamp: {self.timestamp}, Version High: {self.version_high}, "
-                f"Version Low: {self.version_low}, Frame ID: {self.frame_id}, "
-                f"Frame Packet Count: {self.frame_packet_count}")
-
-def parse_chunks(data, offset=0):
-    chunks = []
-    while offset < len(data):
-        try:
-            chunk_header = PSNChunkHeader(data[offset:offset+4])
-            offset += 4
-            chunk_data = data[offset:offset + chunk_header.data_len]
-            offset += chunk_header.data_len
-            if chunk_header.id == 0x6756:
-                chunks.append(('PSN_INFO_PACKET', parse_psn_info_packet(chunk_data)))
-            # Ignore other chunk types for now...
-        except Exception as e:
-            logger.error(f"Error parsing chunk: {e}")
-            break
-    return chunks
-
-def parse_psn_info_packet(data):
-    chunks = []
-    offset = 0
-    while offset < len(data):
-        try:
-            chunk_header = PSNChunkHeader(data[offset:offset+4])
-            offset += 4
-            chunk_data = data[offset:offset + chunk_header.data_len]
-            offset += chunk_header.data_len
-            if chunk_header.id == 0x0000:
-                chunks.append(('PSN_INFO_PACKET_HEADER', PSNInfoPacketHeader(chunk_data)))
-            elif chunk_header.id == 0x0001:
-                chunks.append(('PSN_INFO_SYSTEM_NAME', chunk_data.decode('utf-8').strip('\x00')))
-            elif chunk_header.id == 0x0002:
-                chunks.append(('PSN_INFO_TRACKER_LIST', parse_psn_info_tracker_list(chunk_data)))
-            else:
-                chunks.append(('UNKNOWN_CHUNK', chunk_data))
-        except Exception as e:
-            logger.error(f"Error parsing PSN info packet: {e}")
-            break
-    return chunks
-
-def parse_psn_info_tracker_list(data):
-    chunks = []
-    offset = 0
-    while offset < len(data):
-        try:
-            chunk_header = PSNChunkHeader(data[offset:offset+4])
-            offset += 4
-            chunk_data = data[offset:offset + chunk_header.data_len]
-            offset += chunk_header.data_len
-            tracker_id = chunk_header.id
-            tracker_name = re.sub(r'[^\x20-\x7E]+', '', chunk_data.decode('utf-8')).strip()
-            chunks.append((tracker_name, tracker_id))
-        except Exception as e:
-            logger.error(f"Error parsing PSN info tracker list: {e}")
-            break
-    return chunks
-
-def format_tracker_list(tracker_list):
-    formatted_list = []
-    for tracker_name, tracker_id in tracker_list:
-        formatted_list.append(f"    TrackerID: {tracker_id:<5} Name: {tracker_name}")
-    return "\n".join(formatted_list)
+logger = setup_logging('PSNReceiver', LOG_FILE if LOG_TO_FILE else None, LOG_TO_CONSOLE, LOG_LEVEL)
+packet_summary = PacketSummary(logger, PACKET_SUMMARY_INTERVAL)
 
 # Store available trackers and active frame IDs
-trackers = {}
+tracker_registry = TrackerRegistry()
 active_frame_id = None
 
+def display_tracker_events(events):
+    for event in events:
+        logger.info("Tracker update: %s", event)
+
+if DISPLAY_TRACKER_UPDATES:
+    tracker_registry.subscribe(display_tracker_events)
+
 def start_udp_receiver():
     global active_frame_id
     sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_UDP)
@@ -139,50 +41,43 @@ def start_udp_receiver():
     mreq = struct.pack("4sl", socket.inet_aton(MULTICAST_GROUP), socket.INADDR_ANY)
     sock.setsockopt(socket.IPPROTO_IP, socket.IP_ADD_MEMBERSHIP, mreq)
 
+    install_verbosity_toggle('PSNReceiver')
     logger.info("Starting UDP receiver...")
     while True:
         try:
             data, addr = sock.recvfrom(MAX_PACKET_SIZE)
             ip_address = addr[0]
+            debug = logger.isEnabledFor(logging.DEBUG)
             chunks = parse_chunks(data)
             for chunk_type, chunk_data in chunks:
                 if chunk_type == 'PSN_INFO_PACKET':
+                    packet_summary.count('info', ip_address)
                     system_name = None
+                    info_header = None
                     tracker_list = []
                     for sub_chunk_type, sub_chunk_data in chunk_data:
                         if sub_chunk_type == 'PSN_INFO_PACKET_HEADER':
                             active_frame_id = sub_chunk_data.frame_id
-                            logger.info(f"  {sub_chunk_type}: {sub_chunk_data}")
+                            info_header = sub_chunk_data
                         elif sub_chunk_type == 'PSN_INFO_SYSTEM_NAME':
                             system_name = sub_chunk_data
-                            logger.info(f"  PSN_INFO_SYSTEM_NAME: {system_name}")
                         elif sub_chunk_type == 'PSN_INFO_TRACKER_LIST':
                             tracker_list = sub_chunk_data
-                            logger.info("  PSN_INFO_TRACKER_LIST:\n" + format_tracker_list(tracker_list))
-                        else:
-                            logger.info(f"  {sub_chunk_type}: {sub_chunk_data}")
-
-                    # Update the trackers dictionary
-                    new_trackers = {}
-                    for tracker_name, tracker_id in tracker_list:
-                        new_trackers[tracker_name] = {
-                            'id': tracker_id,
-                            'system_name': system_name,
-                            'ip_address': ip_address
-                        }
-                    
-                    # Remove trackers not in the current frame
-                    for tracker_name in list(trackers):
-                        if tracker_name not in new_trackers:
-                            del trackers[tracker_name]
-
-                    # Add or update trackers from the current frame
-                    trackers.update(new_trackers)
-
-                    if DISPLAY_TRACKER_UPDATES:
-                        print(f"Updated trackers: {trackers}")
+                        if debug:
+                            if sub_chunk_type == 'PSN_INFO_TRACKER_LIST':
+                                logger.debug("  PSN_INFO_TRACKER_LIST:\n%s", format_tracker_list(sub_chunk_data))
+                            else:
+                                logger.debug("  %s: %s", sub_chunk_type, sub_chunk_data)
+
+                    # Apply only what changed in this server's tracker list
+                    if info_header is None:
+                        tracker_registry.update(ip_address, system_name, tracker_list)
+                    else:
+                        tracker_registry.update(ip_address, system_name, tracker_list,
+                                                info_header.frame_id, info_header.frame_packet_count)
+            packet_summary.tick()
         except Exception as e:
-            logger.error(f"Error receiving data: {e}")
+            logger.error("Error receiving data: %s", e)
 
 if __name__ == "__main__":
     start_udp_receiver()
@@ -0,0 +1,130 @@
+import select
+import socket
+import struct
+import sys
+import time
+
+# Linux socket options are often not exported by the socket module; their values come
+# from <asm-generic/socket.h>. Other platforms number their options differently, so
+# there the fallback is None and the option is reported as unavailable.
+LINUX = sys.platform.startswith('linux')
+
+# Default PSN multicast group and port, shared by the threaded and asyncio receivers
+MULTICAST_GROUP = '236.10.10.10'
+PORT = 56565
+# Requested socket receive buffer, sized to absorb bursts while a frame is processed
+SOCKET_RCVBUF = 4 * 1024 * 1024
+
+
+def _socket_option(name, linux_value):
+    return getattr(socket, name, linux_value if LINUX else None)
+
+
+# Linux socket option that attaches the kernel's count of datagrams dropped on this
+# socket (receive queue overflow) to every received message
+SO_RXQ_OVFL = _socket_option('SO_RXQ_OVFL', 40)
+
+DROP_COUNTER = struct.Struct('=I')
+
+# Linux socket option that attaches the kernel's CLOCK_REALTIME receive time of every
+# datagram as a struct timespec
+SO_TIMESTAMPNS = _socket_option('SO_TIMESTAMPNS', 35)
+TIMESPEC = struct.Struct('=qq')
+
+
+# reuse_port lets several processes bind the group and port. Every one of them receives
+# a copy of each multicast datagram; the kernel only load-balances unicast.
+def open_multicast_socket(group, port, rcvbuf=None, blocking=True, reuse_port=False):
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_UDP)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    if reuse_port and hasattr(socket, 'SO_REUSEPORT'):
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+    if rcvbuf:
+        # The kernel caps this at net.core.rmem_max (doubled for bookkeeping)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, rcvbuf)
+    sock.bind((group, port))
+    mreq = struct.pack("4sl", socket.inet_aton(group), socket.INADDR_ANY)
+    sock.setsockopt(socket.IPPROTO_IP, socket.IP_ADD_MEMBERSHIP, mreq)
+    sock.setblocking(blocking)
+    return sock
+
+
+def enable_drop_counter(sock):
+    if SO_RXQ_OVFL is None:
+        return False
+    try:
+        sock.setsockopt(socket.SOL_SOCKET, SO_RXQ_OVFL, 1)
+        return True
+    except OSError:
+        return False
+
+
+def enable_kernel_timestamps(sock):
+    if SO_TIMESTAMPNS is None:
+        return False
+    try:
+        sock.setsockopt(socket.SOL_SOCKET, SO_TIMESTAMPNS, 1)
+        return True
+    except OSError:
+        return False
+
+
+# Fixed ring of preallocated receive buffers. drain() reads every datagram pending on a
+# non-blocking socket into the ring with recvmsg_into, so a wakeup costs one select and
+# no allocation per packet. The memoryviews it returns point into the ring and are only
+# valid until the next drain(). received_at is the time.perf_counter_ns() reading taken
+# when the socket became readable, shared by every packet of the drain. arrivals[i] is
+# the time.monotonic_ns() at which the i-th packet of the drain reached the host: the
+# kernel's receive timestamp when enable_kernel_timestamps() is on, otherwise the time of
+# the drain.
+class PacketRing:
+    def __init__(self, slots=64, packet_size=1500):
+        self.packet_size = packet_size
+        self._buffers = [bytearray(packet_size) for _ in range(slots)]
+        self._views = [memoryview(buffer) for buffer in self._buffers]
+        self._ancbufsize = socket.CMSG_SPACE(DROP_COUNTER.size) + socket.CMSG_SPACE(TIMESPEC.size)
+        self.packets = 0
+        self.bytes = 0
+        self.truncated = 0
+        self.kernel_drops = 0
+        self.drains = 0
+        self.received_at = 0
+        self.arrivals = []
+        self.kernel_timestamps = 0
+
+    def drain(self, sock, timeout=None):
+        received = []
+        arrivals = self.arrivals = []
+        if timeout is not None:
+            readable, _, _ = select.select([sock], [], [], timeout)
+            if not readable:
+                return received
+        self.received_at = time.perf_counter_ns()
+        now = time.monotonic_ns()
+        # Kernel timestamps are wall clock; shift them onto the monotonic clock
+        realtime_offset = now - time.time_ns()
+        self.drains += 1
+        views = self._views
+        ancbufsize = self._ancbufsize
+        for view in views:
+            try:
+                nbytes, ancdata, msg_flags, address = sock.recvmsg_into([view], ancbufsize)
+            except (BlockingIOError, InterruptedError):
+                break
+            arrival = now
+            for level, kind, data in ancdata:
+                if level == socket.SOL_SOCKET:
+                    if kind == SO_RXQ_OVFL:
+                        self.kernel_drops = DROP_COUNTER.unpack_from(data)[0]
+                    elif kind == SO_TIMESTAMPNS:
+                        seconds, nanoseconds = TIMESPEC.unpack_from(data)
+                        arrival = seconds * 1000000000 + nanoseconds + realtime_offset
+                        self.kernel_timestamps += 1
+            if msg_flags & socket.MSG_TRUNC:
+                self.truncated += 1
+                continue
+            self.packets += 1
+            self.bytes += nbytes
+            received.append((view[:nbytes], address))
+            arrivals.append(arrival)
+        return received
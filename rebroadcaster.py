@@ -0,0 +1,134 @@
+import socket
+import time
+import numpy as np
+from psn_encoder import PSNEncoder, encode_info_packets, MAX_PACKET_SIZE, INFO_INTERVAL
+from tracker_frame import MAX_TRACKERS
+from coordinate_spaces import transform_rows
+from frame_assembler import FIELD_STALE
+
+# Re-emits decoded frames as PSN on other multicast groups or hosts.
+#
+# Frames can be reduced to a set of tracker IDs, have their trackers renumbered and
+# renamed, be moved into another coordinate system with a 4x4 transform, and be sent at
+# a lower rate than they arrive (120 Hz in, 30 Hz out). The output is a PSN stream of
+# its own: frame IDs count the frames actually sent, and info packets announcing the
+# output names are sent every info_interval seconds.
+
+SYSTEM_NAME = 'PSN Rebroadcast'
+MULTICAST_TTL = 1
+
+
+# One connected UDP socket per destination, so every packet is a plain send() with no
+# address lookup. Python has no sendmmsg; send_all() writes a frame's packets to every
+# destination in one tight loop instead.
+class PacketSender:
+    def __init__(self, destinations, ttl=MULTICAST_TTL, interface=None):
+        self.sockets = []
+        for host, port in destinations:
+            sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_UDP)
+            sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_TTL, ttl)
+            if interface:
+                sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_IF, socket.inet_aton(interface))
+            sock.connect((host, port))
+            self.sockets.append(sock)
+        self.packets = 0
+        self.errors = 0
+
+    def send_all(self, packets):
+        for sock in self.sockets:
+            send = sock.send
+            for packet in packets:
+                try:
+                    send(packet)
+                except OSError:
+                    self.errors += 1
+        self.packets += len(packets) * len(self.sockets)
+
+    def close(self):
+        for sock in self.sockets:
+            sock.close()
+
+
+# Filters, renumbers, renames, transforms and rate-converts the frames of one PSN source
+# and sends them through send(packets).
+#
+#   tracker_ids  input tracker IDs to keep (None keeps all)
+#   id_map       {input ID: output ID}; unmapped trackers keep their ID
+#   rename       {output ID: name} overriding the names announced by the source
+#   transform    4x4 matrix applied with coordinate_spaces.transform_rows
+#   output_rate  frames per second to send at most (None sends every frame)
+#   names        names(source) -> {input ID: name} for the info packets
+#
+# Rate conversion sends the first frame at or after each output interval, timed by the
+# frames' packet timestamps (microseconds) so it follows the source's clock.
+class PSNRebroadcaster:
+    def __init__(self, send, tracker_ids=None, id_map=None, rename=None, transform=None, output_rate=None,
+                 names=None, system_name=SYSTEM_NAME, max_packet_size=MAX_PACKET_SIZE,
+                 info_interval=INFO_INTERVAL, include_stale=False, capacity=MAX_TRACKERS):
+        self.send = send
+        self.capacity = capacity
+        self.keep = np.ones(capacity, dtype=bool)
+        if tracker_ids is not None:
+            self.keep[:] = False
+            self.keep[[tracker_id for tracker_id in tracker_ids if tracker_id < capacity]] = True
+        self.output_ids = np.arange(capacity, dtype=np.uint16)
+        for input_id, output_id in (id_map or {}).items():
+            self.output_ids[input_id] = output_id
+        self.rename = dict(rename or {})
+        self.names = names
+        self.system_name = system_name
+        self.info_interval = info_interval
+        self.include_stale = include_stale
+        self.interval = 1e6 / output_rate if output_rate else 0.0
+        self.encoder = PSNEncoder(max_packet_size, capacity)
+        self.max_packet_size = max_packet_size
+
+        self.matrix = None if transform is None else np.asarray(transform, dtype=np.float64).reshape(4, 4)
+
+        self.frame_id = 0
+        self.frames_in = 0
+        self.frames_out = 0
+        self._next_due = None
+        self._next_info = 0.0
+
+    # Sends the frame if it is due; returns the number of packets sent
+    def send_frame(self, frame, now=None):
+        self.frames_in += 1
+        timestamp = frame.packet_timestamp
+        if self.interval:
+            due = self._next_due
+            # Start over when the source's clock jumped back or stopped for a while
+            if due is not None and (timestamp < due - 2 * self.interval or timestamp > due + 2 * self.interval):
+                due = None
+            if due is not None and timestamp < due:
+                return 0
+            self._next_due = (timestamp if due is None else due) + self.interval
+
+        if now is None:
+            now = time.monotonic()
+        packets = []
+        if self.names is not None and now >= self._next_info:
+            packets += self._info(frame.source, timestamp)
+            self._next_info = now + self.info_interval
+
+        trackers = frame.trackers[:self.capacity]
+        fields = trackers['fields']
+        selected = self.keep & (fields != 0)
+        if not self.include_stale:
+            selected &= fields & FIELD_STALE == 0
+        rows = trackers[selected]
+        rows['id'] = self.output_ids[rows['id']]
+        if self.matrix is not None:
+            transform_rows(rows, self.matrix)
+        packets += self.encoder.encode(rows, timestamp, self.frame_id)
+        self.frame_id = (self.frame_id + 1) & 0xFF
+        self.frames_out += 1
+        self.send(packets)
+        return len(packets)
+
+    # Info packets announcing the output IDs with their names
+    def _info(self, source, timestamp):
+        output = {int(self.output_ids[tracker_id]): name for tracker_id, name in self.names(source).items()
+                  if tracker_id < self.capacity and self.keep[tracker_id]}
+        output.update((tracker_id, name) for tracker_id, name in self.rename.items() if tracker_id in output)
+        return encode_info_packets(self.system_name, output, timestamp, self.frame_id, self.max_packet_size)
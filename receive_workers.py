@@ -0,0 +1,263 @@
+import logging
+import multiprocessing
+import os
+import queue
+import socket
+import struct
+import threading
+import time
+import zlib
+from multiprocessing.connection import Listener
+from log_setup import setup_logging, PacketSummary
+from psn_decoder import parse_chunks, data_frame, PSN_INFO_PACKET
+from frame_assembler import FrameAssembler
+from psn_socket import open_multicast_socket, enable_drop_counter, PacketRing
+from tracker_frame import TrackerFrame, MAX_TRACKERS
+from metrics import FrameSequence
+from forwarder import (IPCForwarder, encode_frame, decode_frame, encode_source_packet, RECORD_TRACKER_FRAME,
+                       RECORD_SOURCE_PACKET, RECORD_WORKER_STATS)
+
+# Multi-process receiving. Every worker process binds the PSN group with SO_REUSEPORT and
+# receives a copy of each datagram (the kernel does not load-balance multicast), but
+# only decodes and assembles packets from the sources it owns: shard_of() splits sources
+# across workers by a stable hash of their IP. Workers send assembled frames and raw
+# info packets to the supervisor, where FrameMerger turns them back into one stream.
+# As each source belongs to a single worker, its frames arrive in order. Data packets
+# never reach the supervisor, so workers also report their receive counters to it
+# every WORKER_STATS_INTERVAL (see WorkerStats).
+#
+# This scales with the number of PSN servers; a single server is still handled by a
+# single worker.
+
+logger = logging.getLogger('PSNReceiver')
+
+MERGE_ADDRESS = ('localhost', 6002)
+MERGE_AUTHKEY = b'psn_worker_key'
+# Seconds between checks for dead workers
+SUPERVISE_INTERVAL = 1.0
+WORKER_QUEUE_SIZE = 4096
+WORKER_BATCH_SIZE = 64
+WORKER_SUMMARY_INTERVAL = 30.0
+WORKER_STATS_INTERVAL = 1.0
+
+# PacketRing counters reported by the workers
+RING_COUNTERS = ('truncated', 'kernel_drops', 'drains', 'kernel_timestamps')
+# Increments of RING_COUNTERS, then the number of WORKER_STATS_SOURCE entries that follow
+WORKER_STATS_HEADER = struct.Struct('<IIIIH')
+# Source IPv4 address, data packets, bytes
+WORKER_STATS_SOURCE = struct.Struct('<4sII')
+
+
+def shard_of(source, count):
+    return zlib.crc32(source.encode()) % count
+
+
+# Receive counters of a worker, reported as increments since its previous report so a
+# restarted worker starts again from zero without the supervisor's totals going back.
+# Only owned data packets are counted per source: info packets are counted by the
+# supervisor when it handles them.
+class WorkerStats:
+    def __init__(self):
+        self.sources = {}
+        self._reported = dict.fromkeys(RING_COUNTERS, 0)
+
+    def count(self, source, nbytes):
+        totals = self.sources.get(source)
+        if totals is None:
+            totals = self.sources[source] = [0, 0]
+        totals[0] += 1
+        totals[1] += nbytes
+
+    def encode(self, ring):
+        increments = []
+        for name in RING_COUNTERS:
+            value = getattr(ring, name)
+            increments.append(value - self._reported[name])
+            self._reported[name] = value
+        parts = [WORKER_STATS_HEADER.pack(*increments, len(self.sources))]
+        for source, (packets, nbytes) in self.sources.items():
+            parts.append(WORKER_STATS_SOURCE.pack(socket.inet_aton(source), packets, nbytes))
+        self.sources = {}
+        return b''.join(parts)
+
+
+# Returns ({ring counter name: increment}, [(source, packets, bytes)])
+def decode_worker_stats(payload):
+    *increments, source_count = WORKER_STATS_HEADER.unpack_from(payload)
+    sources = []
+    for i in range(source_count):
+        address, packets, nbytes = WORKER_STATS_SOURCE.unpack_from(
+            payload, WORKER_STATS_HEADER.size + i * WORKER_STATS_SOURCE.size)
+        sources.append((socket.inet_ntoa(address), packets, nbytes))
+    return dict(zip(RING_COUNTERS, increments)), sources
+
+
+def run_worker(index, count, group, port, rcvbuf=None, address=MERGE_ADDRESS, authkey=MERGE_AUTHKEY):
+    worker_logger = setup_logging(f'PSNWorker{index}')
+    summary = PacketSummary(worker_logger, WORKER_SUMMARY_INTERVAL, label=f'Worker {index} packets')
+    sock = open_multicast_socket(group, port, rcvbuf=rcvbuf, blocking=False, reuse_port=True)
+    enable_drop_counter(sock)
+    ring = PacketRing()
+    assembler = FrameAssembler()
+    forwarder = IPCForwarder(address, authkey, name=f'Worker{index}', max_queue=WORKER_QUEUE_SIZE,
+                             batch_size=WORKER_BATCH_SIZE)
+    forwarder.start()
+    owners = {}
+    parent = os.getppid()
+    kernel_drops = 0
+    stats = WorkerStats()
+    next_stats = time.monotonic() + WORKER_STATS_INTERVAL
+
+    def forward(frames):
+        for frame in frames:
+            forwarder.submit(RECORD_TRACKER_FRAME, encode_frame(frame))
+
+    worker_logger.info("Worker %d of %d receiving on %s:%d", index, count, group, port)
+    while os.getppid() == parent:
+        for data, addr in ring.drain(sock, assembler.timeout):
+            source = addr[0]
+            owner = owners.get(source)
+            if owner is None:
+                owner = owners[source] = shard_of(source, count)
+            if owner != index:
+                continue
+            summary.count('owned', source)
+            # Info packets are rare and the supervisor keeps the tracker registry, so
+            # they are passed on undecoded
+            if len(data) >= 2 and (data[0] | data[1] << 8) == PSN_INFO_PACKET:
+                forwarder.submit(RECORD_SOURCE_PACKET, encode_source_packet(source, data))
+                continue
+            stats.count(source, len(data))
+            try:
+                for chunk_type, chunk_data in parse_chunks(data):
+                    if chunk_type == 'PSN_DATA_PACKET':
+                        if any(sub_chunk_type == 'PSN_DATA_PACKET_HEADER' for sub_chunk_type, _ in chunk_data):
+                            forward(assembler.add(data_frame, source))
+            except Exception as e:
+                worker_logger.error("Error handling packet from %s: %s", source, e)
+        forward(assembler.expire())
+        if ring.kernel_drops != kernel_drops:
+            summary.count('kernel drops', amount=ring.kernel_drops - kernel_drops)
+            kernel_drops = ring.kernel_drops
+        now = time.monotonic()
+        if now >= next_stats:
+            next_stats = now + WORKER_STATS_INTERVAL
+            forwarder.submit(RECORD_WORKER_STATS, stats.encode(ring))
+        summary.tick()
+    forwarder.stop()
+
+
+# Starts and restarts the worker processes and collects the batches they send.
+# Workers are spawned rather than forked so they do not inherit the supervisor's
+# logging threads and sockets.
+class WorkerPool:
+    def __init__(self, count, group, port, rcvbuf=None, address=MERGE_ADDRESS, authkey=MERGE_AUTHKEY):
+        self.count = count
+        self.group = group
+        self.port = port
+        self.rcvbuf = rcvbuf
+        self.address = address
+        self.authkey = authkey
+        self.restarts = 0
+        self.batches = queue.SimpleQueue()
+        self.workers = [None] * count
+        self._context = multiprocessing.get_context('spawn')
+        self._listener = Listener(address, authkey=authkey)
+        self._next_check = 0.0
+
+    def start(self):
+        threading.Thread(target=self._accept, name='WorkerPoolAccept', daemon=True).start()
+        for index in range(self.count):
+            self._start_worker(index)
+
+    def _start_worker(self, index):
+        process = self._context.Process(target=run_worker, name=f'PSNWorker{index}', daemon=True,
+                                        args=(index, self.count, self.group, self.port, self.rcvbuf, self.address,
+                                              self.authkey))
+        process.start()
+        self.workers[index] = process
+
+    def _accept(self):
+        while True:
+            try:
+                conn = self._listener.accept()
+            except OSError:
+                return
+            threading.Thread(target=self._read, args=(conn,), daemon=True).start()
+
+    def _read(self, conn):
+        with conn:
+            while True:
+                try:
+                    self.batches.put(conn.recv_bytes())
+                except (EOFError, OSError):
+                    return
+
+    # Next batch of records from any worker, or None after timeout seconds
+    def get(self, timeout=None):
+        try:
+            return self.batches.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    # Restart workers that died, at most once per SUPERVISE_INTERVAL
+    def supervise(self, now=None):
+        if now is None:
+            now = time.monotonic()
+        if now < self._next_check:
+            return
+        self._next_check = now + SUPERVISE_INTERVAL
+        for index, process in enumerate(self.workers):
+            if not process.is_alive():
+                logger.warning("Receive worker %d exited with %s, restarting", index, process.exitcode)
+                self._start_worker(index)
+                self.restarts += 1
+
+    def stop(self):
+        for process in self.workers:
+            if process is not None:
+                process.terminate()
+        for process in self.workers:
+            if process is not None:
+                process.join()
+        self._listener.close()
+
+
+# Turns frame records from the workers back into TrackerFrames with the attributes
+# FrameAssembler gives its frames. A frame whose ID is not ahead of the last one merged
+# for its source (left over from a worker that was restarted) is dropped, so every
+# source's stream stays in order; a source whose IDs stay behind, because its server
+# restarted, is resynchronized after a few frames (see FrameSequence). The frame
+# returned for a source is reused for its next frame.
+class FrameMerger:
+    def __init__(self, capacity=MAX_TRACKERS):
+        self.capacity = capacity
+        self.sequence = FrameSequence()
+        self.latest = self.sequence.last
+        self.frames = {}
+        self.merged = 0
+        self.out_of_order = 0
+
+    def add(self, payload):
+        source, packet_timestamp, frame_id, frame_packet_count, packets_received, rows = decode_frame(payload)
+        sequence = self.sequence
+        distance = sequence.distance(source, frame_id)
+        if distance is not None and distance <= 0:
+            self.out_of_order += 1
+            if distance == 0 or not sequence.reject(source, frame_id):
+                return None
+        sequence.accept(source, frame_id)
+
+        frame = self.frames.get(source)
+        if frame is None:
+            frame = self.frames[source] = TrackerFrame(self.capacity)
+        frame.reset()
+        frame.trackers[rows['id']] = rows
+        frame.packet_timestamp = packet_timestamp
+        frame.frame_id = frame_id
+        frame.frame_packet_count = frame_packet_count
+        frame.source = source
+        frame.packets_received = packets_received
+        frame.complete = packets_received >= frame_packet_count
+        self.merged += 1
+        return frame
@@ -1,252 +1,407 @@
+import atexit
 import socket
-import struct
 import logging
-from logging.handlers import RotatingFileHandler
-import re
-from multiprocessing.connection import Client
+import time
+from log_setup import setup_logging, install_verbosity_toggle, PacketSummary
+from tracker_registry import TrackerRegistry
+from psn_decoder import parse_chunks, format_tracker_list, data_frame
+from frame_assembler import FrameAssembler
+from psn_socket import (open_multicast_socket, enable_drop_counter, enable_kernel_timestamps, PacketRing,
+                        MULTICAST_GROUP, PORT, SOCKET_RCVBUF)
+from shared_table import SharedTrackerTable, SHARED_TABLE_NAME
+from metrics import ReceiverMetrics
+from clock_sync import LatencyMonitor
+from recording import SessionRecorder
+from tracker_history import TrackerHistory
+from spatial_index import SpatialIndex
+from zones import ZoneEngine, load_zones, CONFIG_FILE
+from tracker_filters import load_filter
+from state_store import StateStore
+from rebroadcaster import PSNRebroadcaster, PacketSender
+from receive_workers import WorkerPool, FrameMerger, decode_worker_stats
+from forwarder import (IPCForwarder, encode_frame, iter_records, encode_source_packet, decode_source_packet,
+                       RECORD_TRACKER_FRAME, RECORD_SOURCE_PACKET, RECORD_WORKER_STATS, DROP_OLDEST)
 
-MULTICAST_GROUP = '236.10.10.10'
-PORT = 56565
 MAX_PACKET_SIZE = 1500
 
 # Configuration for logging
 LOG_TO_FILE = False
 LOG_TO_CONSOLE = True
 DISPLAY_TRACKER_UPDATES = True
+# Seconds without an info packet after which a PSN server's trackers are removed, and
+# how often that is checked
+TRACKER_TIMEOUT = 10.0
+STALE_TRACKER_CHECK_INTERVAL = 1.0
 LOG_FILE = 'psn_receiver.log'
+# Per-packet details are logged at DEBUG; send SIGUSR1 to toggle DEBUG at runtime
+LOG_LEVEL = logging.INFO
+# Seconds between packet count summaries
+PACKET_SUMMARY_INTERVAL = 5.0
 FORWARD_DATA_PACKETS = True
+FORWARD_INFO_PACKETS = True
+# Forwarding queue limits; records are dropped per FORWARD_DROP_POLICY when a parser falls behind
+FORWARD_QUEUE_SIZE = 4096
+FORWARD_BATCH_SIZE = 256
+FORWARD_DROP_POLICY = DROP_OLDEST
+# Publish the latest state of every tracker to a shared memory table for local readers
+PUBLISH_SHARED_TABLE = True
+# Keep the recent positions of every tracker (tracker_history.HISTORY_DEPTH) for time-based queries
+KEEP_HISTORY = True
+# Index every frame's tracker positions for radius and nearest-tracker queries
+INDEX_POSITIONS = True
+# Smooth tracker positions with the filter chosen in the "smoothing" section of config.json
+# before anything else sees them (see tracker_filters.py)
+SMOOTH_POSITIONS = True
+# Raise enter/exit/dwell events for the zones defined in config.json (see zones.py)
+ZONE_TRIGGERS = True
+DISPLAY_ZONE_EVENTS = True
+# Publish immutable snapshots of the latest frames and tracker names for the web server's
+# JSON API (see state_store.py)
+PUBLISH_STATE_SNAPSHOTS = True
 
-# Set up logging
-logger = logging.getLogger('PSNReceiver')
-logger.setLevel(logging.DEBUG)
-formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
-
-if LOG_TO_FILE:
-    file_handler = RotatingFileHandler(LOG_FILE, maxBytes=1024*1024, backupCount=5)
-    file_handler.setFormatter(formatter)
-    logger.addHandler(file_handler)
-
-if LOG_TO_CONSOLE:
-    console_handler = logging.StreamHandler()
-    console_handler.setFormatter(formatter)
-    logger.addHandler(console_handler)
-
-class PSNChunkHeader:
-    def __init__(self, raw_header):
-        try:
-            header = struct.unpack('<I', raw_header)[0]
-            self.id = header & 0xFFFF
-            self.data_len = (header >> 16) & 0x7FFF
-            self.has_subchunks = (header >> 31) & 0x01
-        except struct.error as e:
-            logger.error(f"Failed to unpack PSNChunkHeader: {e}")
-            self.id = 0
-            self.data_len = 0
-            self.has_subchunks = 0
-
-    def __str__(self):
-        return f"Chunk ID: {self.id}, Data Length: {self.data_len}, Has Subchunks: {self.has_subchunks}"
-
-class PSNInfoPacketHeader:
-    def __init__(self, data):
-        try:
-            self.timestamp, = struct.unpack('<Q', data[:8])
-            self.version_high, = struct.unpack('<B', data[8:9])
-            self.version_low, = struct.unpack('<B', data[9:10])
-            self.frame_id, = struct.unpack('<B', data[10:11])
-            self.frame_packet_count, = struct.unpack('<B', data[11:12])
-        except struct.error as e:
-            logger.error(f"Failed to unpack PSNInfoPacketHeader: {e}")
-            self.timestamp = 0
-            self.version_high = 0
-            self.version_low = 0
-            self.frame_id = 0
-            self.frame_packet_count = 0
-
-    def __str__(self):
-        return (f"Timestamp: {self.timestamp}, Version High: {self.version_high}, "
-                f"Version Low: {self.version_low}, Frame ID: {self.frame_id}, "
-                f"Frame Packet Count: {self.frame_packet_count}")
-
-class PSNDataPacketHeader:
-    def __init__(self, data):
-        try:
-            self.packet_timestamp, = struct.unpack('<Q', data[:8])
-            self.version_high, = struct.unpack('<B', data[8:9])
-            self.version_low, = struct.unpack('<B', data[9:10])
-            self.frame_id, = struct.unpack('<B', data[10:11])
-            self.frame_packet_count, = struct.unpack('<B', data[11:12])
-        except struct.error as e:
-            logger.error(f"Failed to unpack PSNDataPacketHeader: {e}")
-            self.packet_timestamp = 0
-            self.version_high = 0
-            self.version_low = 0
-            self.frame_id = 0
-            self.frame_packet_count = 0
-
-    def __str__(self):
-        return (f"Packet Timestamp: {self.packet_timestamp}, Version High: {self.version_high}, "
-                f"Version Low: {self.version_low}, Frame ID: {self.frame_id}, "
-                f"Frame Packet Count: {self.frame_packet_count}")
-
-def parse_chunks(data, offset=0):
-    chunks = []
-    while offset < len(data):
-        try:
-            chunk_header = PSNChunkHeader(data[offset:offset+4])
-            offset += 4
-            chunk_data = data[offset:offset + chunk_header.data_len]
-            offset += chunk_header.data_len
-            if chunk_header.id == 0x6756:
-                chunks.append(('PSN_INFO_PACKET', parse_psn_info_packet(chunk_data)))
-            elif chunk_header.id == 0x6757:
-                chunks.append(('PSN_DATA_PACKET', parse_psn_data_packet(chunk_data)))
-            # Ignore other chunk types for now...
-        except Exception as e:
-            logger.error(f"Error parsing chunk: {e}")
-            break
-    return chunks
-
-def parse_psn_info_packet(data):
-    chunks = []
-    offset = 0
-    while offset < len(data):
-        try:
-            chunk_header = PSNChunkHeader(data[offset:offset+4])
-            offset += 4
-            chunk_data = data[offset:offset + chunk_header.data_len]
-            offset += chunk_header.data_len
-            if chunk_header.id == 0x0000:
-                chunks.append(('PSN_INFO_PACKET_HEADER', PSNInfoPacketHeader(chunk_data)))
-            elif chunk_header.id == 0x0001:
-                chunks.append(('PSN_INFO_SYSTEM_NAME', chunk_data.decode('utf-8').strip('\x00')))
-            elif chunk_header.id == 0x0002:
-                chunks.append(('PSN_INFO_TRACKER_LIST', parse_psn_info_tracker_list(chunk_data)))
-            else:
-                chunks.append(('UNKNOWN_CHUNK', chunk_data))
-        except Exception as e:
-            logger.error(f"Error parsing PSN info packet: {e}")
-            break
-    return chunks
-
-def parse_psn_info_tracker_list(data):
-    chunks = []
-    offset = 0
-    while offset < len(data):
-        try:
-            chunk_header = PSNChunkHeader(data[offset:offset+4])
-            offset += 4
-            chunk_data = data[offset:offset + chunk_header.data_len]
-            offset += chunk_header.data_len
-            tracker_id = chunk_header.id
-            tracker_name = re.sub(r'[^\x20-\x7E]+', '', chunk_data.decode('utf-8')).strip()
-            chunks.append((tracker_name, tracker_id))
-        except Exception as e:
-            logger.error(f"Error parsing PSN info tracker list: {e}")
-            break
-    return chunks
-
-def parse_psn_data_packet(data):
-    chunks = []
-    offset = 0
-    while offset < len(data):
-        try:
-            chunk_header = PSNChunkHeader(data[offset:offset+4])
-            offset += 4
-            chunk_data = data[offset:offset + chunk_header.data_len]
-            offset += chunk_header.data_len
-            if chunk_header.id == 0x0000:
-                chunks.append(('PSN_DATA_PACKET_HEADER', PSNDataPacketHeader(chunk_data)))
-            else:
-                chunks.append(('UNKNOWN_CHUNK', chunk_data))
-        except Exception as e:
-            logger.error(f"Error parsing PSN data packet: {e}")
-            break
-    return chunks
+# Receive configuration. In batch mode every wakeup drains all pending datagrams into a
+# preallocated ring instead of making one recvfrom call per packet.
+BATCH_RECEIVE = True
+RECEIVE_RING_SLOTS = 64
+# Take packet arrival times from the kernel (SO_TIMESTAMPNS) rather than from the receive loop
+KERNEL_TIMESTAMPS = True
+# Number of receive worker processes. Above 1, workers each decode the packets of a share
+# of the PSN servers and this process merges their frames (see receive_workers.py).
+RECEIVE_WORKERS = 1
+
+# Re-emit the received frames as PSN (see rebroadcaster.py). The output is one PSN
+# stream, so only one source is re-emitted: REBROADCAST_SOURCE, or with None the first
+# source a frame arrives from.
+REBROADCAST = False
+REBROADCAST_DESTINATIONS = [('236.10.10.11', 56565)]
+REBROADCAST_SOURCE = None
+REBROADCAST_TRACKERS = None
+REBROADCAST_RATE = None
+
+# Record every received datagram for replay with recording.py. Recording turns on kernel
+# receive timestamps, since without them the packets of one batch share an arrival time.
+RECORD_SESSION = False
+RECORD_FILE = 'psn_session.rec'
 
-def format_tracker_list(tracker_list):
-    formatted_list = []
-    for tracker_name, tracker_id in tracker_list:
-        formatted_list.append(f"    TrackerID: {tracker_id:<5} Name: {tracker_name}")
-    return "\n".join(formatted_list)
+# Set up logging
+logger = setup_logging('PSNReceiver', LOG_FILE if LOG_TO_FILE else None, LOG_TO_CONSOLE, LOG_LEVEL)
+packet_summary = PacketSummary(logger, PACKET_SUMMARY_INTERVAL)
 
 # Store available trackers and active frame IDs
-trackers = {}
+tracker_registry = TrackerRegistry()
 active_frame_id = None
 
-def start_udp_receiver():
-    global active_frame_id
-    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_UDP)
-    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-    sock.bind((MULTICAST_GROUP, PORT))
-    mreq = struct.pack("4sl", socket.inet_aton(MULTICAST_GROUP), socket.INADDR_ANY)
-    sock.setsockopt(socket.IPPROTO_IP, socket.IP_ADD_MEMBERSHIP, mreq)
+next_stale_tracker_check = 0.0
+
+def remove_stale_trackers():
+    global next_stale_tracker_check
+    now = time.monotonic()
+    if now >= next_stale_tracker_check:
+        next_stale_tracker_check = now + STALE_TRACKER_CHECK_INTERVAL
+        tracker_registry.remove_stale(TRACKER_TIMEOUT, now)
+
+def display_tracker_events(events):
+    for event in events:
+        logger.info("Tracker update: %s", event)
+
+if DISPLAY_TRACKER_UPDATES:
+    tracker_registry.subscribe(display_tracker_events)
+
+# Snapshots read by other threads; only the receiver thread publishes new versions
+state_store = StateStore()
+
+if PUBLISH_STATE_SNAPSHOTS:
+    tracker_registry.subscribe(lambda events: state_store.publish_trackers(tracker_registry))
+
+# Zone triggers; the engine does nothing when config.json defines no zones
+zone_engine = ZoneEngine(load_zones(CONFIG_FILE) if ZONE_TRIGGERS else [])
+
+def display_zone_events(events):
+    for event in events:
+        logger.info("Zone event: %s", event)
 
+if DISPLAY_ZONE_EVENTS:
+    zone_engine.subscribe(display_zone_events)
+
+# Reassembles data frames split across several packets
+frame_assembler = FrameAssembler()
+
+# Position history of each PSN source's trackers, by source IP
+tracker_histories = {}
+# Spatial index of each PSN source's latest frame, by source IP
+spatial_indexes = {}
+# Smoothing filter of each PSN source, by source IP; only used when config.json picks a filter
+position_filters = {}
+smooth_positions = SMOOTH_POSITIONS and load_filter(CONFIG_FILE) is not None
+
+# Receive ring used in batch mode; exposes packet, truncation and kernel drop counters.
+# With receive workers it is not read from, and its counters add up the workers' reports.
+receive_ring = PacketRing(RECEIVE_RING_SLOTS, MAX_PACKET_SIZE)
+
+# Packet, latency and frame loss metrics, served in Prometheus format by webserver.py
+metrics = ReceiverMetrics()
+metrics.add_counter('psn_kernel_drops_total', 'Datagrams dropped by the kernel (SO_RXQ_OVFL)',
+                    lambda: receive_ring.kernel_drops)
+metrics.add_counter('psn_truncated_packets_total', 'Datagrams larger than the receive buffer',
+                    lambda: receive_ring.truncated)
+metrics.add_counter('psn_receive_wakeups_total', 'Receive loop wakeups that read packets',
+                    lambda: receive_ring.drains)
+metrics.add_counter('psn_frames_completed_total', 'Data frames assembled from all their packets',
+                    lambda: frame_assembler.frames_completed)
+metrics.add_counter('psn_frames_partial_total', 'Data frames emitted with packets missing',
+                    lambda: frame_assembler.frames_partial)
+metrics.add_counter('psn_late_packets_total', 'Data packets dropped for arriving after their frame was emitted',
+                    lambda: frame_assembler.late_packets)
+# Per-source clock alignment, network/processing latency and jitter (see clock_sync.py)
+latency_monitor = LatencyMonitor()
+metrics.add_renderer(latency_monitor.render)
+metrics.add_counter('psn_kernel_timestamps_total', 'Packets stamped by the kernel on arrival',
+                    lambda: receive_ring.kernel_timestamps)
+metrics.add_gauge('psn_trackers', 'Trackers announced by all PSN servers', lambda: len(tracker_registry.trackers))
+
+def start_udp_receiver():
+    install_verbosity_toggle('PSNReceiver')
     logger.info("Starting UDP receiver...")
-    data_parser_conn = None
+    data_forwarder = None
+    info_forwarder = None
 
-    # Attempt to connect to the Data Parser
+    # Forward to the parsers from background threads; both reconnect on their own
     if FORWARD_DATA_PACKETS:
+        data_forwarder = IPCForwarder(('localhost', 6001), b'secret password', name='DataForwarder',
+                                      max_queue=FORWARD_QUEUE_SIZE, policy=FORWARD_DROP_POLICY,
+                                      batch_size=FORWARD_BATCH_SIZE)
+        data_forwarder.start()
+    if FORWARD_INFO_PACKETS:
+        info_forwarder = IPCForwarder(('localhost', 6000), b'psn_secret_key', name='InfoForwarder',
+                                      max_queue=FORWARD_QUEUE_SIZE, policy=FORWARD_DROP_POLICY,
+                                      batch_size=FORWARD_BATCH_SIZE)
+        info_forwarder.start()
+    for forwarder in (data_forwarder, info_forwarder):
+        if forwarder:
+            prefix = 'psn_' + forwarder.name.lower()
+            metrics.add_counter(prefix + '_sent_total', forwarder.name + ' records sent',
+                                lambda forwarder=forwarder: forwarder.sent)
+            metrics.add_counter(prefix + '_dropped_total', forwarder.name + ' records dropped',
+                                lambda forwarder=forwarder: forwarder.dropped)
+            metrics.add_gauge(prefix + '_queued', forwarder.name + ' records waiting to be sent',
+                              lambda forwarder=forwarder: forwarder.queued)
+
+    shared_table = None
+    if PUBLISH_SHARED_TABLE:
         try:
-            data_parser_conn = Client(('localhost', 6001), authkey=b'secret password')
-            logger.info("Connected to Data Parser")
-        except Exception as e:
-            logger.error(f"Failed to connect to Data Parser: {e}")
-            data_parser_conn = None
+            shared_table = SharedTrackerTable(SHARED_TABLE_NAME, create=True)
+            atexit.register(shared_table.close)
+            logger.info("Publishing tracker table to shared memory '%s'", SHARED_TABLE_NAME)
+        except FileExistsError as e:
+            logger.error("Not publishing the shared tracker table: %s", e)
+
+    recorder = None
+    if RECORD_SESSION and RECEIVE_WORKERS > 1:
+        logger.error("Not recording the session: data packets are decoded by the receive workers "
+                     "and never reach this process; set RECEIVE_WORKERS = 1 to record")
+    elif RECORD_SESSION:
+        recorder = SessionRecorder(RECORD_FILE)
+        atexit.register(recorder.close)
+        logger.info("Recording session to %s", RECORD_FILE)
+
+    rebroadcaster = None
+    rebroadcast_source = REBROADCAST_SOURCE
+    if REBROADCAST:
+        sender = PacketSender(REBROADCAST_DESTINATIONS)
+        rebroadcaster = PSNRebroadcaster(
+            sender.send_all, tracker_ids=REBROADCAST_TRACKERS, output_rate=REBROADCAST_RATE,
+            names=lambda source: {tracker_id: name for (name_source, tracker_id), name in tracker_registry.names.items()
+                                  if name_source == source})
+        metrics.add_counter('psn_rebroadcast_frames_total', 'Frames re-emitted as PSN', lambda: rebroadcaster.frames_out)
+        metrics.add_counter('psn_rebroadcast_packets_total', 'PSN packets re-emitted', lambda: sender.packets)
+        logger.info("Re-emitting frames to %s", REBROADCAST_DESTINATIONS)
+
+    perf_counter_ns = time.perf_counter_ns
+    monotonic_ns = time.monotonic_ns
+
+    def forward_frames(frames):
+        nonlocal rebroadcast_source
+        for frame in frames:
+            latency_monitor.frame(frame.source, frame.packet_timestamp, monotonic_ns())
+            if smooth_positions:
+                position_filter = position_filters.get(frame.source)
+                if position_filter is None:
+                    position_filter = position_filters[frame.source] = load_filter(CONFIG_FILE)
+                position_filter.apply(frame)
+            if frame.complete:
+                packet_summary.count('frames')
+            else:
+                packet_summary.count('partial frames')
+                logger.debug("Frame %d from %s incomplete: %d/%d packets", frame.frame_id, frame.source,
+                             frame.packets_received, frame.frame_packet_count)
+            if shared_table:
+                shared_table.publish(frame)
+            if PUBLISH_STATE_SNAPSHOTS:
+                state_store.publish_frame(frame)
+            if KEEP_HISTORY:
+                history = tracker_histories.get(frame.source)
+                if history is None:
+                    history = tracker_histories[frame.source] = TrackerHistory()
+                history.append(frame)
+            if INDEX_POSITIONS:
+                index = spatial_indexes.get(frame.source)
+                if index is None:
+                    index = spatial_indexes[frame.source] = SpatialIndex()
+                index.update(frame)
+            if zone_engine.zones:
+                zone_engine.update(frame)
+            if rebroadcaster:
+                if rebroadcast_source is None:
+                    rebroadcast_source = frame.source
+                    logger.info("Re-emitting the frames of %s", rebroadcast_source)
+                if frame.source == rebroadcast_source:
+                    rebroadcaster.send_frame(frame)
+                else:
+                    packet_summary.count('frames not re-emitted', frame.source)
+            if data_forwarder:
+                data_forwarder.submit(RECORD_TRACKER_FRAME, encode_frame(frame))
+
+    def handle_packet(data, ip_address, received, arrival):
+        global active_frame_id
+        debug = logger.isEnabledFor(logging.DEBUG)
+        if debug:
+            logger.debug("Received packet from %s", ip_address)
+        if recorder:
+            recorder.record(data, ip_address, arrival)
+        started = perf_counter_ns()
+        chunks = parse_chunks(data)
+        decoded = perf_counter_ns()
+        for chunk_type, chunk_data in chunks:
+            if chunk_type == 'PSN_INFO_PACKET':
+                packet_summary.count('info', ip_address)
+                if info_forwarder:
+                    info_forwarder.submit(RECORD_SOURCE_PACKET, encode_source_packet(ip_address, data))
+                system_name = None
+                info_header = None
+                tracker_list = []
+                for sub_chunk_type, sub_chunk_data in chunk_data:
+                    if sub_chunk_type == 'PSN_INFO_PACKET_HEADER':
+                        active_frame_id = sub_chunk_data.frame_id
+                        info_header = sub_chunk_data
+                    elif sub_chunk_type == 'PSN_INFO_SYSTEM_NAME':
+                        system_name = sub_chunk_data
+                    elif sub_chunk_type == 'PSN_INFO_TRACKER_LIST':
+                        tracker_list = sub_chunk_data
+                    if debug:
+                        if sub_chunk_type == 'PSN_INFO_TRACKER_LIST':
+                            logger.debug("  PSN_INFO_TRACKER_LIST:\n%s", format_tracker_list(sub_chunk_data))
+                        else:
+                            logger.debug("  %s: %s", sub_chunk_type, sub_chunk_data)
+
+                # Apply only what changed in this server's tracker list
+                if info_header is None:
+                    tracker_registry.update(ip_address, system_name, tracker_list)
+                else:
+                    tracker_registry.update(ip_address, system_name, tracker_list,
+                                            info_header.frame_id, info_header.frame_packet_count)
+
+            elif chunk_type == 'PSN_DATA_PACKET':
+                packet_summary.count('data', ip_address)
+                if any(sub_chunk_type == 'PSN_DATA_PACKET_HEADER' for sub_chunk_type, _ in chunk_data):
+                    metrics.frame(ip_address, data_frame.frame_id)
+                    latency_monitor.packet(ip_address, data_frame.packet_timestamp, arrival)
+                    forward_frames(frame_assembler.add(data_frame, ip_address))
+        metrics.packet(ip_address, len(data), received, started, decoded, perf_counter_ns())
+
+    if RECEIVE_WORKERS > 1:
+        merge_worker_frames(handle_packet, forward_frames)
+        return
+
+    sock = open_multicast_socket(MULTICAST_GROUP, PORT, rcvbuf=SOCKET_RCVBUF, blocking=not BATCH_RECEIVE)
+    logger.info("Socket receive buffer: %d bytes", sock.getsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF))
+    if not enable_drop_counter(sock):
+        logger.warning("Kernel drop counter (SO_RXQ_OVFL) not available on this platform")
+    if (KERNEL_TIMESTAMPS or recorder) and not enable_kernel_timestamps(sock):
+        logger.warning("Kernel receive timestamps (SO_TIMESTAMPNS) not available on this platform")
+
+    # Wake up periodically so frames missing packets are emitted even if traffic stops
+    if not BATCH_RECEIVE:
+        sock.settimeout(frame_assembler.timeout)
+    kernel_drops = 0
 
     while True:
         try:
-            data, addr = sock.recvfrom(MAX_PACKET_SIZE)
-            ip_address = addr[0]
-            logger.info(f"Received packet from {ip_address}")
-            chunks = parse_chunks(data)
-            for chunk_type, chunk_data in chunks:
-                if chunk_type == 'PSN_INFO_PACKET':
-                    system_name = None
-                    tracker_list = []
-                    for sub_chunk_type, sub_chunk_data in chunk_data:
-                        if sub_chunk_type == 'PSN_INFO_PACKET_HEADER':
-                            active_frame_id = sub_chunk_data.frame_id
-                            logger.info(f"  {sub_chunk_type}: {sub_chunk_data}")
-                        elif sub_chunk_type == 'PSN_INFO_SYSTEM_NAME':
-                            system_name = sub_chunk_data
-                            logger.info(f"  PSN_INFO_SYSTEM_NAME: {system_name}")
-                        elif sub_chunk_type == 'PSN_INFO_TRACKER_LIST':
-                            tracker_list = sub_chunk_data
-                            logger.info("  PSN_INFO_TRACKER_LIST:\n" + format_tracker_list(tracker_list))
-                        else:
-                            logger.info(f"  {sub_chunk_type}: {sub_chunk_data}")
-
-                    # Update the trackers dictionary
-                    new_trackers = {}
-                    for tracker_name, tracker_id in tracker_list:
-                        new_trackers[tracker_name] = {
-                            'id': tracker_id,
-                            'system_name': system_name,
-                            'ip_address': ip_address
-                        }
-                    
-                    # Remove trackers not in the current frame
-                    for tracker_name in list(trackers):
-                        if tracker_name not in new_trackers:
-                            del trackers[tracker_name]
-
-                    # Add or update trackers from the current frame
-                    trackers.update(new_trackers)
-
-                    if DISPLAY_TRACKER_UPDATES:
-                        print(f"Updated trackers: {trackers}")
-                
-                elif chunk_type == 'PSN_DATA_PACKET' and FORWARD_DATA_PACKETS:
-                    logger.info("Received PSN_DATA_PACKET")
-                    if data_parser_conn:
-                        try:
-                            data_parser_conn.send(chunk_data)
-                            logger.info("Forwarded PSN_DATA_PACKET to Data Parser")
-                        except Exception as e:
-                            logger.error(f"Failed to send data packet to Data Parser: {e}")
+            if BATCH_RECEIVE:
+                packets = receive_ring.drain(sock, frame_assembler.timeout)
+                received = receive_ring.received_at
+                for (data, addr), arrival in zip(packets, receive_ring.arrivals):
+                    try:
+                        handle_packet(data, addr[0], received, arrival)
+                    except Exception as e:
+                        logger.error("Error handling packet from %s: %s", addr[0], e)
+                if receive_ring.kernel_drops != kernel_drops:
+                    packet_summary.count('kernel drops', amount=receive_ring.kernel_drops - kernel_drops)
+                    kernel_drops = receive_ring.kernel_drops
+            else:
+                data, addr = sock.recvfrom(MAX_PACKET_SIZE)
+                handle_packet(data, addr[0], perf_counter_ns(), monotonic_ns())
+            forward_frames(frame_assembler.expire())
+            remove_stale_trackers()
+            packet_summary.tick()
+            metrics.tick()
+            latency_monitor.tick()
+        except socket.timeout:
+            forward_frames(frame_assembler.expire())
+            remove_stale_trackers()
+            packet_summary.tick()
+            metrics.tick()
+            latency_monitor.tick()
         except Exception as e:
-            logger.error(f"Error receiving data: {e}")
+            logger.error("Error receiving data: %s", e)
+
+# Adds a worker's counter report to the metrics
+def add_worker_stats(payload):
+    ring_counts, sources = decode_worker_stats(payload)
+    for name, count in ring_counts.items():
+        setattr(receive_ring, name, getattr(receive_ring, name) + count)
+    for source, packets, nbytes in sources:
+        metrics.sources.count(source, nbytes, packets)
+
+# Supervisor side of multi-process receiving: info packets relayed by the workers go
+# through handle_packet as if received here, and their assembled frames are merged into
+# one ordered stream per source before being published and forwarded. The workers'
+# counter reports are added to the per-source and receive ring metrics; the latency
+# histograms only cover the info packets handled here.
+def merge_worker_frames(handle_packet, forward_frames):
+    pool = WorkerPool(RECEIVE_WORKERS, MULTICAST_GROUP, PORT, SOCKET_RCVBUF)
+    merger = FrameMerger()
+    metrics.add_counter('psn_worker_restarts_total', 'Receive worker processes restarted', lambda: pool.restarts)
+    metrics.add_counter('psn_merged_out_of_order_total', 'Worker frames dropped as out of order',
+                        lambda: merger.out_of_order)
+    pool.start()
+    logger.info("Started %d receive workers", RECEIVE_WORKERS)
+    try:
+        while True:
+            try:
+                batch = pool.get(frame_assembler.timeout)
+                if batch is not None:
+                    for kind, payload in iter_records(batch):
+                        if kind == RECORD_SOURCE_PACKET:
+                            source, data = decode_source_packet(payload)
+                            handle_packet(data, source, time.perf_counter_ns(), time.monotonic_ns())
+                        elif kind == RECORD_WORKER_STATS:
+                            add_worker_stats(payload)
+                        elif kind == RECORD_TRACKER_FRAME:
+                            frame = merger.add(payload)
+                            if frame is not None:
+                                metrics.frame(frame.source, frame.frame_id)
+                                # Arrival here is the merge time, so it includes the hop from the worker
+                                latency_monitor.packet(frame.source, frame.packet_timestamp, time.monotonic_ns())
+                                forward_frames([frame])
+                pool.supervise()
+                remove_stale_trackers()
+                packet_summary.tick()
+                metrics.tick()
+                latency_monitor.tick()
+            except Exception as e:
+                logger.error("Error merging worker frames: %s", e)
+    finally:
+        pool.stop()
 
 if __name__ == "__main__":
     start_udp_receiver()
@@ -0,0 +1,251 @@
+import argparse
+import mmap
+import os
+import socket
+import struct
+import time
+import numpy as np
+from psn_decoder import CHUNK_HEADER, PACKET_HEADER, PSN_DATA_PACKET, PSN_DATA_PACKET_HEADER, parse_chunks, data_frame
+from frame_assembler import FrameAssembler
+
+# Session recordings: raw PSN datagrams with their source and receive time, for replay.
+#
+# A recording starts with FILE_HEADER, followed by one RECORD_HEADER + datagram per packet.
+# Record times are nanoseconds since the first packet, taken from the per-packet arrival
+# times on the receiver's monotonic clock. The seek index is a sidecar file (<recording>.idx) of INDEX_DTYPE
+# entries pointing at the first packet of every data frame.
+#
+#     python recording.py psn_session.rec                      # replay on the PSN group at 1x
+#     python recording.py psn_session.rec --speed 4 --start 90
+#     python recording.py psn_session.rec --speed 0 --decode   # decode as fast as possible
+
+MAGIC = b'PSNREC01'
+FORMAT_VERSION = 1
+# Magic, format version, wall clock time of the first packet (ns since the epoch)
+FILE_HEADER = struct.Struct('<8sIQ')
+# Time since the first packet (ns), source IPv4 address, datagram length
+RECORD_HEADER = struct.Struct('<Q4sH')
+# Time since the first packet (ns), file offset of the record
+INDEX_ENTRY = struct.Struct('<QQ')
+INDEX_DTYPE = np.dtype([('time', '<u8'), ('offset', '<u8')])
+INDEX_SUFFIX = '.idx'
+
+WRITE_BUFFER_SIZE = 1024 * 1024
+
+# Byte offsets of the first sub-chunk ID and of the frame ID in a data packet whose
+# header sub-chunk comes first, which is how PSN servers send them
+FIRST_SUBCHUNK_OFFSET = CHUNK_HEADER.size
+FRAME_ID_OFFSET = 2 * CHUNK_HEADER.size + PACKET_HEADER.size - 2
+
+
+def index_path(path):
+    return path + INDEX_SUFFIX
+
+
+# Frame ID of a data packet, or None for any other packet. Only peeks at fixed offsets,
+# so it is cheap enough for the receive loop.
+def peek_frame_id(data):
+    if len(data) <= FRAME_ID_OFFSET:
+        return None
+    if (data[0] | data[1] << 8) != PSN_DATA_PACKET:
+        return None
+    if (data[FIRST_SUBCHUNK_OFFSET] | data[FIRST_SUBCHUNK_OFFSET + 1] << 8) != PSN_DATA_PACKET_HEADER:
+        return None
+    return data[FRAME_ID_OFFSET]
+
+
+# Appends received datagrams to a recording through large buffered writes. record() is
+# called from the receive loop with the arrival time of the packet on the
+# time.monotonic_ns() clock, which is the kernel receive timestamp when those are on.
+# Kernel timestamps are shifted onto that clock once per drain, so times are clamped
+# to never go backwards, which the seek index relies on.
+class SessionRecorder:
+    def __init__(self, path, buffer_size=WRITE_BUFFER_SIZE):
+        self.path = path
+        self.packets = 0
+        self.bytes = 0
+        self._file = open(path, 'wb', buffering=buffer_size)
+        self._index = open(index_path(path), 'wb', buffering=64 * 1024)
+        self._offset = 0
+        self._first = None
+        self._last = 0
+        self._frame_ids = {}
+        self._addresses = {}
+
+    def record(self, data, source, arrival_ns):
+        if self._first is None:
+            self._first = arrival_ns
+            header = FILE_HEADER.pack(MAGIC, FORMAT_VERSION, time.time_ns())
+            self._file.write(header)
+            self._offset = len(header)
+        address = self._addresses.get(source)
+        if address is None:
+            address = self._addresses[source] = socket.inet_aton(source)
+        elapsed = arrival_ns - self._first
+        if elapsed < self._last:
+            elapsed = self._last
+        self._last = elapsed
+
+        frame_id = peek_frame_id(data)
+        if frame_id is not None and self._frame_ids.get(source) != frame_id:
+            self._frame_ids[source] = frame_id
+            self._index.write(INDEX_ENTRY.pack(elapsed, self._offset))
+
+        self._file.write(RECORD_HEADER.pack(elapsed, address, len(data)))
+        self._file.write(data)
+        self._offset += RECORD_HEADER.size + len(data)
+        self.packets += 1
+        self.bytes += len(data)
+
+    def flush(self):
+        self._file.flush()
+        self._index.flush()
+
+    def close(self):
+        if not self._file.closed:
+            self._file.close()
+            self._index.close()
+
+
+# Read-only view of a recording through mmap. Packets are yielded as memoryviews into the
+# mapping, so reading one does not copy it.
+class SessionFile:
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, 'rb')
+        # mmap cannot map an empty file, and a file shorter than its header was cut off
+        # before the recorder wrote anything
+        if os.fstat(self._file.fileno()).st_size < FILE_HEADER.size:
+            self._file.close()
+            raise ValueError(f"{path} is an empty or truncated PSN session recording")
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        self._view = memoryview(self._map)
+        magic, version, self.start_time_ns = FILE_HEADER.unpack_from(self._view)
+        if magic != MAGIC or version != FORMAT_VERSION:
+            self.close()
+            raise ValueError(f"{path} is not a PSN session recording")
+        self.index = self._load_index()
+        self.duration = self._last_time() / 1e9
+
+    def _load_index(self):
+        path = index_path(self.path)
+        if os.path.exists(path):
+            index = np.fromfile(path, dtype=INDEX_DTYPE, count=os.path.getsize(path) // INDEX_DTYPE.itemsize)
+            # Entries past the end belong to data lost when the recorder was killed
+            return index[index['offset'] < len(self._view)]
+        # No sidecar: index every record instead
+        entries = [(elapsed, offset) for offset, elapsed, _, _ in self._scan(FILE_HEADER.size)]
+        return np.array(entries, dtype=INDEX_DTYPE)
+
+    def _scan(self, offset):
+        view = self._view
+        end = len(view)
+        while offset + RECORD_HEADER.size <= end:
+            elapsed, address, length = RECORD_HEADER.unpack_from(view, offset)
+            start = offset + RECORD_HEADER.size
+            if start + length > end:
+                break  # truncated by a crash while recording
+            yield offset, elapsed, address, view[start:start + length]
+            offset = start + length
+
+    def _last_time(self):
+        if len(self.index) == 0:
+            return 0
+        last = 0
+        for _, elapsed, _, _ in self._scan(int(self.index['offset'][-1])):
+            last = elapsed
+        return last
+
+    # File offset of the last indexed frame starting at or before the given time. Up to
+    # the first frame this is the start of the recording, so the info packets that came
+    # before it are not skipped.
+    def seek(self, seconds):
+        times = self.index['time']
+        position = np.searchsorted(times, int(seconds * 1e9), side='right') - 1
+        if position <= 0:
+            return FILE_HEADER.size
+        return int(self.index['offset'][position])
+
+    # Yields (seconds since the first packet, source IP, datagram) from the given time
+    def packets(self, start=0.0):
+        for _, elapsed, address, data in self._scan(self.seek(start)):
+            yield elapsed / 1e9, socket.inet_ntoa(address), data
+
+    def close(self):
+        self._view.release()
+        self._map.close()
+        self._file.close()
+
+
+# Re-emits packets from a recording through send(data, source). speed is a multiple of
+# real time; 0 sends as fast as possible. Returns the number of packets sent.
+def replay(session, send, start=0.0, speed=1.0, loop=False):
+    sent = 0
+    while True:
+        clock_start = time.perf_counter()
+        first = None
+        for elapsed, source, data in session.packets(start):
+            if first is None:
+                first = elapsed
+            if speed:
+                delay = (elapsed - first) / speed - (time.perf_counter() - clock_start)
+                if delay > 0:
+                    time.sleep(delay)
+            send(data, source)
+            sent += 1
+        if not loop:
+            return sent
+
+
+def multicast_sender(group, port, ttl=1):
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_UDP)
+    sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_TTL, ttl)
+    sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_LOOP, 1)
+    destination = (group, port)
+
+    def send(data, source):
+        sock.sendto(data, destination)
+    return send
+
+
+# Feeds packets straight into the decoder and frame assembler, as the receiver would
+def decoder_sink():
+    assembler = FrameAssembler()
+    counts = {'packets': 0, 'frames': 0}
+
+    def send(data, source):
+        counts['packets'] += 1
+        for chunk_type, chunk_data in parse_chunks(data):
+            if chunk_type == 'PSN_DATA_PACKET':
+                counts['frames'] += len(assembler.add(data_frame, source))
+    return send, counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Replay a recorded PSN session')
+    parser.add_argument('path')
+    parser.add_argument('--start', type=float, default=0.0, help='seconds into the recording')
+    parser.add_argument('--speed', type=float, default=1.0, help='multiple of real time, 0 for maximum')
+    parser.add_argument('--loop', action='store_true')
+    parser.add_argument('--decode', action='store_true', help='decode in this process instead of sending')
+    parser.add_argument('--group', default='236.10.10.10')
+    parser.add_argument('--port', type=int, default=56565)
+    args = parser.parse_args()
+
+    session = SessionFile(args.path)
+    print(f"{args.path}: {session.duration:.1f}s, {len(session.index)} index entries")
+    counts = None
+    if args.decode:
+        send, counts = decoder_sink()
+    else:
+        send = multicast_sender(args.group, args.port)
+    started = time.perf_counter()
+    sent = replay(session, send, args.start, args.speed, args.loop)
+    elapsed = time.perf_counter() - started
+    print(f"Replayed {sent} packets in {elapsed:.2f}s ({sent / max(elapsed, 1e-9):.0f} packets/s)")
+    if counts is not None:
+        print(f"Decoded {counts['frames']} frames")
+    session.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,248 @@
+import os
+import socket
+import struct
+import time
+import numpy as np
+from multiprocessing import shared_memory, resource_tracker
+from tracker_frame import TRACKER_DTYPE, MAX_TRACKERS
+from frame_assembler import FIELD_STALE
+
+SHARED_TABLE_NAME = 'psn_trackers'
+# PSN sources a table has room for
+MAX_SOURCES = 8
+
+TABLE_MAGIC = 0x544E5350  # 'PSNT'
+TABLE_VERSION = 2
+
+# Table header, one u64 per entry: magic, layout version, capacity, number of source
+# sections, PID of the process that created the table, and a generation bumped by every
+# publish of any source. The source sections start at HEADER_SIZE.
+HEADER_MAGIC = 0
+HEADER_VERSION = 1
+HEADER_CAPACITY = 2
+HEADER_SOURCES = 3
+HEADER_OWNER = 4
+HEADER_GENERATION = 5
+HEADER_SIZE = 64
+
+# Section header, one u64 per entry: the source's IPv4 address as an integer (0 while
+# the section is free), the source's generation, then the sequence counter of each of
+# its two row slots. The row slots follow the section header.
+SECTION_SOURCE = 0
+SECTION_GENERATION = 1
+SECTION_SLOT_SEQ = 2
+SECTION_HEADER_SIZE = 64
+
+
+def section_size(capacity):
+    return SECTION_HEADER_SIZE + 2 * capacity * TRACKER_DTYPE.itemsize
+
+
+def table_size(capacity, max_sources=MAX_SOURCES):
+    return HEADER_SIZE + max_sources * section_size(capacity)
+
+
+# Latest state of every tracker of every PSN source in a fixed-layout shared memory
+# block.
+#
+# The receiver process creates the table and publishes frames into it; any number of
+# local processes attach by name and read it without serialization. Each source gets a
+# section of its own the first time it publishes, so two servers using the same
+# tracker IDs never overwrite each other. Rows use TRACKER_DTYPE and are indexed by
+# tracker ID, with 'fields' == 0 for trackers never seen. The writer alternates between
+# two row slots per source, each guarded by a sequence counter (odd while being
+# written), and bumps the source's generation once a slot is complete. snapshot()
+# returns a zero-copy view of a source's current slot; it stays consistent as long as
+# is_valid() still holds after the reader is done with it, which is one full publish
+# later at the earliest.
+#
+# Creating a table that a running process still owns raises FileExistsError instead of
+# taking it over; a table left behind by a process that is gone is replaced.
+class SharedTrackerTable:
+    def __init__(self, name=SHARED_TABLE_NAME, create=False, capacity=MAX_TRACKERS, max_sources=MAX_SOURCES):
+        if create:
+            _remove_abandoned(name)
+            self._shm = shared_memory.SharedMemory(name, create=True, size=table_size(capacity, max_sources))
+        else:
+            self._shm = _attach(name)
+        self.name = name
+        self.owner = create
+
+        self._header = np.ndarray(HEADER_SIZE // 8, dtype='<u8', buffer=self._shm.buf)
+        if create:
+            self._header[:] = 0
+            self._header[HEADER_MAGIC] = TABLE_MAGIC
+            self._header[HEADER_VERSION] = TABLE_VERSION
+            self._header[HEADER_CAPACITY] = capacity
+            self._header[HEADER_SOURCES] = max_sources
+            self._header[HEADER_OWNER] = os.getpid()
+        elif self._header[HEADER_MAGIC] != TABLE_MAGIC or self._header[HEADER_VERSION] != TABLE_VERSION:
+            self.close()
+            raise ValueError(f"Shared memory block '{name}' is not a PSN tracker table")
+        self.capacity = int(self._header[HEADER_CAPACITY])
+        self.max_sources = int(self._header[HEADER_SOURCES])
+
+        size = section_size(self.capacity)
+        row_size = TRACKER_DTYPE.itemsize
+        self._sections = np.ndarray((self.max_sources, SECTION_HEADER_SIZE // 8), dtype='<u8', buffer=self._shm.buf,
+                                    offset=HEADER_SIZE, strides=(size, 8))
+        self._slots = np.ndarray((self.max_sources, 2, self.capacity), dtype=TRACKER_DTYPE, buffer=self._shm.buf,
+                                 offset=HEADER_SIZE + SECTION_HEADER_SIZE,
+                                 strides=(size, self.capacity * row_size, row_size))
+        if create:
+            self._sections[:] = 0
+            self._slots[:] = 0
+            self._slots['id'] = np.arange(self.capacity)
+        # Source IP -> section; sections are never given back while the table exists
+        self._indexes = {}
+        # Frames not published because every section was taken
+        self.overflow = 0
+
+    # Bumped by every publish, of any source
+    @property
+    def generation(self):
+        return int(self._header[HEADER_GENERATION])
+
+    def generation_of(self, source):
+        section = self._section(source)
+        return 0 if section is None else int(self._sections[section, SECTION_GENERATION])
+
+    # Sources that have published, in the order they first did
+    def sources(self):
+        values = self._sections[:, SECTION_SOURCE]
+        return [_address(value) for value in values[values != 0].tolist()]
+
+    def _section(self, source, allocate=False):
+        section = self._indexes.get(source)
+        if section is not None:
+            return section
+        value = _value(source)
+        values = self._sections[:, SECTION_SOURCE]
+        found = np.flatnonzero(values == value)
+        if len(found):
+            section = int(found[0])
+        elif allocate:
+            free = np.flatnonzero(values == 0)
+            if not len(free):
+                return None
+            section = int(free[0])
+            # Readers discover the section through its source, written last
+            self._sections[section, SECTION_SOURCE] = value
+        else:
+            return None
+        self._indexes[source] = section
+        return section
+
+    # Writer side: merge the trackers received in frame into the next slot of its
+    # source and publish it. Returns the source's new generation, or None when the
+    # table has no room for another source.
+    def publish(self, frame):
+        section = self._section(frame.source, allocate=True)
+        if section is None:
+            self.overflow += 1
+            return None
+        header = self._sections[section]
+        slots = self._slots[section]
+        generation = int(header[SECTION_GENERATION])
+        current = slots[generation & 1]
+        slot = (generation + 1) & 1
+        rows = slots[slot]
+        seq = SECTION_SLOT_SEQ + slot
+
+        header[seq] += 1
+        rows[:] = current
+        fields = frame.trackers['fields'][:self.capacity]
+        received = np.flatnonzero((fields != 0) & (fields & FIELD_STALE == 0))
+        rows[received] = frame.trackers[received]
+        header[seq] += 1
+        header[SECTION_GENERATION] = generation + 1
+        self._header[HEADER_GENERATION] += 1
+        return generation + 1
+
+    # Reader side: zero-copy view of the latest slot of a source (by default the first
+    # source to publish) and a token for is_valid(). Returns (None, None) for a source
+    # that has not published.
+    def snapshot(self, source=None):
+        section = 0 if source is None else self._section(source)
+        if section is None:
+            return None, None
+        header = self._sections[section]
+        while True:
+            generation = int(header[SECTION_GENERATION])
+            slot = generation & 1
+            seq = int(header[SECTION_SLOT_SEQ + slot])
+            if seq & 1 == 0:
+                return self._slots[section, slot], (section, slot, seq)
+            time.sleep(0)
+
+    def is_valid(self, token):
+        section, slot, seq = token
+        return int(self._sections[section, SECTION_SLOT_SEQ + slot]) == seq
+
+    # Reader side: private copy of the latest slot of a source, retried until consistent
+    def read(self, source=None):
+        while True:
+            rows, token = self.snapshot(source)
+            if rows is None:
+                return None
+            copy = rows.copy()
+            if self.is_valid(token):
+                return copy
+
+    def close(self):
+        self._header = None
+        self._sections = None
+        self._slots = None
+        self._shm.close()
+        if self.owner:
+            self._shm.unlink()
+
+
+def _value(source):
+    return struct.unpack('>I', socket.inet_aton(source))[0]
+
+
+def _address(value):
+    return socket.inet_ntoa(struct.pack('>I', value))
+
+
+def _is_running(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+# Unlinks a table left behind by a receiver that did not exit cleanly; raises
+# FileExistsError if the process that created it is still running
+def _remove_abandoned(name):
+    try:
+        existing = _attach(name)
+    except FileNotFoundError:
+        return
+    owner = None
+    if existing.size >= HEADER_SIZE:
+        header = np.ndarray(HEADER_SIZE // 8, dtype='<u8', buffer=existing.buf)
+        if header[HEADER_MAGIC] == TABLE_MAGIC and header[HEADER_VERSION] == TABLE_VERSION:
+            owner = int(header[HEADER_OWNER])
+        del header
+    existing.close()
+    if owner is not None and owner != os.getpid() and _is_running(owner):
+        raise FileExistsError(f"Shared tracker table '{name}' is in use by process {owner}")
+    stale = shared_memory.SharedMemory(name)
+    stale.close()
+    stale.unlink()
+
+
+def _attach(name):
+    try:
+        return shared_memory.SharedMemory(name, track=False)
+    except TypeError:
+        # Before Python 3.13 attaching registers the block with the resource tracker,
+        # which would unlink it when this reader exits
+        shm = shared_memory.SharedMemory(name)
+        resource_tracker.unregister(shm._name, 'shared_memory')
+        return shm
@@ -0,0 +1,125 @@
+import numpy as np
+from tracker_frame import FIELD_POS
+
+# Edge length of a grid cell in metres
+CELL_SIZE = 1.0
+# Cell coordinates are packed into one int64 key as x * KEY_STRIDE + y
+KEY_STRIDE = 1 << 32
+
+
+# Uniform grid over the tracker positions of one frame, for batched radius and
+# nearest-neighbour queries.
+#
+# Trackers move on a stage, so the grid is two-dimensional (x, y) and z only enters the
+# distance. build() sorts the trackers by cell key, giving every occupied cell a
+# contiguous run of rows; a query looks up the cells around each query point with one
+# searchsorted call and checks the exact distance of the trackers in them. All queries
+# take an (m, 3) array of points and return flat arrays.
+class SpatialIndex:
+    def __init__(self, cell_size=CELL_SIZE):
+        self.cell_size = cell_size
+        self.build(np.zeros(0, dtype=np.int64), np.zeros((0, 3)))
+
+    # Index every tracker of the frame that has a position, including trackers carried
+    # over from the previous frame with their last known position
+    def update(self, frame):
+        rows = frame.trackers[frame.trackers['fields'] & FIELD_POS != 0]
+        self.build(rows['id'], rows['pos'])
+
+    # Rows with a NaN or infinite coordinate are left out: they have no cell and no
+    # distance to anything
+    def build(self, ids, positions):
+        positions = np.asarray(positions, dtype=np.float64).reshape(-1, 3)
+        ids = np.asarray(ids, dtype=np.int64)
+        finite = np.isfinite(positions).all(axis=1)
+        if not finite.all():
+            ids, positions = ids[finite], positions[finite]
+        keys = self._keys(positions)
+        order = np.argsort(keys, kind='stable')
+        self.ids = ids[order]
+        self.positions = positions[order]
+        self.cell_keys, self.cell_starts, self.cell_counts = np.unique(keys[order], return_index=True,
+                                                                       return_counts=True)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def _keys(self, positions):
+        cells = np.floor(positions[:, :2] / self.cell_size).astype(np.int64)
+        return cells[:, 0] * KEY_STRIDE + cells[:, 1]
+
+    # Candidate (query index, row) pairs from the cells within radius of each point
+    def _candidates(self, points, radius):
+        count = len(points)
+        reach = int(np.ceil(radius / self.cell_size)) if np.isfinite(radius) else len(self.cell_keys)
+        if (2 * reach + 1) ** 2 >= len(self.cell_keys):
+            # The neighbourhood covers about every occupied cell: check all trackers
+            queries = np.repeat(np.arange(count), len(self.ids))
+            return queries, np.tile(np.arange(len(self.ids)), count)
+
+        steps = np.arange(-reach, reach + 1)
+        offsets = (steps[:, None] * KEY_STRIDE + steps[None, :]).ravel()
+        # Points with a non-finite coordinate find nothing
+        finite = np.isfinite(points).all(axis=1)
+        keys = (self._keys(np.where(finite[:, None], points, 0.0))[:, None] + offsets[None, :]).ravel()
+        slots = np.searchsorted(self.cell_keys, keys)
+        slots[slots == len(self.cell_keys)] = 0
+        found = (self.cell_keys[slots] == keys) & np.repeat(finite, len(offsets))
+        queries = np.repeat(np.arange(count), len(offsets))[found]
+        starts = self.cell_starts[slots[found]]
+        lengths = self.cell_counts[slots[found]]
+        # Expand each (start, length) run of rows into individual rows
+        run_offsets = np.cumsum(lengths) - lengths
+        rows = np.arange(lengths.sum()) - np.repeat(run_offsets - starts, lengths)
+        return np.repeat(queries, lengths), rows
+
+    # Trackers within radius of each point: (query indices, tracker IDs, distances),
+    # grouped by query and nearest first
+    def within(self, points, radius):
+        points = np.asarray(points, dtype=np.float64).reshape(-1, 3)
+        queries, rows = self._candidates(points, radius)
+        distances = np.linalg.norm(self.positions[rows] - points[queries], axis=1)
+        keep = distances <= radius
+        queries, rows, distances = queries[keep], rows[keep], distances[keep]
+        order = np.lexsort((distances, queries))
+        return queries[order], self.ids[rows[order]], distances[order]
+
+    # Number of trackers within radius of each point
+    def count_within(self, points, radius):
+        points = np.asarray(points, dtype=np.float64).reshape(-1, 3)
+        queries, _, _ = self.within(points, radius)
+        return np.bincount(queries, minlength=len(points))
+
+    # The k nearest trackers to each point within max_distance: (ids, distances) of
+    # shape (m, k), padded with -1 and inf. The search radius starts at one cell and
+    # doubles for the points that have not found k trackers yet.
+    def nearest(self, points, k=1, max_distance=np.inf):
+        points = np.asarray(points, dtype=np.float64).reshape(-1, 3)
+        result_ids = np.full((len(points), k), -1, dtype=np.int64)
+        result_distances = np.full((len(points), k), np.inf)
+        if not len(self.ids):
+            return result_ids, result_distances
+
+        pending = np.arange(len(points))
+        radius = min(self.cell_size, max_distance)
+        while len(pending):
+            queries, ids, distances = self.within(points[pending], radius)
+            found = np.bincount(queries, minlength=len(pending))
+            last_round = radius >= max_distance or np.isinf(radius)
+            done = (found >= k) | last_round
+            # Rank of each result within its query; results are sorted nearest first
+            starts = np.cumsum(found) - found
+            ranks = np.arange(len(queries)) - starts[queries]
+            take = done[queries] & (ranks < k)
+            result_ids[pending[queries[take]], ranks[take]] = ids[take]
+            result_distances[pending[queries[take]], ranks[take]] = distances[take]
+            pending = pending[~done]
+            radius = min(radius * 2, max_distance)
+            if radius * 2 > self._extent():
+                # Growing further just visits the same cells; check every tracker instead
+                radius = max_distance
+        return result_ids, result_distances
+
+    # Diagonal of the box around all indexed trackers, plus one cell
+    def _extent(self):
+        return float(np.linalg.norm(self.positions.max(axis=0) - self.positions.min(axis=0))) + self.cell_size
@@ -0,0 +1,151 @@
+import json
+import time
+from types import MappingProxyType
+import numpy as np
+from frame_assembler import FIELD_STALE
+from subscription_hub import FIELD_BITS
+
+# Immutable snapshots of the receiver's state for readers in other threads (the web
+# server's JSON API).
+#
+# The receiver thread is the only writer. It builds each new StateSnapshot next to the
+# current one and publishes it by replacing StateStore.current, a single reference
+# assignment. Nothing reachable from a snapshot is modified after it was published:
+# tracker rows are read-only arrays and mappings are read-only proxies, and a source
+# that did not change shares its arrays with the previous snapshot instead of copying
+# them. Readers take store.current once and use it without locks for as long as they
+# like; a newer version never changes what they hold.
+#
+# Anything derived from a snapshot, such as its JSON form, is computed once and kept on
+# the snapshot, so every reader of one version shares the same bytes.
+
+# Decimals kept for the float fields in JSON; the wire format is float32
+JSON_DECIMALS = 6
+
+
+# Latest frame of one PSN source
+class SourceState:
+    __slots__ = ('source', 'packet_timestamp', 'frame_id', 'complete', 'received', 'rows')
+
+    def __init__(self, frame, received):
+        self.source = frame.source
+        self.packet_timestamp = frame.packet_timestamp
+        self.frame_id = frame.frame_id
+        self.complete = frame.complete
+        self.received = received
+        # active() returns a new array, never the frame's own rows
+        self.rows = frame.active()
+        self.rows.flags.writeable = False
+
+
+# The tracker names announced by every PSN server. They change far less often than the
+# frames, so they have their own version and one TrackerNames is shared by every
+# snapshot until the names change, JSON included.
+class TrackerNames:
+    def __init__(self, version, trackers, names):
+        self.version = version
+        # (source IP, system name, tracker ID) -> name, and (source IP, tracker ID) -> name
+        self.trackers = MappingProxyType(trackers)
+        self.names = MappingProxyType(names)
+        self._json = None
+
+    def json(self):
+        if self._json is None:
+            self._json = _trackers_json(self)
+        return self._json
+
+
+class StateSnapshot:
+    def __init__(self, version, sources, tracker_names):
+        self.version = version
+        self.published = time.time()
+        # Source IP -> SourceState
+        self.sources = _read_only(sources)
+        self.tracker_names = tracker_names
+        self.trackers = tracker_names.trackers
+        self.names = tracker_names.names
+        self._derived = {}
+
+    # build(snapshot) computed once per snapshot and name. Two readers racing on a new
+    # version may both build it; they get equal results and one is kept.
+    def derived(self, name, build):
+        result = self._derived.get(name)
+        if result is None:
+            result = self._derived.setdefault(name, build(self))
+        return result
+
+    def state_json(self):
+        return self.derived('state', _state_json)
+
+    def trackers_json(self):
+        return self.tracker_names.json()
+
+
+class StateStore:
+    def __init__(self):
+        self.epoch = int(time.time())
+        self.current = StateSnapshot(0, {}, TrackerNames(0, {}, {}))
+
+    # Writer side: publish the frame as its source's latest state
+    def publish_frame(self, frame):
+        current = self.current
+        sources = dict(current.sources)
+        sources[frame.source] = SourceState(frame, time.time())
+        self.current = StateSnapshot(current.version + 1, sources, current.tracker_names)
+
+    # Writer side: publish the trackers of a TrackerRegistry after it changed
+    def publish_trackers(self, registry):
+        current = self.current
+        tracker_names = TrackerNames(current.tracker_names.version + 1, dict(registry.trackers), dict(registry.names))
+        self.current = StateSnapshot(current.version + 1, current.sources, tracker_names)
+
+    # ETags of a snapshot's frames and of its tracker names, unique across restarts of
+    # the process
+    def etag(self, snapshot):
+        return f"{self.epoch}-{snapshot.version}"
+
+    def trackers_etag(self, snapshot):
+        return f"{self.epoch}-{snapshot.tracker_names.version}"
+
+
+# Mappings handed on from the previous snapshot are already read-only
+def _read_only(mapping):
+    return mapping if isinstance(mapping, MappingProxyType) else MappingProxyType(mapping)
+
+
+def _rounded(values):
+    return values.astype(np.float64).round(JSON_DECIMALS).tolist()
+
+
+# The trackers of one source as a list of objects holding the fields they were sent with
+def _source_trackers(state, names):
+    rows = state.rows
+    fields = rows['fields'].tolist()
+    columns = {name: rows[name].tolist() if name == 'timestamp' else _rounded(rows[name]) for name in FIELD_BITS}
+    trackers = []
+    for index, tracker_id in enumerate(rows['id'].tolist()):
+        mask = fields[index]
+        tracker = {'id': tracker_id, 'name': names.get((state.source, tracker_id)),
+                   'stale': bool(mask & FIELD_STALE)}
+        for name, bit in FIELD_BITS.items():
+            if mask & bit:
+                tracker[name] = columns[name][index]
+        trackers.append(tracker)
+    return trackers
+
+
+def _state_json(snapshot):
+    sources = {}
+    for source, state in sorted(snapshot.sources.items()):
+        sources[source] = {'packet_timestamp': state.packet_timestamp, 'frame_id': state.frame_id,
+                           'complete': state.complete, 'received': state.received,
+                           'trackers': _source_trackers(state, snapshot.names)}
+    return json.dumps({'version': snapshot.version, 'published': snapshot.published,
+                       'sources': sources}).encode()
+
+
+def _trackers_json(tracker_names):
+    trackers = [{'source': source, 'system_name': system_name, 'id': tracker_id, 'name': name}
+                for (source, system_name, tracker_id), name in sorted(tracker_names.trackers.items(),
+                                                                      key=lambda item: (item[0][0], item[0][2]))]
+    return json.dumps({'version': tracker_names.version, 'trackers': trackers}).encode()
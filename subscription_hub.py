@@ -0,0 +1,343 @@
+import json
+import logging
+import selectors
+import socket
+import threading
+import time
+from collections import deque
+import numpy as np
+from forwarder import decode_frame, RECORD_HEADER, FRAME_HEADER, RECORD_TRACKER_FRAME
+from tracker_frame import (MAX_TRACKERS, FIELD_POS, FIELD_SPEED, FIELD_ORI, FIELD_STATUS, FIELD_ACCEL,
+                           FIELD_TRGTPOS, FIELD_TIMESTAMP)
+from frame_assembler import FIELD_STALE
+from coordinate_spaces import CoordinateSpaces
+
+# Fan-out of tracker frames to any number of TCP subscribers.
+#
+# A client connects and sends a subscription as one line of JSON, which it may replace
+# at any time by sending another:
+#
+#   {"trackers": [1, 2, 5], "fields": ["pos", "ori"], "max_rate": 30, "sources": ["10.0.0.5"],
+#    "space": "stage"}
+#
+# Every key is optional; a missing one means all trackers, fields or sources, no rate
+# limit and PSN coordinates. "space" names one of the hub's coordinate spaces (see
+# coordinate_spaces.py); each frame is transformed into a space once, however many
+# subscribers use it. The hub sends back forwarder records (RECORD_HEADER followed by a
+# RECORD_TRACKER_FRAME payload, read with decode_frame) holding only the subscribed rows,
+# with 'fields' reduced to the subscribed bits.
+#
+# Each subscriber keeps at most one pending frame per source: a newer frame replaces one
+# that was not sent yet. Frames are filtered when they are written, at the subscriber's
+# rate, and only once its previous writes have reached the socket, so a slow client
+# holds back nobody but itself and costs a bounded amount of memory. One selector thread
+# serves every client.
+
+logger = logging.getLogger('DataParser')
+
+HUB_ADDRESS = ('localhost', 6003)
+# Frames waiting for the hub thread; the oldest are dropped past this
+HUB_QUEUE_SIZE = 1024
+# A subscription line longer than this closes the connection
+MAX_SUBSCRIPTION_SIZE = 65536
+RECEIVE_SIZE = 4096
+
+FIELD_BITS = {'pos': FIELD_POS, 'speed': FIELD_SPEED, 'ori': FIELD_ORI, 'status': FIELD_STATUS, 'accel': FIELD_ACCEL,
+              'trgtpos': FIELD_TRGTPOS, 'timestamp': FIELD_TIMESTAMP}
+ALL_FIELDS = sum(FIELD_BITS.values())
+
+
+class Subscriber:
+    def __init__(self, sock, address, spaces, capacity=MAX_TRACKERS):
+        self.sock = sock
+        self.address = address
+        self.spaces = spaces
+        self.capacity = capacity
+        self.inbox = bytearray()
+        self.outbox = bytearray()
+        self.trackers = None
+        self.fields = ALL_FIELDS
+        self.interval = 0.0
+        self.sources = None
+        self.space = None
+        # Source -> latest frame payload not sent yet, and the time its next frame is due
+        self.pending = {}
+        self.next_due = {}
+        self.sent = 0
+        self.coalesced = 0
+
+    # Applies a subscription line. The whole request is checked before any of it is
+    # applied, so an invalid one raises ValueError and leaves the previous subscription.
+    def subscribe(self, message):
+        request = json.loads(message)
+        if not isinstance(request, dict):
+            raise ValueError("A subscription must be a JSON object")
+        trackers = request.get('trackers')
+        fields = request.get('fields')
+        max_rate = request.get('max_rate')
+        sources = request.get('sources')
+        space = request.get('space')
+        if trackers is not None and not _is_list_of(trackers, int):
+            raise ValueError("'trackers' must be a list of tracker IDs")
+        if fields is not None and not _is_list_of(fields, str):
+            raise ValueError("'fields' must be a list of field names")
+        if max_rate is not None and (not isinstance(max_rate, (int, float)) or isinstance(max_rate, bool) or
+                                     not 0 <= max_rate < float('inf')):
+            raise ValueError("'max_rate' must be a number, 0 for no limit")
+        if sources is not None and not _is_list_of(sources, str):
+            raise ValueError("'sources' must be a list of IP addresses")
+        if space is not None and space not in self.spaces:
+            raise ValueError(f"Unknown coordinate space: {space!r}")
+        unknown = set(fields or ()) - set(FIELD_BITS)
+        if unknown:
+            raise ValueError(f"Unknown fields: {sorted(unknown)}")
+
+        selected = None
+        if trackers is not None:
+            selected = np.zeros(self.capacity, dtype=bool)
+            selected[[tracker_id for tracker_id in trackers if 0 <= tracker_id < self.capacity]] = True
+        self.trackers = selected
+        self.fields = ALL_FIELDS if fields is None else sum(FIELD_BITS[name] for name in set(fields))
+        self.interval = 1.0 / max_rate if max_rate else 0.0
+        self.sources = None if sources is None else set(sources)
+        self.space = space
+
+    def offer(self, source, payload):
+        if self.sources is not None and source not in self.sources:
+            return
+        if source in self.pending:
+            self.coalesced += 1
+        self.pending[source] = payload
+
+    # Moves the pending frames that are due into the outbox. Returns the time the next
+    # pending frame is due, or None.
+    def fill(self, now):
+        next_due = None
+        for source in list(self.pending):
+            due = self.next_due.get(source, 0.0)
+            if now < due:
+                next_due = due if next_due is None else min(next_due, due)
+                continue
+            record = self._filter(self.pending.pop(source))
+            self.outbox += RECORD_HEADER.pack(len(record), RECORD_TRACKER_FRAME)
+            self.outbox += record
+            self.sent += 1
+            if self.interval:
+                # Keep to the rate's grid unless the source paused for longer than a period
+                self.next_due[source] = due + self.interval if now - due < self.interval else now + self.interval
+        return next_due
+
+    def _filter(self, payload):
+        if self.trackers is None and self.fields == ALL_FIELDS and self.space is None:
+            return payload
+        source, packet_timestamp, frame_id, _, _, rows = decode_frame(payload)
+        if self.space is not None:
+            rows = self.spaces.transform(rows, self.space, (source, packet_timestamp, frame_id))
+            if self.trackers is None and self.fields == ALL_FIELDS:
+                return bytes(payload[:FRAME_HEADER.size]) + rows.tobytes()
+        keep = rows['fields'] & self.fields != 0
+        if self.trackers is not None:
+            keep &= self.trackers[np.minimum(rows['id'], self.capacity - 1)] & (rows['id'] < self.capacity)
+        rows = rows[keep]
+        rows['fields'] &= self.fields | FIELD_STALE
+        return bytes(payload[:FRAME_HEADER.size]) + rows.tobytes()
+
+
+def _is_list_of(value, kind):
+    return isinstance(value, list) and all(isinstance(item, kind) and not isinstance(item, bool) for item in value)
+
+
+class SubscriptionHub:
+    def __init__(self, address=HUB_ADDRESS, queue_size=HUB_QUEUE_SIZE, spaces=None):
+        self.address = address
+        self.spaces = spaces if spaces is not None else CoordinateSpaces()
+        self.subscribers = {}
+        self.published = 0
+        self.consumed = 0
+        self._queue = deque(maxlen=queue_size)
+        self._selector = selectors.DefaultSelector()
+        self._server = None
+        self._wake_reader, self._wake_writer = socket.socketpair()
+        self._wake_reader.setblocking(False)
+        self._wake_writer.setblocking(False)
+        self._woken = False
+        self._running = False
+        self._thread = None
+
+    def start(self):
+        self._server = socket.create_server(self.address)
+        self._server.setblocking(False)
+        self._selector.register(self._server, selectors.EVENT_READ, self._accept)
+        self._selector.register(self._wake_reader, selectors.EVENT_READ, self._drain_wakeups)
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name='SubscriptionHub', daemon=True)
+        self._thread.start()
+        logger.info("Subscription hub listening on %s:%d", *self.address)
+
+    def stop(self, timeout=1.0):
+        self._running = False
+        self._wake()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    # Hands a RECORD_TRACKER_FRAME payload to every subscriber. Called from the thread
+    # that receives frames; it never blocks.
+    def publish(self, payload):
+        # The deque's maxlen discards the oldest frame; counting that here would race with
+        # the hub thread emptying the queue, so drops are counted as published - consumed
+        self._queue.append(payload)
+        self.published += 1
+        if not self._woken:
+            self._wake()
+
+    # Frames discarded because the hub thread fell behind by more than the queue size
+    @property
+    def dropped(self):
+        return self.published - self.consumed - len(self._queue)
+
+    def _wake(self):
+        self._woken = True
+        try:
+            self._wake_writer.send(b'\0')
+        except BlockingIOError:
+            pass
+
+    def _run(self):
+        timeout = None
+        while self._running:
+            for key, events in self._selector.select(timeout):
+                key.data(key.fileobj, events)
+            timeout = self._fill(time.monotonic())
+        for subscriber in list(self.subscribers.values()):
+            self._close(subscriber)
+        self._selector.unregister(self._server)
+        self._server.close()
+
+    def _drain_wakeups(self, sock, events):
+        self._woken = False
+        try:
+            while sock.recv(RECEIVE_SIZE):
+                pass
+        except BlockingIOError:
+            pass
+        queue = self._queue
+        subscribers = self.subscribers.values()
+        while queue:
+            try:
+                payload = queue.popleft()
+            except IndexError:
+                break
+            self.consumed += 1
+            source = socket.inet_ntoa(bytes(payload[:4]))
+            for subscriber in subscribers:
+                subscriber.offer(source, payload)
+
+    # Writes what is due to every subscriber whose previous writes went out; returns the
+    # select timeout until the next rate-limited frame is due
+    def _fill(self, now):
+        timeout = None
+        for subscriber in list(self.subscribers.values()):
+            if subscriber.outbox:
+                continue
+            due = subscriber.fill(now)
+            if due is not None:
+                timeout = due - now if timeout is None else min(timeout, due - now)
+            if subscriber.outbox:
+                self._write(subscriber)
+        return None if timeout is None else max(timeout, 0.0)
+
+    def _accept(self, server, events):
+        try:
+            sock, address = server.accept()
+        except BlockingIOError:
+            return
+        sock.setblocking(False)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        subscriber = Subscriber(sock, address, self.spaces)
+        self.subscribers[sock] = subscriber
+        self._selector.register(sock, selectors.EVENT_READ, self._service)
+        logger.info("Subscriber connected from %s:%d", *address)
+
+    def _service(self, sock, events):
+        subscriber = self.subscribers.get(sock)
+        if subscriber is None:
+            return
+        if events & selectors.EVENT_READ and not self._read(subscriber):
+            return
+        if events & selectors.EVENT_WRITE:
+            self._write(subscriber)
+
+    # Applies every complete subscription line; returns False once the subscriber is gone
+    def _read(self, subscriber):
+        try:
+            data = subscriber.sock.recv(RECEIVE_SIZE)
+        except BlockingIOError:
+            return True
+        except OSError:
+            data = b''
+        if not data:
+            self._close(subscriber)
+            return False
+        subscriber.inbox += data
+        while b'\n' in subscriber.inbox:
+            line, _, rest = bytes(subscriber.inbox).partition(b'\n')
+            subscriber.inbox = bytearray(rest)
+            try:
+                subscriber.subscribe(line)
+                logger.info("Subscriber %s:%d subscribed: %s", *subscriber.address, line.decode(errors='replace'))
+            except ValueError as e:
+                logger.warning("Invalid subscription from %s:%d: %s", *subscriber.address, e)
+            except Exception as e:
+                # Never let one client take the hub thread down
+                logger.error("Error applying subscription from %s:%d, closing: %s", *subscriber.address, e)
+                self._close(subscriber)
+                return False
+        if len(subscriber.inbox) > MAX_SUBSCRIPTION_SIZE:
+            logger.warning("Subscription from %s:%d too long, closing", *subscriber.address)
+            self._close(subscriber)
+            return False
+        return True
+
+    def _write(self, subscriber):
+        try:
+            sent = subscriber.sock.send(subscriber.outbox)
+        except BlockingIOError:
+            sent = 0
+        except OSError:
+            self._close(subscriber)
+            return
+        del subscriber.outbox[:sent]
+        events = selectors.EVENT_READ | (selectors.EVENT_WRITE if subscriber.outbox else 0)
+        self._selector.modify(subscriber.sock, events, self._service)
+
+    def _close(self, subscriber):
+        self.subscribers.pop(subscriber.sock, None)
+        self._selector.unregister(subscriber.sock)
+        subscriber.sock.close()
+        logger.info("Subscriber %s:%d disconnected (%d frames sent, %d coalesced)", *subscriber.address,
+                    subscriber.sent, subscriber.coalesced)
+
+
+# Client side: subscribes with the given filters and yields every frame received, as
+# returned by decode_frame
+def iter_subscription(address=HUB_ADDRESS, trackers=None, fields=None, max_rate=None, sources=None, space=None):
+    request = {key: value for key, value in (('trackers', trackers), ('fields', fields), ('max_rate', max_rate),
+                                             ('sources', sources), ('space', space)) if value is not None}
+    with socket.create_connection(address) as sock:
+        sock.sendall(json.dumps(request).encode() + b'\n')
+        buffer = bytearray()
+        while True:
+            data = sock.recv(65536)
+            if not data:
+                return
+            buffer += data
+            offset = 0
+            while offset + RECORD_HEADER.size <= len(buffer):
+                length, kind = RECORD_HEADER.unpack_from(buffer, offset)
+                end = offset + RECORD_HEADER.size + length
+                if end > len(buffer):
+                    break
+                if kind == RECORD_TRACKER_FRAME:
+                    yield decode_frame(bytes(buffer[offset + RECORD_HEADER.size:end]))
+                offset = end
+            del buffer[:offset]
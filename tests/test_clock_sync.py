@@ -0,0 +1,128 @@
+import numpy as np
+import pytest
+from clock_sync import ClockEstimator, LatencyMonitor, RollingStats, JITTER_GAIN, FLUSH_INTERVAL, OBSERVATION_BATCH
+
+OFFSET_NS = 5_000_000_000_000
+DRIFT = 30e-6
+FRAME_US = 16667
+
+
+# Local arrival of a packet stamped server_us by a server whose clock runs DRIFT fast,
+# after a fixed 200 us path plus queueing
+def arrival(server_us, queueing_ns=0):
+    return int(server_us * 1000 * (1 + DRIFT)) + OFFSET_NS + 200_000 + queueing_ns
+
+
+def test_clock_follows_offset_and_drift():
+    rng = np.random.default_rng(3)
+    server_us = 1_000_000 + np.arange(3000) * FRAME_US
+    arrivals = np.array([arrival(server, int(queueing))
+                         for server, queueing in zip(server_us.tolist(), rng.exponential(300_000, 3000))])
+    clock = ClockEstimator()
+    for start in range(0, 3000, 200):
+        clock.observe_many(server_us[start:start + 200], arrivals[start:start + 200])
+    assert clock.drift == pytest.approx(DRIFT, rel=0.05)
+    expected = np.array([arrival(server) for server in server_us[-100:].tolist()])
+    # Aligned to the fastest packets, within a few microseconds
+    assert np.abs(clock.to_local(server_us[-100:]) - expected).max() < 5_000
+
+
+def test_batched_warmup_matches_single_samples():
+    rng = np.random.default_rng(5)
+    server_us = 1_000_000 + np.arange(20) * FRAME_US
+    arrivals = np.array([arrival(server, int(queueing)) for server, queueing in
+                         zip(server_us.tolist(), rng.integers(0, 500_000, 20))])
+    single, batched = ClockEstimator(), ClockEstimator()
+    for server, arrival_ns in zip(server_us.tolist(), arrivals.tolist()):
+        single.observe(server, arrival_ns)
+    batched.observe_many(server_us[:7], arrivals[:7])
+    batched.observe_many(server_us[7:], arrivals[7:])
+    assert (batched.offset, batched.reference, batched.count, batched.head) == (
+        single.offset, single.reference, single.count, single.head)
+    assert (batched._delta == single._delta).all()
+
+
+def test_clock_reset_in_a_batch_starts_over():
+    clock = ClockEstimator()
+    server_us = np.array([10_000_000, 10_016_667, 20_000, 36_667])
+    clock.observe_many(server_us, np.array([arrival(server) for server in server_us.tolist()]))
+    assert clock.resets == 1
+    assert (clock.count, clock.newest) == (2, 36_667_000)
+
+
+def test_rolling_stats_keep_the_latest_window():
+    stats = RollingStats(window=4)
+    stats.add(1.0)
+    stats.add_many(np.array([2.0, 3.0]))
+    assert (stats.count, stats.head) == (3, 3)
+    stats.add_many(np.arange(10.0, 16.0))
+    assert (stats.count, stats.head) == (4, 1)
+    assert sorted(stats.values.tolist()) == [12.0, 13.0, 14.0, 15.0]
+    assert stats.values[stats.head - 1] == 15.0
+
+
+def test_monitor_measures_the_first_packet_of_every_frame():
+    monitor = LatencyMonitor()
+    rng = np.random.default_rng(7)
+    transits = []
+    for frame in range(200):
+        server_us = 1_000_000 + frame * FRAME_US
+        first = arrival(server_us, int(rng.integers(0, 100_000)))
+        transits.append(first - server_us * 1000)
+        # Later packets of a frame share its timestamp and are not measured
+        for packet in range(3):
+            monitor.packet('10.0.0.1', server_us, first + packet * 30_000)
+        monitor.frame('10.0.0.1', server_us, first + 150_000)
+        if frame % 50 == 49:
+            monitor.flush()
+    state = monitor.sources['10.0.0.1']
+    assert state.network.count == 200
+    jitter = 0.0
+    for previous, transit in zip(transits, transits[1:]):
+        jitter += (abs(transit - previous) - jitter) * JITTER_GAIN
+    assert state.jitter == pytest.approx(jitter)
+    # Frames leave 90 us after the last packet of the frame
+    assert np.all(state.processing.values[:state.processing.count] == 90_000)
+    assert state.age.count == 200
+    assert 0 <= np.median(state.age.values[:state.age.count]) - 150_000 < 100_000
+
+
+def test_sources_are_measured_separately():
+    monitor = LatencyMonitor()
+    for frame in range(40):
+        server_us = 1_000_000 + frame * FRAME_US
+        monitor.packet('10.0.0.1', server_us, arrival(server_us))
+        monitor.packet('10.0.0.2', server_us + 7, arrival(server_us) + 5_000_000)
+        monitor.frame('10.0.0.1', server_us, arrival(server_us) + 10_000)
+    monitor.flush()
+    first, second = monitor.sources['10.0.0.1'], monitor.sources['10.0.0.2']
+    assert (first.network.count, second.network.count) == (40, 40)
+    assert np.all(first.processing.values[:first.processing.count] == 10_000)
+    assert second.processing.count == 0
+    assert second.clock.offset - first.clock.offset == pytest.approx(5_000_000 - 7000, abs=1000)
+
+
+def test_tick_flushes_after_the_interval_or_a_full_batch():
+    monitor = LatencyMonitor()
+    now = monitor._next_flush - FLUSH_INTERVAL
+    monitor.packet('10.0.0.1', 1_000_000, arrival(1_000_000))
+    monitor.tick(now)
+    assert monitor.sources == {}
+    monitor.tick(now + FLUSH_INTERVAL)
+    assert monitor.sources['10.0.0.1'].network.count == 1
+    for frame in range(OBSERVATION_BATCH):
+        monitor.packet('10.0.0.1', 2_000_000 + frame * FRAME_US, arrival(2_000_000 + frame * FRAME_US))
+    monitor.tick(now + FLUSH_INTERVAL)
+    assert monitor.sources['10.0.0.1'].network.count == 1 + OBSERVATION_BATCH
+
+
+def test_batches_longer_than_the_window_keep_its_latest_samples():
+    server_us = 1_000_000 + np.arange(1500) * FRAME_US
+    arrivals = np.array([arrival(server) for server in server_us.tolist()])
+    single, batched = ClockEstimator(window=256), ClockEstimator(window=256)
+    for server, arrival_ns in zip(server_us.tolist(), arrivals.tolist()):
+        single.observe(server, arrival_ns)
+    batched.observe_many(server_us[:100], arrivals[:100])
+    batched.observe_many(server_us[100:], arrivals[100:])
+    assert (batched.head, batched.count) == (single.head, single.count)
+    assert (batched._server == single._server).all() and (batched._delta == single._delta).all()
@@ -0,0 +1,112 @@
+import numpy as np
+import pytest
+from tracker_frame import TrackerFrame, FIELD_POS, FIELD_STATUS
+from recording import SessionRecorder, SessionFile
+from psn_generator import PSNGenerator
+from columnar_export import ColumnarWriter, ColumnarFile, convert_recording, source_address, COLUMN_NAMES
+
+START_NS = 1_700_000_000_000_000_000
+FRAME_NS = 10_000_000
+
+
+# Frames of two sources: frame i of 10.0.0.1 holds trackers 0..4 at x = i, and every
+# other frame comes from 10.0.0.2 with trackers 100..101
+def write_export(path, frames=25, frames_per_group=4):
+    writer = ColumnarWriter(str(path), frames_per_group)
+    frame = TrackerFrame()
+    for i in range(frames):
+        frame.reset()
+        if i % 2:
+            frame.source, ids = '10.0.0.2', [100, 101]
+        else:
+            frame.source, ids = '10.0.0.1', list(range(5))
+        frame.packet_timestamp = i * 1000
+        frame.frame_id = i
+        frame.trackers['fields'][ids] = FIELD_POS | FIELD_STATUS
+        frame.trackers['pos'][ids, 0] = i
+        frame.trackers['status'][ids] = 0.5
+        writer.add_frame(frame, START_NS + i * FRAME_NS)
+    writer.close()
+    return writer
+
+
+def test_rows_round_trip(tmp_path):
+    writer = write_export(tmp_path / 'a.psncol')
+    export = ColumnarFile(str(tmp_path / 'a.psncol'))
+    try:
+        assert (export.frames, export.rows, len(export.groups)) == (25, writer.rows, 7)
+        assert export.start_time_ns == START_NS
+        assert export.duration == pytest.approx(24 * FRAME_NS / 1e9)
+        data = export.read()
+        assert set(data) == set(COLUMN_NAMES)
+        assert len(data['id']) == 13 * 5 + 12 * 2
+        assert np.all(np.diff(data['time']) >= 0)
+        first = data['frame_id'] == 0
+        assert data['id'][first].tolist() == list(range(5))
+        assert source_address(data['source'][first][0]) == '10.0.0.1'
+        assert np.all(data['pos'][:, 0] == data['frame_id'])
+        assert data['pos'].shape == (len(data['id']), 3)
+        assert np.all(data['status'] == np.float32(0.5))
+        assert export.tracker_ids().tolist() == [0, 1, 2, 3, 4, 100, 101]
+    finally:
+        export.close()
+
+
+def test_queries_filter_by_time_tracker_and_source(tmp_path):
+    write_export(tmp_path / 'a.psncol')
+    export = ColumnarFile(str(tmp_path / 'a.psncol'))
+    try:
+        data = export.read(['frame_id', 'id'], start=5 * FRAME_NS / 1e9, end=9 * FRAME_NS / 1e9)
+        assert sorted(set(data['frame_id'].tolist())) == [5, 6, 7, 8]
+        data = export.read(['id', 'frame_id'], trackers=[3, 101])
+        assert set(data['id'].tolist()) == {3, 101}
+        assert len(data['id']) == 25
+        data = export.read(['source'], sources=['10.0.0.2'])
+        assert len(data['source']) == 24
+        assert export.read(['id'], trackers=[5000])['id'].shape == (0,)
+        with pytest.raises(ValueError):
+            export.read(['colour'])
+    finally:
+        export.close()
+
+
+def test_truncated_export_is_readable_up_to_its_last_whole_group(tmp_path):
+    write_export(tmp_path / 'a.psncol')
+    data = (tmp_path / 'a.psncol').read_bytes()
+    (tmp_path / 'b.psncol').write_bytes(data[:-10])
+    export = ColumnarFile(str(tmp_path / 'b.psncol'))
+    try:
+        assert (export.frames, len(export.groups)) == (24, 6)
+    finally:
+        export.close()
+
+
+@pytest.mark.parametrize('data', [b'', b'PSNCOL', b'X' * 64])
+def test_invalid_export_raises(tmp_path, data):
+    (tmp_path / 'a.psncol').write_bytes(data)
+    with pytest.raises(ValueError):
+        ColumnarFile(str(tmp_path / 'a.psncol'))
+
+
+def test_recording_converts_to_export(tmp_path):
+    generator = PSNGenerator(30, seed=1)
+    recorder = SessionRecorder(str(tmp_path / 'a.rec'))
+    for i in range(20):
+        for packet in generator.frame(i / 60):
+            recorder.record(packet, '10.0.0.7', i * 16_666_667)
+    recorder.close()
+    session = SessionFile(str(tmp_path / 'a.rec'))
+    writer = ColumnarWriter(str(tmp_path / 'a.psncol'), 8)
+    try:
+        assert convert_recording(session, writer) == 20
+    finally:
+        writer.close()
+        session.close()
+    export = ColumnarFile(str(tmp_path / 'a.psncol'))
+    try:
+        data = export.read(['id', 'frame_id', 'source'])
+        assert len(data['id']) == 20 * 30
+        assert sorted(set(data['frame_id'].tolist())) == list(range(20))
+        assert {source_address(value) for value in set(data['source'].tolist())} == {'10.0.0.7'}
+    finally:
+        export.close()
@@ -0,0 +1,89 @@
+import numpy as np
+import pytest
+from tracker_frame import TrackerFrame, FIELD_POS, FIELD_SPEED, FIELD_ORI
+from coordinate_spaces import (CoordinateSpaces, transform_rows, definition_matrix, axes_matrix,
+                               rotation_vectors_to_quaternions, quaternions_to_rotation_vectors)
+
+DEFINITIONS = {
+    'stage': {'translate': [0, -4.5, 0], 'rotate': [0, 0, 90]},
+    'truss': {'parent': 'stage', 'translate': [0, 0, -6.2]},
+    'console': {'parent': 'stage', 'axes': 'x,z,-y', 'units': 'mm'},
+}
+
+
+def frame_rows(count=3):
+    frame = TrackerFrame()
+    frame.source = '10.0.0.1'
+    frame.packet_timestamp = 1000
+    frame.frame_id = 1
+    frame.trackers['fields'][:count] = FIELD_POS | FIELD_SPEED | FIELD_ORI
+    frame.trackers['pos'][:count] = np.eye(3)[:count]
+    frame.trackers['speed'][:count] = [1, 0, 0]
+    frame.trackers['ori'][:count] = [0, 0, 0.3]
+    return frame
+
+
+def test_rotation_and_translation():
+    spaces = CoordinateSpaces(DEFINITIONS)
+    rows = spaces.transform_frame(frame_rows(), 'stage')
+    np.testing.assert_allclose(rows['pos'], [[0, -3.5, 0], [-1, -4.5, 0], [0, -4.5, 1]], atol=1e-6)
+    # Velocities rotate but do not move
+    np.testing.assert_allclose(rows['speed'], [[0, 1, 0]] * 3, atol=1e-6)
+    np.testing.assert_allclose(rows['ori'], [[0, 0, 0.3 + np.pi / 2]] * 3, atol=1e-6)
+
+
+def test_parent_transform_is_applied_first():
+    spaces = CoordinateSpaces(DEFINITIONS)
+    rows = spaces.transform_frame(frame_rows(1), 'truss')
+    np.testing.assert_allclose(rows['pos'][0], [0, -3.5, -6.2], atol=1e-6)
+
+
+def test_axes_and_units():
+    spaces = CoordinateSpaces(DEFINITIONS)
+    rows = spaces.transform_frame(frame_rows(1), 'console')
+    np.testing.assert_allclose(rows['pos'][0], [0, 0, 3500], atol=1e-3)
+
+
+# Under a mirrored convention the rotation vectors are mirrored as axial vectors, with
+# the scale of the units divided out
+def test_mirrored_scaled_orientation():
+    vectors = np.array([[0.1, -0.4, 0.3], [0.0, 0.0, 1.2]])
+    matrix = definition_matrix({'axes': 'x,y,-z', 'units': 'mm'})
+    frame = TrackerFrame()
+    frame.trackers['fields'][:2] = FIELD_ORI
+    frame.trackers['ori'][:2] = vectors
+    rows = transform_rows(frame.active(), matrix)
+    np.testing.assert_allclose(rows['ori'], -(vectors @ axes_matrix('x,y,-z').T), atol=1e-6)
+
+
+def test_inverse_transform_round_trips():
+    matrix = definition_matrix({'rotate': [10, 20, 30], 'translate': [1, 2, 3], 'scale': 2.0})
+    frame = frame_rows()
+    original = frame.active()
+    rows = transform_rows(transform_rows(original.copy(), matrix), np.linalg.inv(matrix))
+    np.testing.assert_allclose(rows['pos'], original['pos'], atol=1e-5)
+    np.testing.assert_allclose(rows['speed'], original['speed'], atol=1e-5)
+    np.testing.assert_allclose(quaternions_to_rotation_vectors(rotation_vectors_to_quaternions(
+        rows['ori'].astype(np.float64))), original['ori'], atol=1e-5)
+
+
+def test_results_are_cached_per_frame_and_space():
+    spaces = CoordinateSpaces(DEFINITIONS)
+    frame = frame_rows()
+    first = spaces.transform_frame(frame, 'stage')
+    assert spaces.transform_frame(frame, 'stage') is first
+    assert (spaces.hits, spaces.misses) == (1, 1)
+    assert not first.flags.writeable
+    frame.frame_id = 2
+    assert spaces.transform_frame(frame, 'stage') is not first
+
+
+@pytest.mark.parametrize('definitions', [
+    {'a': {'parent': 'b'}, 'b': {'parent': 'a'}},
+    {'a': {'parent': 'missing'}},
+    {'a': {'axes': 'x,x,z'}},
+    {'a': {'units': 'cubits'}},
+])
+def test_invalid_definitions_raise(definitions):
+    with pytest.raises(ValueError):
+        CoordinateSpaces(definitions)
@@ -0,0 +1,48 @@
+import pytest
+from multiprocessing.connection import Listener
+from forwarder import IPCForwarder, iter_records, DROP_OLDEST, DROP_NEWEST
+
+ADDRESS = ('localhost', 0)
+AUTHKEY = b'test key'
+
+
+@pytest.mark.parametrize('policy, kept', [(DROP_OLDEST, [b'2', b'3', b'4']), (DROP_NEWEST, [b'0', b'1', b'2'])])
+def test_full_queue_drops_by_policy(policy, kept):
+    forwarder = IPCForwarder(ADDRESS, AUTHKEY, max_queue=3, policy=policy)
+    accepted = [forwarder.submit(1, str(i).encode()) for i in range(5)]
+    assert accepted == [True, True, True] + [policy == DROP_OLDEST] * 2
+    assert (forwarder.queued, forwarder.dropped) == (3, 2)
+    assert [bytes(payload) for _, payload in iter_records(forwarder._take_batch())] == kept
+    assert forwarder.queued == 0
+
+
+def test_unknown_policy_raises():
+    with pytest.raises(ValueError):
+        IPCForwarder(ADDRESS, AUTHKEY, policy='drop-all')
+
+
+def test_batches_are_limited_to_batch_size():
+    forwarder = IPCForwarder(ADDRESS, AUTHKEY, batch_size=2)
+    for i in range(5):
+        forwarder.submit(i % 3, bytes(i))
+    records = list(iter_records(forwarder._take_batch()))
+    assert [(kind, len(payload)) for kind, payload in records] == [(0, 0), (1, 1)]
+    assert forwarder.queued == 3
+
+
+def test_records_reach_the_listener():
+    with Listener(ADDRESS, authkey=AUTHKEY) as listener:
+        forwarder = IPCForwarder(listener.address, AUTHKEY)
+        forwarder.start()
+        try:
+            with listener.accept() as conn:
+                forwarder.submit(2, b'frame')
+                forwarder.submit(3, b'info')
+                received = []
+                while len(received) < 2:
+                    assert conn.poll(5)
+                    received += [(kind, bytes(payload)) for kind, payload in iter_records(conn.recv_bytes())]
+        finally:
+            forwarder.stop()
+    assert received == [(2, b'frame'), (3, b'info')]
+    assert (forwarder.sent, forwarder.dropped) == (2, 0)
@@ -0,0 +1,98 @@
+import numpy as np
+from psn_decoder import parse_chunks, data_frame
+from psn_generator import encode_data_packets, new_tracker_chunks
+from frame_assembler import FrameAssembler, FIELD_STALE
+from metrics import RESYNC_FRAMES
+
+SOURCE = '10.0.0.1'
+TRACKERS = 20
+# Small enough to split a frame of TRACKERS trackers over several packets
+PACKET_SIZE = 600
+
+
+# The data packets of one frame, every tracker at x = frame_id
+def frame_packets(frame_id, timestamp=None):
+    chunks = new_tracker_chunks(range(TRACKERS))
+    chunks['pos'][:, 0] = frame_id
+    return encode_data_packets(chunks, frame_id * 1000 if timestamp is None else timestamp, frame_id, PACKET_SIZE)
+
+
+# Decodes a packet into the assembler; returns (frame ID, complete, rows) of each frame
+# it emitted, rows copied as the assembler reuses its frames
+def feed(assembler, packet, now=0.0, source=SOURCE):
+    emitted = []
+    for chunk_type, _ in parse_chunks(packet):
+        if chunk_type == 'PSN_DATA_PACKET':
+            emitted += [(frame.frame_id, frame.complete, frame.active().copy())
+                        for frame in assembler.add(data_frame, source, now)]
+    return emitted
+
+
+def expire(assembler, now):
+    return [(frame.frame_id, frame.complete, frame.active().copy()) for frame in assembler.expire(now)]
+
+
+def test_frame_split_over_packets_is_emitted_once_complete():
+    assembler = FrameAssembler()
+    packets = frame_packets(1)
+    assert len(packets) > 1
+    emitted = []
+    for packet in packets[:-1]:
+        emitted += feed(assembler, packet)
+    assert emitted == []
+    emitted += feed(assembler, packets[-1])
+    [(frame_id, complete, rows)] = emitted
+    assert (frame_id, complete) == (1, True)
+    assert rows['id'].tolist() == list(range(TRACKERS))
+    assert np.all(rows['pos'][:, 0] == 1)
+
+
+def test_partial_frame_carries_missing_trackers_over_as_stale():
+    assembler = FrameAssembler(timeout=0.05)
+    for packet in frame_packets(1):
+        feed(assembler, packet)
+    packets = frame_packets(2)
+    feed(assembler, packets[0], now=1.0)
+    [(frame_id, complete, rows)] = expire(assembler, 2.0)
+    assert (frame_id, complete) == (2, False)
+    assert len(rows) == TRACKERS
+    stale = rows['fields'] & FIELD_STALE != 0
+    assert stale.any() and not stale.all()
+    assert np.all(rows['pos'][stale, 0] == 1)
+    assert np.all(rows['pos'][~stale, 0] == 2)
+
+
+def test_late_packet_of_emitted_frame_is_dropped():
+    assembler = FrameAssembler()
+    late = frame_packets(10)
+    emitted = []
+    for packet in late[:-1]:
+        emitted += feed(assembler, packet)
+    for packet in frame_packets(11):
+        emitted += feed(assembler, packet, now=0.01)
+    assert [(frame_id, complete) for frame_id, complete, _ in emitted] == [(10, False), (11, True)]
+    assert feed(assembler, late[-1], now=0.02) == []
+    assert assembler.late_packets == 1
+    assert assembler.pending == []
+
+
+def test_restarted_server_is_resynchronized():
+    assembler = FrameAssembler()
+    for packet in frame_packets(100):
+        feed(assembler, packet)
+    # The server restarts and counts from 50, behind the last frame emitted
+    emitted = []
+    for frame_id in range(50, 50 + RESYNC_FRAMES + 1):
+        for packet in frame_packets(frame_id):
+            emitted += feed(assembler, packet)
+    assert [frame_id for frame_id, _, _ in emitted] == list(range(50 + RESYNC_FRAMES - 1, 50 + RESYNC_FRAMES + 1))
+
+
+def test_frame_ids_wrap_around():
+    assembler = FrameAssembler()
+    emitted = []
+    for frame_id in (254, 255, 0, 1):
+        for packet in frame_packets(frame_id):
+            emitted += feed(assembler, packet)
+    assert [frame_id for frame_id, _, _ in emitted] == [254, 255, 0, 1]
+    assert assembler.late_packets == 0
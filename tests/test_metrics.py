@@ -0,0 +1,71 @@
+import random
+from bisect import bisect_left
+import numpy as np
+from metrics import ReceiverMetrics, FrameGapDetector, Histogram, PACKET_BATCH, FLUSH_INTERVAL, LATENCY_BUCKETS_NS
+
+
+def test_histogram_batches_bin_like_single_observations():
+    values = np.random.default_rng(1).integers(0, 200_000_000, 2000)
+    single, batched = Histogram('a', 'a'), Histogram('b', 'b')
+    for value in values.tolist():
+        single.observe(value)
+    batched.observe_many(values[:700])
+    batched.observe_many(values[700:])
+    assert batched.counts == single.counts
+    assert batched.sum == single.sum
+    # Values on a bound belong to its bucket, as with bisect_left
+    edges = Histogram('c', 'c')
+    edges.observe_many(np.array(LATENCY_BUCKETS_NS[:3]))
+    assert edges.counts[:4] == [1, 1, 1, 0]
+
+
+def test_packets_are_counted_when_flushed():
+    metrics = ReceiverMetrics()
+    for i in range(10):
+        metrics.packet('10.0.0.1' if i % 3 else '10.0.0.2', 100 + i, 0, 1000 * i, 1000 * i + 3000, 1000 * i + 7000)
+    assert metrics.sources.totals == {}
+    metrics.flush()
+    assert metrics.sources.totals == {'10.0.0.1': [6, 6 * 100 + 1 + 2 + 4 + 5 + 7 + 8], '10.0.0.2': [4, 400 + 18]}
+    assert metrics.receive_to_decode.sum == 1000 * sum(range(10))
+    assert metrics.decode.counts[bisect_left(LATENCY_BUCKETS_NS, 3000)] == 10
+    assert metrics.forward.sum == 40000
+
+
+def test_tick_flushes_after_the_interval_or_a_full_batch():
+    metrics = ReceiverMetrics()
+    now = metrics._next_flush - FLUSH_INTERVAL
+    metrics.packet('10.0.0.1', 100, 0, 1, 2, 3)
+    metrics.tick(now)
+    assert metrics.sources.totals == {}
+    metrics.tick(now + FLUSH_INTERVAL)
+    assert metrics.sources.totals['10.0.0.1'] == [1, 100]
+    for _ in range(PACKET_BATCH):
+        metrics.packet('10.0.0.1', 100, 0, 1, 2, 3)
+    metrics.tick(now + FLUSH_INTERVAL)
+    assert metrics.sources.totals['10.0.0.1'][0] == 1 + PACKET_BATCH
+
+
+def test_frame_gaps_are_counted_in_batches():
+    metrics = ReceiverMetrics()
+    for frame_id in [250, 250, 251, 253, 253, 254, 2, 3]:
+        metrics.frame('10.0.0.1', frame_id)
+    metrics.frame('10.0.0.2', 7)
+    metrics.flush()
+    assert metrics.frame_gaps.lost == {'10.0.0.1': 1 + 3}
+    assert metrics.frame_gaps.last == {'10.0.0.1': 3, '10.0.0.2': 7}
+
+
+def test_batched_frame_ids_match_single_observations():
+    rng = random.Random(4)
+    frame_id = 0
+    frame_ids = []
+    for _ in range(3000):
+        step = rng.choice([0, 0, 1, 1, 1, 2, 5, -1, -3, 100, 140])
+        frame_id = (frame_id + step) % 256
+        frame_ids.append(frame_id)
+    single, batched = FrameGapDetector(), FrameGapDetector()
+    for start in range(0, len(frame_ids), 37):
+        run = frame_ids[start:start + 37]
+        assert batched.observe_many('a', run) == sum(single.observe('a', frame_id) for frame_id in run)
+    assert (batched.lost, batched.out_of_order, batched.last) == (single.lost, single.out_of_order, single.last)
+    assert batched.sequence.resyncs == single.sequence.resyncs
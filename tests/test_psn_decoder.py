@@ -0,0 +1,81 @@
+import struct
+import pytest
+from psn_encoder import encode_chunk, encode_info_packets
+from psn_generator import encode_data_packets, new_tracker_chunks
+from psn_decoder import (parse_chunks, parse_psn_info_packet, parse_psn_info_tracker_list, decode_errors,
+                         InfoPacketCache, PSN_DATA_PACKET, PSN_INFO_TRACKER_NAME)
+
+
+@pytest.fixture(autouse=True)
+def clear_errors():
+    decode_errors.clear()
+    yield
+    decode_errors.clear()
+
+
+def oversized_header(chunk_id):
+    return struct.pack('<I', chunk_id | (0x7FFF << 16) | (1 << 31))
+
+
+def test_data_packet_round_trip():
+    chunks = new_tracker_chunks(range(3))
+    chunks['pos'][:, 1] = [1, 2, 3]
+    [packet] = encode_data_packets(chunks, timestamp=1234, frame_id=7)
+    [(chunk_type, parsed)] = parse_chunks(packet)
+    assert chunk_type == 'PSN_DATA_PACKET'
+    header = dict(parsed)['PSN_DATA_PACKET_HEADER']
+    frame = dict(parsed)['PSN_DATA_TRACKER_LIST']
+    assert (header.packet_timestamp, header.frame_id, header.frame_packet_count) == (1234, 7, 1)
+    assert frame.active()['pos'][:, 1].tolist() == [1, 2, 3]
+    assert not decode_errors
+
+
+def test_info_packet_round_trip():
+    [packet] = encode_info_packets('Server', {1: 'Lead', 4: 'Prop'}, timestamp=5, frame_id=2)
+    [(chunk_type, parsed)] = parse_chunks(packet)
+    assert chunk_type == 'PSN_INFO_PACKET'
+    parsed = dict(parsed)
+    assert parsed['PSN_INFO_SYSTEM_NAME'] == 'Server'
+    assert parsed['PSN_INFO_TRACKER_LIST'] == [('Lead', 1), ('Prop', 4)]
+    assert parsed['PSN_INFO_PACKET_HEADER'].frame_id == 2
+
+
+def test_oversized_packet_chunk_is_counted_not_raised():
+    assert parse_chunks(oversized_header(PSN_DATA_PACKET) + b'\0' * 16) == []
+    assert decode_errors['packet'] == 1
+
+
+def test_truncated_packet_is_dropped_and_counted():
+    chunks = new_tracker_chunks(range(3))
+    [packet] = encode_data_packets(chunks)
+    assert parse_chunks(packet[:-8]) == []
+    assert decode_errors['packet'] == 1
+
+
+def test_short_and_malformed_headers_are_counted():
+    assert parse_chunks(b'\x55\x67') == []
+    assert decode_errors['packet'] == 1
+    [(_, parsed)] = parse_chunks(encode_chunk(PSN_DATA_PACKET, encode_chunk(0, b'\0' * 5), True))
+    assert dict(parsed)['PSN_DATA_PACKET_HEADER'].frame_id == 0
+    assert decode_errors['data_packet_header'] == 1
+
+
+def test_info_tracker_with_oversized_name_is_counted():
+    name = oversized_header(PSN_INFO_TRACKER_NAME) + b'abc'
+    data = encode_chunk(3, name, True) + encode_chunk(4, encode_chunk(PSN_INFO_TRACKER_NAME, b'Ok'), True)
+    assert parse_psn_info_tracker_list(data) == [('', 3), ('Ok', 4)]
+    assert decode_errors['info_tracker'] == 1
+
+
+def test_info_cache_returns_the_same_chunks_while_unchanged():
+    cache = InfoPacketCache()
+    first, = encode_info_packets('Server', {1: 'Lead'}, frame_id=1)
+    second, = encode_info_packets('Server', {1: 'Lead'}, frame_id=2)
+    renamed, = encode_info_packets('Server', {1: 'Understudy'}, frame_id=3)
+    a = parse_psn_info_packet(first, 4, cache=cache)
+    b = parse_psn_info_packet(second, 4, cache=cache)
+    assert a[0][1].frame_id == 1 and b[0][1].frame_id == 2
+    assert all(x is y for x, y in zip(a[1:], b[1:]))
+    c = parse_psn_info_packet(renamed, 4, cache=cache)
+    assert dict(c)['PSN_INFO_TRACKER_LIST'] == [('Understudy', 1)]
+    assert (cache.hits, cache.misses) == (1, 2)
@@ -0,0 +1,89 @@
+import numpy as np
+from forwarder import encode_frame
+from tracker_frame import TrackerFrame, FIELD_POS
+from metrics import RESYNC_FRAMES
+from receive_workers import FrameMerger, WorkerStats, decode_worker_stats, shard_of
+
+
+def frame_payload(frame_id, source='10.0.0.1', trackers=(1, 2, 3), packets_received=1):
+    frame = TrackerFrame()
+    frame.source = source
+    frame.packet_timestamp = frame_id * 1000
+    frame.frame_id = frame_id
+    frame.frame_packet_count = 2
+    frame.packets_received = packets_received
+    frame.trackers['fields'][list(trackers)] = FIELD_POS
+    frame.trackers['pos'][list(trackers), 0] = frame_id
+    return encode_frame(frame)
+
+
+def test_frame_round_trips_through_the_merger():
+    merger = FrameMerger()
+    frame = merger.add(frame_payload(5, packets_received=2))
+    assert (frame.source, frame.frame_id, frame.packet_timestamp) == ('10.0.0.1', 5, 5000)
+    assert (frame.frame_packet_count, frame.packets_received, frame.complete) == (2, 2, True)
+    rows = frame.active()
+    assert rows['id'].tolist() == [1, 2, 3]
+    assert np.all(rows['pos'][:, 0] == 5)
+    assert not merger.add(frame_payload(6, packets_received=1)).complete
+
+
+def test_reused_frame_holds_only_the_latest_trackers():
+    merger = FrameMerger()
+    merger.add(frame_payload(1, trackers=(1, 2, 3)))
+    frame = merger.add(frame_payload(2, trackers=(7,)))
+    assert frame.active()['id'].tolist() == [7]
+
+
+def test_out_of_order_and_repeated_frames_are_dropped():
+    merger = FrameMerger()
+    assert merger.add(frame_payload(10)) is not None
+    assert merger.add(frame_payload(10)) is None
+    assert merger.add(frame_payload(9)) is None
+    assert merger.add(frame_payload(11)).frame_id == 11
+    assert merger.out_of_order == 2
+    assert merger.merged == 2
+
+
+def test_sources_are_ordered_independently():
+    merger = FrameMerger()
+    merger.add(frame_payload(200, source='10.0.0.1'))
+    assert merger.add(frame_payload(3, source='10.0.0.2')).frame_id == 3
+    assert merger.add(frame_payload(201, source='10.0.0.1')).source == '10.0.0.1'
+
+
+def test_restarted_server_is_resynchronized():
+    merger = FrameMerger()
+    merger.add(frame_payload(100))
+    merged = [merger.add(frame_payload(frame_id)) for frame_id in range(50, 50 + RESYNC_FRAMES + 1)]
+    assert [frame is not None for frame in merged] == [False] * (RESYNC_FRAMES - 1) + [True, True]
+
+
+def test_shards_are_stable_and_in_range():
+    sources = [f'10.0.0.{host}' for host in range(1, 50)]
+    shards = [shard_of(source, 4) for source in sources]
+    assert shards == [shard_of(source, 4) for source in sources]
+    assert set(shards) <= set(range(4))
+
+
+class Ring:
+    truncated = kernel_drops = drains = kernel_timestamps = 0
+
+
+def test_worker_stats_report_increments():
+    ring = Ring()
+    stats = WorkerStats()
+    for _ in range(3):
+        stats.count('10.0.0.1', 100)
+    stats.count('10.0.0.2', 40)
+    ring.kernel_drops, ring.drains = 5, 2
+    counters, sources = decode_worker_stats(stats.encode(ring))
+    assert counters == {'truncated': 0, 'kernel_drops': 5, 'drains': 2, 'kernel_timestamps': 0}
+    assert sorted(sources) == [('10.0.0.1', 3, 300), ('10.0.0.2', 1, 40)]
+
+    stats.count('10.0.0.2', 40)
+    ring.kernel_drops, ring.drains = 7, 3
+    counters, sources = decode_worker_stats(stats.encode(ring))
+    assert (counters['kernel_drops'], counters['drains']) == (2, 1)
+    assert sources == [('10.0.0.2', 1, 40)]
+    assert decode_worker_stats(stats.encode(ring)) == (dict.fromkeys(counters, 0), [])
@@ -0,0 +1,127 @@
+import os
+import pytest
+from recording import SessionRecorder, SessionFile, replay, decoder_sink, index_path, peek_frame_id, FILE_HEADER
+from psn_generator import PSNGenerator
+
+START_NS = 5_000_000_000
+FRAME_NS = 16_666_667
+PACKET_NS = 20_000
+
+
+# Records frames of 40 trackers split over several packets. Packet j of frame i arrives
+# at START_NS + i * FRAME_NS + j * PACKET_NS. Returns [(arrival, source, packet)].
+def record_session(path, frames=30, source='10.0.0.7'):
+    generator = PSNGenerator(40, max_packet_size=600, info_interval=0.2, seed=3)
+    recorder = SessionRecorder(str(path))
+    recorded = []
+    for i in range(frames):
+        for j, packet in enumerate(generator.frame(i * FRAME_NS / 1e9)):
+            arrival = START_NS + i * FRAME_NS + j * PACKET_NS
+            recorder.record(packet, source, arrival)
+            recorded.append((arrival, source, packet))
+    recorder.close()
+    return recorded
+
+
+def test_packets_round_trip(tmp_path):
+    recorded = record_session(tmp_path / 'a.rec')
+    session = SessionFile(str(tmp_path / 'a.rec'))
+    try:
+        packets = [(elapsed, source, bytes(data)) for elapsed, source, data in session.packets()]
+        assert [source for _, source, _ in packets] == [source for _, source, _ in recorded]
+        assert [data for _, _, data in packets] == [packet for _, _, packet in recorded]
+        # Every packet keeps its own arrival time, not the time of its frame
+        assert [round(elapsed * 1e9) for elapsed, _, _ in packets] == [arrival - START_NS for arrival, _, _ in recorded]
+        assert session.duration == pytest.approx((recorded[-1][0] - START_NS) / 1e9)
+    finally:
+        session.close()
+
+
+def test_index_has_one_entry_per_data_frame(tmp_path):
+    recorded = record_session(tmp_path / 'a.rec')
+    session = SessionFile(str(tmp_path / 'a.rec'))
+    try:
+        # Info packets come first whenever they are due, so a frame starts at its first
+        # data packet
+        starts = {}
+        for arrival, _, packet in recorded:
+            starts.setdefault(peek_frame_id(packet), arrival - START_NS)
+        starts.pop(None)
+        assert session.index['time'].tolist() == sorted(starts.values())
+        assert len(session.index) == 30
+    finally:
+        session.close()
+
+
+def test_seek_starts_at_the_frame_in_progress(tmp_path):
+    recorded = record_session(tmp_path / 'a.rec')
+    session = SessionFile(str(tmp_path / 'a.rec'))
+    try:
+        start = (10 * FRAME_NS + FRAME_NS // 2) / 1e9
+        packets = [(elapsed, bytes(data)) for elapsed, _, data in session.packets(start)]
+        assert round(packets[0][0] * 1e9) == 10 * FRAME_NS
+        assert peek_frame_id(packets[0][1]) == 10
+        assert len(packets) == sum(1 for arrival, _, _ in recorded if arrival >= START_NS + 10 * FRAME_NS)
+        # Before the start and past the end
+        assert session.seek(-1.0) == session.seek(0.0) == FILE_HEADER.size
+        assert session.seek(60.0) == int(session.index['offset'][-1])
+    finally:
+        session.close()
+
+
+def test_times_never_go_backwards(tmp_path):
+    generator = PSNGenerator(4, seed=1)
+    recorder = SessionRecorder(str(tmp_path / 'a.rec'))
+    for i, arrival in enumerate([1000, 3000, 2000, 4000]):
+        for packet in generator.frame(i / 60):
+            recorder.record(packet, '10.0.0.7', arrival)
+    recorder.close()
+    session = SessionFile(str(tmp_path / 'a.rec'))
+    try:
+        assert session.index['time'].tolist() == [0, 2000, 2000, 3000]
+    finally:
+        session.close()
+
+
+def test_missing_index_is_rebuilt_from_records(tmp_path):
+    recorded = record_session(tmp_path / 'a.rec', frames=5)
+    os.remove(index_path(str(tmp_path / 'a.rec')))
+    session = SessionFile(str(tmp_path / 'a.rec'))
+    try:
+        assert len(session.index) == len(recorded)
+        assert len(list(session.packets(2 * FRAME_NS / 1e9))) == sum(
+            1 for arrival, _, _ in recorded if arrival >= START_NS + 2 * FRAME_NS)
+    finally:
+        session.close()
+
+
+def test_truncated_recording_stops_at_the_last_whole_packet(tmp_path):
+    recorded = record_session(tmp_path / 'a.rec', frames=5)
+    path = str(tmp_path / 'a.rec')
+    with open(path, 'r+b') as f:
+        f.truncate(os.path.getsize(path) - 10)
+    session = SessionFile(path)
+    try:
+        assert len(list(session.packets())) == len(recorded) - 1
+    finally:
+        session.close()
+
+
+@pytest.mark.parametrize('data', [b'', b'PSNREC01', b'NOTAREC!' + bytes(FILE_HEADER.size)])
+def test_invalid_recording_raises(tmp_path, data):
+    (tmp_path / 'a.rec').write_bytes(data)
+    with pytest.raises(ValueError):
+        SessionFile(str(tmp_path / 'a.rec'))
+
+
+def test_replay_decodes_every_frame(tmp_path):
+    recorded = record_session(tmp_path / 'a.rec')
+    session = SessionFile(str(tmp_path / 'a.rec'))
+    try:
+        send, counts = decoder_sink()
+        assert replay(session, send, speed=0) == len(recorded)
+        assert counts['packets'] == len(recorded)
+        # The last frame is still waiting for a later one to close it
+        assert counts['frames'] >= 29
+    finally:
+        session.close()
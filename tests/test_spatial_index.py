@@ -0,0 +1,66 @@
+import numpy as np
+from tracker_frame import TrackerFrame, FIELD_POS
+from spatial_index import SpatialIndex
+
+rng = np.random.default_rng(7)
+POSITIONS = rng.uniform(-10, 10, (300, 3))
+IDS = np.arange(300) * 2
+
+
+def built(cell_size=1.0):
+    index = SpatialIndex(cell_size)
+    index.build(IDS, POSITIONS)
+    return index
+
+
+# Distance from every point to every indexed position
+def brute_force(points):
+    return np.linalg.norm(POSITIONS[None, :, :] - points[:, None, :], axis=2)
+
+
+def test_within_matches_brute_force():
+    points = rng.uniform(-10, 10, (40, 3))
+    for radius in (0.5, 2.0, 30.0):
+        queries, ids, distances = built().within(points, radius)
+        expected = brute_force(points)
+        for query in range(len(points)):
+            mine = ids[queries == query]
+            assert sorted(mine.tolist()) == sorted(IDS[expected[query] <= radius].tolist())
+            assert np.all(np.diff(distances[queries == query]) >= 0)
+        assert built().count_within(points, radius).tolist() == (expected <= radius).sum(axis=1).tolist()
+
+
+def test_nearest_matches_brute_force():
+    points = rng.uniform(-12, 12, (40, 3))
+    ids, distances = built(0.5).nearest(points, k=3)
+    expected = brute_force(points)
+    order = np.argsort(expected, axis=1)[:, :3]
+    assert ids.tolist() == IDS[order].tolist()
+    np.testing.assert_allclose(distances, np.take_along_axis(expected, order, axis=1))
+
+
+def test_nearest_within_max_distance_is_padded():
+    index = SpatialIndex()
+    index.build([1, 2], [[0, 0, 0], [5, 0, 0]])
+    ids, distances = index.nearest([[0, 0, 0]], k=3, max_distance=2.0)
+    assert ids.tolist() == [[1, -1, -1]]
+    assert distances.tolist() == [[0.0, np.inf, np.inf]]
+
+
+def test_empty_index_and_non_finite_positions():
+    assert SpatialIndex().nearest([[0, 0, 0]])[0].tolist() == [[-1]]
+    index = SpatialIndex()
+    index.build([1, 2, 3], [[0, 0, 0], [np.nan, 0, 0], [np.inf, 0, 0]])
+    assert len(index) == 1
+    assert index.nearest([[np.nan, 0, 0], [1, 0, 0]], k=1)[0].tolist() == [[-1], [1]]
+
+
+def test_update_indexes_trackers_with_a_position():
+    frame = TrackerFrame(16)
+    frame.trackers['fields'][[3, 4]] = FIELD_POS
+    frame.trackers['pos'][3] = (1, 1, 0)
+    frame.trackers['pos'][4] = (8, 8, 0)
+    index = SpatialIndex()
+    index.update(frame)
+    _, ids, _ = index.within([[0, 0, 0]], 2.0)
+    assert ids.tolist() == [3]
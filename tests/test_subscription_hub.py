@@ -0,0 +1,135 @@
+import json
+import numpy as np
+import pytest
+from forwarder import encode_frame, decode_frame, iter_records, RECORD_TRACKER_FRAME
+from tracker_frame import TrackerFrame, FIELD_POS, FIELD_SPEED, FIELD_ORI
+from frame_assembler import FIELD_STALE
+from coordinate_spaces import CoordinateSpaces
+from subscription_hub import Subscriber, SubscriptionHub, ALL_FIELDS
+
+SPACES = CoordinateSpaces({'stage': {'translate': [0, -4.5, 0], 'rotate': [0, 0, 90]}})
+
+
+def frame_payload(source='10.0.0.1', frame_id=1, trackers=5):
+    frame = TrackerFrame()
+    frame.source = source
+    frame.packet_timestamp = frame_id * 1000
+    frame.frame_id = frame_id
+    frame.frame_packet_count = frame.packets_received = 1
+    frame.trackers['fields'][:trackers] = FIELD_POS | FIELD_SPEED | FIELD_ORI
+    frame.trackers['pos'][:trackers, 0] = np.arange(trackers)
+    frame.trackers['fields'][trackers - 1] |= FIELD_STALE
+    return encode_frame(frame)
+
+
+def subscriber(request=None):
+    result = Subscriber(None, ('127.0.0.1', 0), SPACES)
+    if request is not None:
+        result.subscribe(json.dumps(request).encode())
+    return result
+
+
+# The frames in a subscriber's outbox, as returned by decode_frame
+def sent_frames(result):
+    frames = []
+    for kind, payload in iter_records(bytes(result.outbox)):
+        assert kind == RECORD_TRACKER_FRAME
+        frames.append(decode_frame(payload))
+    return frames
+
+
+def test_default_subscription_sends_frames_unchanged():
+    result = subscriber()
+    payload = frame_payload()
+    result.offer('10.0.0.1', payload)
+    assert result.fill(0.0) is None
+    [(source, _, frame_id, _, _, rows)] = sent_frames(result)
+    assert (source, frame_id) == ('10.0.0.1', 1)
+    assert rows.tobytes() == decode_frame(payload)[5].tobytes()
+
+
+def test_trackers_and_fields_are_filtered():
+    result = subscriber({'trackers': [1, 4, 9999], 'fields': ['pos']})
+    result.offer('10.0.0.1', frame_payload())
+    result.fill(0.0)
+    [(_, _, _, _, _, rows)] = sent_frames(result)
+    assert rows['id'].tolist() == [1, 4]
+    # Stale trackers keep their flag
+    assert rows['fields'].tolist() == [FIELD_POS, FIELD_POS | FIELD_STALE]
+
+
+def test_sources_are_filtered():
+    result = subscriber({'sources': ['10.0.0.2']})
+    result.offer('10.0.0.1', frame_payload('10.0.0.1'))
+    result.offer('10.0.0.2', frame_payload('10.0.0.2'))
+    result.fill(0.0)
+    assert [frame[0] for frame in sent_frames(result)] == ['10.0.0.2']
+
+
+def test_space_transforms_positions():
+    result = subscriber({'space': 'stage', 'trackers': [2]})
+    result.offer('10.0.0.1', frame_payload())
+    result.fill(0.0)
+    [(_, _, _, _, _, rows)] = sent_frames(result)
+    np.testing.assert_allclose(rows['pos'][0], [0, 2 - 4.5, 0], atol=1e-6)
+
+
+def test_pending_frames_are_coalesced_per_source():
+    result = subscriber()
+    for frame_id in range(1, 4):
+        result.offer('10.0.0.1', frame_payload(frame_id=frame_id))
+    result.offer('10.0.0.2', frame_payload('10.0.0.2', frame_id=7))
+    result.fill(0.0)
+    assert sorted((frame[0], frame[2]) for frame in sent_frames(result)) == [('10.0.0.1', 3), ('10.0.0.2', 7)]
+    assert result.coalesced == 2
+
+
+def test_max_rate_holds_frames_until_due():
+    result = subscriber({'max_rate': 10})
+    result.offer('10.0.0.1', frame_payload(frame_id=1))
+    result.fill(0.0)
+    result.outbox.clear()
+    result.offer('10.0.0.1', frame_payload(frame_id=2))
+    assert result.fill(0.05) == pytest.approx(0.1)
+    assert result.outbox == bytearray()
+    result.fill(0.1)
+    assert [frame[2] for frame in sent_frames(result)] == [2]
+
+
+@pytest.mark.parametrize('request_line', [
+    b'[1, 2]',
+    b'{"trackers": "1"}',
+    b'{"trackers": [true]}',
+    b'{"fields": ["pos", "colour"]}',
+    b'{"max_rate": "fast"}',
+    b'{"max_rate": -1}',
+    b'{"max_rate": 1e999}',
+    b'{"sources": [10]}',
+    b'{"space": "nowhere"}',
+])
+def test_invalid_subscription_keeps_the_previous_one(request_line):
+    result = subscriber({'trackers': [1], 'fields': ['pos'], 'max_rate': 30})
+    with pytest.raises(ValueError):
+        result.subscribe(request_line)
+    assert np.flatnonzero(result.trackers).tolist() == [1]
+    assert result.fields == FIELD_POS
+    assert result.interval == pytest.approx(1 / 30)
+
+
+def test_new_subscription_replaces_the_previous_one():
+    result = subscriber({'trackers': [1], 'fields': ['pos'], 'max_rate': 30})
+    result.subscribe(b'{}')
+    assert result.trackers is None
+    assert result.fields == ALL_FIELDS
+    assert result.interval == 0.0
+
+
+def test_hub_counts_frames_dropped_from_a_full_queue():
+    hub = SubscriptionHub(queue_size=2)
+    for frame_id in range(5):
+        hub.publish(frame_payload(frame_id=frame_id))
+    assert hub.dropped == 3
+    hub._drain_wakeups(hub._wake_reader, None)
+    assert (hub.consumed, hub.dropped) == (2, 3)
+    hub._wake_reader.close()
+    hub._wake_writer.close()
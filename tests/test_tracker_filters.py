@@ -0,0 +1,78 @@
+import json
+import numpy as np
+import pytest
+from tracker_frame import TrackerFrame, FIELD_POS
+from frame_assembler import FIELD_STALE
+from tracker_filters import OneEuroFilter, KalmanFilter, load_filter
+
+FRAME_US = 10000
+rng = np.random.default_rng(3)
+
+
+# Tracker 0 at rest at the origin and tracker 1 moving along x at 2 m/s, both measured
+# with 2 cm of noise, filtered for the given number of 100 Hz frames
+def run(tracker_filter, frames=300):
+    truth = np.zeros((frames, 2, 3))
+    truth[:, 1, 0] = 2.0 * np.arange(frames) * FRAME_US / 1e6
+    measured = truth + rng.normal(0, 0.02, truth.shape)
+    filtered = np.array([tracker_filter.update([0, 1], measured[i], i * FRAME_US) for i in range(frames)])
+    return truth, measured, filtered
+
+
+@pytest.mark.parametrize('tracker_filter', [OneEuroFilter(16), KalmanFilter(16)], ids=['one-euro', 'kalman'])
+def test_filters_reduce_noise_and_follow_motion(tracker_filter):
+    truth, measured, filtered = run(tracker_filter)
+    settled = slice(100, None)
+    raw_error = np.abs(measured[settled, 0] - truth[settled, 0]).mean()
+    assert np.abs(filtered[settled, 0] - truth[settled, 0]).mean() < raw_error / 2
+    # Following the moving tracker without lagging more than a few centimetres
+    assert np.abs(filtered[settled, 1, 0] - truth[settled, 1, 0]).mean() < 0.05
+
+
+@pytest.mark.parametrize('filter_class', [OneEuroFilter, KalmanFilter])
+def test_first_sample_and_gaps_start_over(filter_class):
+    tracker_filter = filter_class(16, max_gap=0.5)
+    assert tracker_filter.update([3], [[1, 2, 3]], 0).tolist() == [[1, 2, 3]]
+    tracker_filter.update([3], [[1, 2, 3]], FRAME_US)
+    # A second of silence: the next position is taken as is
+    assert tracker_filter.update([3], [[9, 9, 9]], 2 * 10 ** 6).tolist() == [[9, 9, 9]]
+    # So is a clock that went back
+    assert tracker_filter.update([3], [[5, 5, 5]], 10 ** 6).tolist() == [[5, 5, 5]]
+
+
+def test_groups_are_tuned_separately():
+    tracker_filter = OneEuroFilter(16, min_cutoff=0.1, beta=0.0)
+    tracker_filter.configure([1], min_cutoff=50.0)
+    tracker_filter.update([0, 1], np.zeros((2, 3)), 0)
+    step = tracker_filter.update([0, 1], np.ones((2, 3)), FRAME_US)
+    assert step[0, 0] < 0.01 < 0.5 < step[1, 0]
+    with pytest.raises(ValueError):
+        tracker_filter.configure(gain=1.0)
+
+
+def test_apply_filters_a_frame_in_place_and_skips_stale_rows():
+    tracker_filter = KalmanFilter(16)
+    frame = TrackerFrame(16)
+    frame.trackers['fields'][[1, 2]] = FIELD_POS
+    tracker_filter.apply(frame)
+    frame.packet_timestamp = FRAME_US
+    frame.trackers['pos'][[1, 2]] = (1, 0, 0)
+    frame.trackers['fields'][2] |= FIELD_STALE
+    assert tracker_filter.apply(frame).tolist() == [1]
+    assert 0 < frame.trackers['pos'][1, 0] < 1
+    assert frame.trackers['pos'][2, 0] == 1
+
+
+def test_filter_is_loaded_from_config(tmp_path):
+    path = tmp_path / 'config.json'
+    path.write_text(json.dumps({'smoothing': {'filter': 'one-euro', 'beta': 2.0, 'max_gap': 1.0,
+                                              'groups': [{'trackers': [4], 'beta': 7.0}]}}))
+    tracker_filter = load_filter(str(path), capacity=16)
+    assert isinstance(tracker_filter, OneEuroFilter)
+    assert tracker_filter.max_gap == 1.0
+    assert tracker_filter.params['beta'][[0, 4]].tolist() == [2.0, 7.0]
+    path.write_text(json.dumps({'smoothing': {'filter': 'median'}}))
+    with pytest.raises(ValueError):
+        load_filter(str(path))
+    path.write_text('{}')
+    assert load_filter(str(path)) is None
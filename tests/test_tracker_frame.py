@@ -0,0 +1,114 @@
+import pickle
+import struct
+import numpy as np
+from psn_encoder import encode_chunk
+from tracker_frame import (TrackerFrame, FIELD_POS, FIELD_SPEED, FIELD_STATUS, FIELD_TIMESTAMP,
+                           PSN_DATA_TRACKER_POS, PSN_DATA_TRACKER_SPEED, PSN_DATA_TRACKER_STATUS,
+                           PSN_DATA_TRACKER_TIMESTAMP)
+
+
+def tracker_chunk(tracker_id, pos=None, speed=None, status=None, timestamp=None):
+    payload = b''
+    if pos is not None:
+        payload += encode_chunk(PSN_DATA_TRACKER_POS, struct.pack('<3f', *pos))
+    if speed is not None:
+        payload += encode_chunk(PSN_DATA_TRACKER_SPEED, struct.pack('<3f', *speed))
+    if status is not None:
+        payload += encode_chunk(PSN_DATA_TRACKER_STATUS, struct.pack('<f', status))
+    if timestamp is not None:
+        payload += encode_chunk(PSN_DATA_TRACKER_TIMESTAMP, struct.pack('<Q', timestamp))
+    return encode_chunk(tracker_id, payload, True)
+
+
+# The same trackers, every one with position, status and timestamp
+def uniform_list(ids=(0, 3, 7, 200)):
+    return b''.join(tracker_chunk(tracker_id, pos=(tracker_id, 1, 2), status=0.5, timestamp=tracker_id * 10)
+                    for tracker_id in ids)
+
+
+def per_chunk(frame):
+    frame._decode_uniform = lambda mv, offset, end: -1
+    return frame
+
+
+def test_uniform_list_is_decoded_into_rows():
+    frame = TrackerFrame()
+    assert frame.decode_tracker_list(uniform_list()) == 4
+    rows = frame.active()
+    assert rows['id'].tolist() == [0, 3, 7, 200]
+    assert np.all(rows['fields'] == FIELD_POS | FIELD_STATUS | FIELD_TIMESTAMP)
+    assert rows['pos'][:, 0].tolist() == [0, 3, 7, 200]
+    assert rows['timestamp'].tolist() == [0, 30, 70, 2000]
+    assert frame.errors == 0
+
+
+def test_uniform_and_per_chunk_paths_agree():
+    data = uniform_list()
+    uniform = TrackerFrame()
+    uniform.decode_tracker_list(data)
+    chunked = per_chunk(TrackerFrame())
+    assert chunked.decode_tracker_list(data) == 4
+    assert uniform.trackers.tobytes() == chunked.trackers.tobytes()
+
+
+def test_mixed_layouts_take_the_per_chunk_path():
+    data = tracker_chunk(1, pos=(1, 2, 3)) + tracker_chunk(2, speed=(4, 5, 6), status=1.0)
+    frame = TrackerFrame()
+    assert frame._decode_uniform(memoryview(data), 0, len(data)) == -1
+    assert frame.decode_tracker_list(data) == 2
+    assert frame.trackers['fields'][[1, 2]].tolist() == [FIELD_POS, FIELD_SPEED | FIELD_STATUS]
+    assert frame.trackers['speed'][2].tolist() == [4, 5, 6]
+
+
+def test_unchanged_tracker_is_not_decoded_again():
+    data = tracker_chunk(1, pos=(1, 2, 3)) + tracker_chunk(2, speed=(4, 5, 6))
+    frame = TrackerFrame()
+    frame.decode_tracker_list(data)
+    frame.reset()
+    frame.trackers['pos'][1] = 0
+    frame.decode_tracker_list(data)
+    # The cached bytes only restore the field bits; the row itself was left alone
+    assert frame.trackers['fields'][1] == FIELD_POS
+    assert frame.trackers['pos'][1].tolist() == [0, 0, 0]
+
+
+def test_tracker_length_past_the_list_is_counted():
+    data = tracker_chunk(1, pos=(1, 2, 3)) + tracker_chunk(2, pos=(4, 5, 6))
+    frame = TrackerFrame()
+    assert frame.decode_tracker_list(data[:-4]) == 1
+    assert frame.errors == 1
+    assert frame.active()['id'].tolist() == [1]
+
+
+def test_subchunk_with_wrong_length_is_skipped():
+    bad = encode_chunk(PSN_DATA_TRACKER_POS, struct.pack('<2f', 1, 2))
+    data = encode_chunk(1, bad + encode_chunk(PSN_DATA_TRACKER_STATUS, struct.pack('<f', 0.5)), True)
+    frame = TrackerFrame()
+    assert frame.decode_tracker_list(data) == 1
+    assert frame.errors == 1
+    assert frame.trackers['fields'][1] == FIELD_STATUS
+
+
+def test_tracker_id_beyond_capacity_is_skipped():
+    data = tracker_chunk(5, pos=(1, 2, 3)) + tracker_chunk(50, pos=(4, 5, 6), speed=(0, 0, 0))
+    frame = TrackerFrame(capacity=16)
+    assert frame.decode_tracker_list(data) == 1
+    assert frame.errors == 1
+    assert frame.active()['id'].tolist() == [5]
+
+
+def test_oversized_chunk_length_never_reads_past_the_list():
+    header = struct.pack('<I', 1 | (0x7FFF << 16) | (1 << 31))
+    frame = TrackerFrame()
+    assert frame.decode_tracker_list(header + b'\0' * 8) == 0
+    assert frame.errors == 1
+    assert frame.active().size == 0
+
+
+def test_pickle_keeps_only_active_rows():
+    frame = TrackerFrame()
+    frame.decode_tracker_list(uniform_list())
+    frame.frame_id = 9
+    copy = pickle.loads(pickle.dumps(frame))
+    assert copy.frame_id == 9
+    assert copy.trackers.tobytes() == frame.trackers.tobytes()
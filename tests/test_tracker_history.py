@@ -0,0 +1,77 @@
+import numpy as np
+import pytest
+from tracker_frame import TrackerFrame, FIELD_POS
+from frame_assembler import FIELD_STALE
+from tracker_history import TrackerHistory, LINEAR, CUBIC
+
+
+# Tracker 1 moves along x at 1 m per 1000 us, tracker 2 along y at 2 m per 1000 us
+def history(frames=5, depth=16):
+    result = TrackerHistory(capacity=8, depth=depth)
+    frame = TrackerFrame(8)
+    for i in range(frames):
+        frame.reset()
+        frame.packet_timestamp = i * 1000
+        frame.trackers['fields'][[1, 2]] = FIELD_POS
+        frame.trackers['pos'][1] = (i, 0, 0)
+        frame.trackers['pos'][2] = (0, 2 * i, 0)
+        result.append(frame)
+    return result
+
+
+def test_linear_interpolation_between_samples():
+    positions, valid = history().interpolate([1, 2, 1], [1500, 2250, 4000])
+    assert valid.tolist() == [True, True, True]
+    np.testing.assert_allclose(positions, [[1.5, 0, 0], [0, 4.5, 0], [4, 0, 0]])
+
+
+def test_cubic_interpolation_is_exact_on_straight_lines():
+    positions, valid = history().interpolate([1, 2], [1500, 3700], method=CUBIC)
+    assert valid.all()
+    np.testing.assert_allclose(positions, [[1.5, 0, 0], [0, 7.4, 0]], atol=1e-9)
+
+
+def test_extrapolation_is_limited():
+    positions, valid = history().interpolate([1, 1], [4000 + 500, 4000 + 5000], max_extrapolation=1000)
+    assert valid.tolist() == [True, False]
+    np.testing.assert_allclose(positions[0], [4.5, 0, 0])
+    assert np.isnan(positions[1]).all()
+
+
+def test_times_before_the_oldest_sample_and_unknown_trackers_are_invalid():
+    _, valid = history().interpolate([1, 5], [-10, 1000])
+    assert valid.tolist() == [False, False]
+
+
+def test_ring_keeps_the_newest_samples():
+    result = history(frames=40, depth=16)
+    times, positions = result.window(1, 0, 10 ** 9)
+    assert times.tolist() == [i * 1000 for i in range(24, 40)]
+    assert positions[:, 0].tolist() == list(range(24, 40))
+    positions, valid = result.interpolate([1, 1], [30500, 20000])
+    assert valid.tolist() == [True, False]
+    np.testing.assert_allclose(positions[0], [30.5, 0, 0])
+
+
+def test_stale_rows_are_not_recorded_and_clock_resets_restart_history():
+    result = history()
+    frame = TrackerFrame(8)
+    frame.packet_timestamp = 5000
+    frame.trackers['fields'][1] = FIELD_POS | FIELD_STALE
+    assert result.append(frame) == 0
+    frame.trackers['fields'][1] = FIELD_POS
+    frame.packet_timestamp = 10
+    result.append(frame)
+    assert result.counts[1] == 1
+    assert result.counts[2] == 5
+
+
+def test_at_and_resample():
+    result = history()
+    ids, positions, valid = result.at(2500)
+    assert ids.tolist() == [1, 2]
+    np.testing.assert_allclose(positions, [[2.5, 0, 0], [0, 5, 0]])
+    positions, valid = result.resample(1, [0, 1000, 3500], method=LINEAR)
+    np.testing.assert_allclose(positions[:, 0], [0, 1, 3.5])
+    with pytest.raises(ValueError):
+        result.interpolate([1], [0], method='spline')
@@ -0,0 +1,57 @@
+from tracker_registry import TrackerRegistry, TrackerAdded, TrackerRemoved, TrackerRenamed
+
+SOURCE = '10.0.0.1'
+
+
+def test_added_renamed_and_removed_events():
+    registry = TrackerRegistry()
+    received = []
+    registry.subscribe(received.extend)
+    assert registry.update(SOURCE, 'Server', [('Lead', 1), ('Prop', 2)], now=0) == [
+        TrackerAdded(SOURCE, 'Server', 1, 'Lead'), TrackerAdded(SOURCE, 'Server', 2, 'Prop')]
+    events = registry.update(SOURCE, 'Server', [('Understudy', 1), ('Chair', 3)], now=1)
+    assert events == [TrackerRenamed(SOURCE, 'Server', 1, 'Lead', 'Understudy'),
+                      TrackerAdded(SOURCE, 'Server', 3, 'Chair'),
+                      TrackerRemoved(SOURCE, 'Server', 2, 'Prop')]
+    assert received[-3:] == events
+    assert registry.trackers == {(SOURCE, 'Server', 1): 'Understudy', (SOURCE, 'Server', 3): 'Chair'}
+    assert registry.name(SOURCE, 1) == 'Understudy'
+    assert registry.name(SOURCE, 2) is None
+
+
+def test_unchanged_and_repeated_lists_emit_nothing():
+    registry = TrackerRegistry()
+    tracker_list = [('Lead', 1)]
+    registry.update(SOURCE, 'Server', tracker_list)
+    assert registry.update(SOURCE, 'Server', tracker_list) == []
+    assert registry.update(SOURCE, 'Server', [('Lead', 1)]) == []
+
+
+def test_split_list_is_applied_once_complete():
+    registry = TrackerRegistry()
+    assert registry.update(SOURCE, 'Server', [('Lead', 1)], frame_id=4, frame_packet_count=2) == []
+    events = registry.update(SOURCE, 'Server', [('Prop', 2)], frame_id=4, frame_packet_count=2)
+    assert [event.tracker_id for event in events] == [1, 2]
+
+
+def test_sources_and_systems_do_not_overwrite_each_other():
+    registry = TrackerRegistry()
+    registry.update(SOURCE, 'Server', [('Lead', 1)])
+    registry.update('10.0.0.2', 'Server', [('Other', 1)])
+    registry.update(SOURCE, 'Backup', [('Spare', 1)])
+    assert registry.name(SOURCE, 1) == 'Spare'
+    assert registry.name('10.0.0.2', 1) == 'Other'
+    # Dropping the ID in one system falls back to the name another system announces
+    registry.update(SOURCE, 'Backup', [])
+    assert registry.name(SOURCE, 1) == 'Lead'
+
+
+def test_silent_systems_are_removed():
+    registry = TrackerRegistry()
+    registry.update(SOURCE, 'Server', [('Lead', 1)], now=0)
+    registry.update('10.0.0.2', 'Server', [('Other', 1)], now=8)
+    assert registry.remove_stale(5, now=10) == [TrackerRemoved(SOURCE, 'Server', 1, 'Lead')]
+    assert registry.name(SOURCE, 1) is None
+    assert registry.name('10.0.0.2', 1) == 'Other'
+    # A system that comes back is announced again
+    assert registry.update(SOURCE, 'Server', [('Lead', 1)], now=11) == [TrackerAdded(SOURCE, 'Server', 1, 'Lead')]
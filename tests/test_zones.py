@@ -0,0 +1,99 @@
+import json
+import numpy as np
+import pytest
+from tracker_frame import TrackerFrame, FIELD_POS
+from frame_assembler import FIELD_STALE
+from zones import ZoneEngine, Zone, ZoneShapes, ZoneEntered, ZoneExited, ZoneDwell, load_zones
+
+SOURCE = '10.0.0.1'
+
+
+def box(hysteresis=0.1, debounce=0.0, dwell=0.0):
+    return Zone('Box', 'box', {'min': [0, 0, 0], 'max': [2, 2, 2]}, hysteresis, debounce, dwell)
+
+
+class Feed:
+    def __init__(self, zones):
+        self.engine = ZoneEngine(zones)
+        self.frame = TrackerFrame()
+        self.frame.source = SOURCE
+
+    # Frame with the given {tracker ID: position}; IDs in stale carry FIELD_STALE
+    def __call__(self, now, positions, stale=()):
+        self.frame.reset()
+        for tracker_id, position in positions.items():
+            self.frame.trackers['pos'][tracker_id] = position
+            self.frame.trackers['fields'][tracker_id] = FIELD_POS | (FIELD_STALE if tracker_id in stale else 0)
+        return self.engine.update(self.frame, now=now)
+
+
+def test_signed_distance_of_each_shape():
+    shapes = ZoneShapes([box(),
+                         Zone('Lift', 'cylinder', {'center': [5, 5], 'radius': 1, 'z': [0, 2]}, 0, 0, 0),
+                         Zone('Ramp', 'polygon', {'points': [[10, 0], [14, 0], [10, 4]], 'z': [0, 2]}, 0, 0, 0)])
+    points = np.array([[1, 1, 1], [5, 5, 1], [11, 1, 1], [3, 1, 1]], dtype=np.float64)
+    distance = shapes.signed_distance(points)
+    assert distance.shape == (4, 3)
+    np.testing.assert_allclose(distance[:3].diagonal(), [-1, -1, -1], atol=1e-6)
+    assert distance[3, 0] == pytest.approx(1)
+
+
+def test_enter_and_exit_respect_hysteresis():
+    feed = Feed([box(hysteresis=0.1)])
+    assert feed(0, {1: (1.95, 1, 1)}) == []
+    assert feed(1, {1: (1.5, 1, 1)}) == [ZoneEntered(SOURCE, 'Box', 1)]
+    # Outside the box but within the hysteresis band: still inside
+    assert feed(2, {1: (2.05, 1, 1)}) == []
+    assert feed(3, {1: (2.2, 1, 1)}) == [ZoneExited(SOURCE, 'Box', 1)]
+
+
+def test_changes_must_hold_for_the_debounce_time():
+    feed = Feed([box(debounce=0.5)])
+    assert feed(0.0, {1: (1, 1, 1)}) == []
+    assert feed(0.2, {1: (5, 5, 5)}) == []
+    # Leaving again restarted the wait
+    assert feed(0.4, {1: (1, 1, 1)}) == []
+    assert feed(0.8, {1: (1, 1, 1)}) == []
+    assert feed(0.9, {1: (1, 1, 1)}) == [ZoneEntered(SOURCE, 'Box', 1)]
+
+
+def test_dwell_is_sent_once_per_visit():
+    feed = Feed([box(dwell=1.0)])
+    feed(0, {1: (1, 1, 1)})
+    assert feed(0.5, {1: (1, 1, 1)}) == []
+    [event] = feed(1.2, {1: (1, 1, 1)})
+    assert isinstance(event, ZoneDwell) and event.seconds == pytest.approx(1.2)
+    assert feed(2.0, {1: (1, 1, 1)}) == []
+    feed(3.0, {1: (5, 5, 5)})
+    feed(4.0, {1: (1, 1, 1)})
+    assert [type(event) for event in feed(5.0, {1: (1, 1, 1)})] == [ZoneDwell]
+
+
+def test_missing_and_stale_trackers_exit_after_the_debounce_time():
+    feed = Feed([box(debounce=0.2)])
+    feed(0.0, {1: (1, 1, 1), 2: (1, 1, 1)})
+    feed(0.2, {1: (1, 1, 1), 2: (1, 1, 1)})
+    assert feed(0.3, {2: (1, 1, 1)}, stale={2}) == []
+    assert sorted(feed(0.5, {2: (1, 1, 1)}, stale={2})) == [ZoneExited(SOURCE, 'Box', 1),
+                                                             ZoneExited(SOURCE, 'Box', 2)]
+
+
+def test_subscribers_get_the_events():
+    feed = Feed([box()])
+    received = []
+    feed.engine.subscribe(received.extend)
+    feed(0, {1: (1, 1, 1)})
+    assert received == [ZoneEntered(SOURCE, 'Box', 1)]
+
+
+def test_zones_are_loaded_with_defaults(tmp_path):
+    path = tmp_path / 'config.json'
+    path.write_text(json.dumps({'zone_defaults': {'debounce': 0.3},
+                                'zones': [{'name': 'Box', 'type': 'box', 'min': [0, 0, 0], 'max': [1, 1, 1],
+                                           'dwell': 2}]}))
+    [zone] = load_zones(str(path))
+    assert (zone.name, zone.debounce, zone.dwell, zone.params) == ('Box', 0.3, 2, {'min': [0, 0, 0],
+                                                                                   'max': [1, 1, 1]})
+    path.write_text(json.dumps({'zones': [{'name': 'Blob', 'type': 'sphere'}]}))
+    with pytest.raises(ValueError):
+        load_zones(str(path))
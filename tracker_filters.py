@@ -0,0 +1,195 @@
+import json
+import os
+import numpy as np
+from tracker_frame import MAX_TRACKERS, FIELD_POS
+from frame_assembler import FIELD_STALE
+
+# Smoothing filters for tracker positions, run for all trackers of a frame at once.
+#
+# Filter state lives in arrays indexed by tracker ID, as do the parameters, so trackers
+# or groups of trackers can be tuned separately without any per-tracker Python code.
+# Time steps come from the frames' packet timestamps (microseconds). A tracker that was
+# not seen for MAX_GAP seconds starts over from its next position.
+#
+# The "smoothing" section of config.json chooses the filter and its parameters:
+#
+#   {"filter": "one-euro", "min_cutoff": 1.0, "beta": 1.0,
+#    "groups": [{"trackers": [1, 2], "beta": 3.0}]}
+
+CONFIG_FILE = 'config.json'
+
+ONE_EURO = 'one-euro'
+KALMAN = 'kalman'
+
+# One-Euro: cutoff frequency at rest (Hz), its increase per m/s of speed, and the cutoff
+# of the speed estimate (Hz)
+MIN_CUTOFF = 1.0
+BETA = 1.0
+D_CUTOFF = 1.0
+# Kalman: standard deviation of the acceleration (m/s^2), of the measured positions (m),
+# and of the speed of a tracker when it first appears (m/s)
+PROCESS_NOISE = 5.0
+MEASUREMENT_NOISE = 0.02
+INITIAL_SPEED_NOISE = 3.0
+# Seconds without a position after which a tracker's filter starts over
+MAX_GAP = 0.5
+# Smallest time step; repeated timestamps leave the estimate where it is
+MIN_DT = 1e-6
+
+
+class TrackerFilter:
+    PARAMETERS = {}
+
+    def __init__(self, capacity=MAX_TRACKERS, max_gap=MAX_GAP, **params):
+        self.capacity = capacity
+        self.max_gap = max_gap
+        self.params = {name: np.full(capacity, default, dtype=np.float64) for name, default in self.PARAMETERS.items()}
+        self.configure(**params)
+        self.last_time = np.zeros(capacity, dtype=np.int64)
+        self.started = np.zeros(capacity, dtype=bool)
+
+    # Sets parameters for the given tracker IDs (a group), or for every tracker
+    def configure(self, tracker_ids=None, **params):
+        index = slice(None) if tracker_ids is None else np.asarray(tracker_ids, dtype=np.int64)
+        for name, value in params.items():
+            if name not in self.params:
+                raise ValueError(f"Unknown {type(self).__name__} parameter: {name}")
+            self.params[name][index] = value
+
+    def reset(self, tracker_ids=None):
+        self.started[slice(None) if tracker_ids is None else tracker_ids] = False
+
+    # Filters the positions of the trackers received in the frame, in place. Stale rows
+    # carried over by the frame assembler are left alone. Returns the IDs filtered.
+    def apply(self, frame):
+        fields = frame.trackers['fields'][:self.capacity]
+        ids = np.flatnonzero((fields & FIELD_POS != 0) & (fields & FIELD_STALE == 0))
+        if len(ids):
+            positions = frame.trackers['pos']
+            positions[ids] = self.update(ids, positions[ids], frame.packet_timestamp)
+        return ids
+
+    # Filtered (n, 3) positions for the trackers ids measured at positions, at time
+    # timestamp (microseconds, one per frame or one per tracker)
+    def update(self, ids, positions, timestamp):
+        ids = np.asarray(ids, dtype=np.int64)
+        positions = np.asarray(positions, dtype=np.float64)
+        timestamp = np.broadcast_to(np.asarray(timestamp, dtype=np.int64), ids.shape)
+        dt = (timestamp - self.last_time[ids]) / 1e6
+        fresh = ~self.started[ids] | (dt > self.max_gap) | (dt < 0)
+        self.last_time[ids] = timestamp
+        self.started[ids] = True
+        if not fresh.any():
+            return self._step(ids, positions, np.maximum(dt, MIN_DT)[:, None])
+        self._start(ids[fresh], positions[fresh])
+        if fresh.all():
+            return positions
+        running = ~fresh
+        result = positions.copy()
+        result[running] = self._step(ids[running], positions[running], np.maximum(dt[running], MIN_DT)[:, None])
+        return result
+
+
+# One-Euro filter (Casiez et al., 2012): a low-pass filter whose cutoff rises with speed,
+# smoothing a tracker at rest while following it without lag when it moves
+class OneEuroFilter(TrackerFilter):
+    PARAMETERS = {'min_cutoff': MIN_CUTOFF, 'beta': BETA, 'd_cutoff': D_CUTOFF}
+
+    def __init__(self, capacity=MAX_TRACKERS, max_gap=MAX_GAP, **params):
+        super().__init__(capacity, max_gap, **params)
+        self.position = np.zeros((capacity, 3))
+        self.speed = np.zeros((capacity, 3))
+
+    def _start(self, ids, positions):
+        self.position[ids] = positions
+        self.speed[ids] = 0.0
+
+    def _step(self, ids, positions, dt):
+        previous = self.position[ids]
+        speed = self.speed[ids]
+        speed += _smoothing(self.params['d_cutoff'][ids, None], dt) * ((positions - previous) / dt - speed)
+        cutoff = self.params['min_cutoff'][ids, None] + \
+            self.params['beta'][ids, None] * np.linalg.norm(speed, axis=1, keepdims=True)
+        previous += _smoothing(cutoff, dt) * (positions - previous)
+        self.speed[ids] = speed
+        self.position[ids] = previous
+        return previous
+
+
+def _smoothing(cutoff, dt):
+    tau = 1.0 / (2 * np.pi * cutoff)
+    return 1.0 / (1.0 + tau / dt)
+
+
+# Constant-velocity Kalman filter with independent x, y and z axes. Each axis has a
+# position and a speed, so the 2x2 covariance is kept as three arrays and every step is
+# a handful of element-wise operations.
+class KalmanFilter(TrackerFilter):
+    PARAMETERS = {'process_noise': PROCESS_NOISE, 'measurement_noise': MEASUREMENT_NOISE,
+                  'initial_speed_noise': INITIAL_SPEED_NOISE}
+
+    def __init__(self, capacity=MAX_TRACKERS, max_gap=MAX_GAP, **params):
+        super().__init__(capacity, max_gap, **params)
+        self.position = np.zeros((capacity, 3))
+        self.speed = np.zeros((capacity, 3))
+        self.p00 = np.zeros((capacity, 3))
+        self.p01 = np.zeros((capacity, 3))
+        self.p11 = np.zeros((capacity, 3))
+
+    def _start(self, ids, positions):
+        self.position[ids] = positions
+        self.speed[ids] = 0.0
+        self.p00[ids] = (self.params['measurement_noise'][ids] ** 2)[:, None]
+        self.p01[ids] = 0.0
+        self.p11[ids] = (self.params['initial_speed_noise'][ids] ** 2)[:, None]
+
+    def _step(self, ids, positions, dt):
+        q = (self.params['process_noise'][ids] ** 2)[:, None]
+        r = (self.params['measurement_noise'][ids] ** 2)[:, None]
+        position, speed = self.position[ids], self.speed[ids]
+        p00, p01, p11 = self.p00[ids], self.p01[ids], self.p11[ids]
+
+        # Predict, with white-noise acceleration
+        dt2 = dt * dt
+        position += speed * dt
+        p00 += dt * (2 * p01 + dt * p11) + q * dt2 * dt2 / 4
+        p01 += dt * p11 + q * dt2 * dt / 2
+        p11 += q * dt2
+
+        # Correct with the measured position
+        gain0 = p00 / (p00 + r)
+        gain1 = p01 / (p00 + r)
+        residual = positions - position
+        position += gain0 * residual
+        speed += gain1 * residual
+        p11 -= gain1 * p01
+        p01 *= 1 - gain0
+        p00 *= 1 - gain0
+
+        self.position[ids], self.speed[ids] = position, speed
+        self.p00[ids], self.p01[ids], self.p11[ids] = p00, p01, p11
+        return position
+
+
+FILTERS = {ONE_EURO: OneEuroFilter, KALMAN: KalmanFilter}
+
+
+# The filter described by the "smoothing" section of config.json, or None
+def load_filter(path=CONFIG_FILE, capacity=MAX_TRACKERS):
+    if not os.path.exists(path) or os.path.getsize(path) == 0:
+        return None
+    with open(path) as f:
+        config = json.load(f).get('smoothing')
+    if not config or not config.get('filter'):
+        return None
+    config = dict(config)
+    kind = config.pop('filter')
+    if kind not in FILTERS:
+        raise ValueError(f"Unknown smoothing filter: {kind!r}")
+    groups = config.pop('groups', [])
+    max_gap = config.pop('max_gap', MAX_GAP)
+    tracker_filter = FILTERS[kind](capacity, max_gap, **config)
+    for group in groups:
+        group = dict(group)
+        tracker_filter.configure(group.pop('trackers'), **group)
+    return tracker_filter
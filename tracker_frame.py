@@ -0,0 +1,215 @@
+import struct
+import numpy as np
+
+# Maximum tracker ID that fits in a frame; rows are indexed directly by tracker ID
+MAX_TRACKERS = 1024
+
+# PSN_DATA_TRACKER sub-chunk IDs
+PSN_DATA_TRACKER_POS = 0x0000
+PSN_DATA_TRACKER_SPEED = 0x0001
+PSN_DATA_TRACKER_ORI = 0x0002
+PSN_DATA_TRACKER_STATUS = 0x0003
+PSN_DATA_TRACKER_ACCEL = 0x0004
+PSN_DATA_TRACKER_TRGTPOS = 0x0005
+PSN_DATA_TRACKER_TIMESTAMP = 0x0006
+
+# Bits of the per-row 'fields' mask, one per sub-chunk received for that tracker
+FIELD_POS = 1 << PSN_DATA_TRACKER_POS
+FIELD_SPEED = 1 << PSN_DATA_TRACKER_SPEED
+FIELD_ORI = 1 << PSN_DATA_TRACKER_ORI
+FIELD_STATUS = 1 << PSN_DATA_TRACKER_STATUS
+FIELD_ACCEL = 1 << PSN_DATA_TRACKER_ACCEL
+FIELD_TRGTPOS = 1 << PSN_DATA_TRACKER_TRGTPOS
+FIELD_TIMESTAMP = 1 << PSN_DATA_TRACKER_TIMESTAMP
+
+# Packed little-endian row layout. The byte offsets match the wire format of each
+# sub-chunk so a payload can be copied into its row without unpacking it.
+TRACKER_DTYPE = np.dtype({
+    'names': ['timestamp', 'id', 'fields', 'pos', 'speed', 'ori', 'status', 'accel', 'trgtpos'],
+    'formats': ['<u8', '<u2', '<u2', ('<f4', 3), ('<f4', 3), ('<f4', 3), '<f4', ('<f4', 3), ('<f4', 3)],
+    'offsets': [0, 8, 10, 12, 24, 36, 48, 52, 64],
+    'itemsize': 80,
+})
+
+ROW_SIZE = TRACKER_DTYPE.itemsize
+FIELDS_OFFSET = TRACKER_DTYPE.fields['fields'][1]
+
+# Sub-chunk ID -> (offset in row, payload length, field bit)
+TRACKER_SUBCHUNKS = {
+    PSN_DATA_TRACKER_POS: (TRACKER_DTYPE.fields['pos'][1], 12, FIELD_POS),
+    PSN_DATA_TRACKER_SPEED: (TRACKER_DTYPE.fields['speed'][1], 12, FIELD_SPEED),
+    PSN_DATA_TRACKER_ORI: (TRACKER_DTYPE.fields['ori'][1], 12, FIELD_ORI),
+    PSN_DATA_TRACKER_STATUS: (TRACKER_DTYPE.fields['status'][1], 4, FIELD_STATUS),
+    PSN_DATA_TRACKER_ACCEL: (TRACKER_DTYPE.fields['accel'][1], 12, FIELD_ACCEL),
+    PSN_DATA_TRACKER_TRGTPOS: (TRACKER_DTYPE.fields['trgtpos'][1], 12, FIELD_TRGTPOS),
+    PSN_DATA_TRACKER_TIMESTAMP: (TRACKER_DTYPE.fields['timestamp'][1], 8, FIELD_TIMESTAMP),
+}
+
+CHUNK_HEADER = struct.Struct('<I')
+FIELDS = struct.Struct('<H')
+
+# Chunk header words of a tracker list with a uniform layout, viewed as rows of uint32
+WORD_DTYPE = np.dtype('<u4')
+
+
+# Preallocated columnar storage for the trackers of one PSN data frame. Row N holds
+# tracker ID N. The array is reused from frame to frame, so consumers that keep data
+# past the next decode must copy it first.
+class TrackerFrame:
+    def __init__(self, capacity=MAX_TRACKERS):
+        self.trackers = np.zeros(capacity, dtype=TRACKER_DTYPE)
+        self.trackers['id'] = np.arange(capacity)
+        self._buffer = memoryview(self.trackers.view(np.uint8))
+        self._bytes = self.trackers.view(np.uint8).reshape(capacity, ROW_SIZE)
+        self.packet_timestamp = 0
+        self.frame_id = 0
+        self.frame_packet_count = 0
+        self.errors = 0
+        # Tracker ID -> (sub-chunk bytes last decoded into its row, field bits they set),
+        # so a tracker whose bytes did not change since the last packet is not decoded again
+        self._decoded = {}
+
+    def reset(self):
+        self.trackers['fields'] = 0
+
+    def active(self):
+        return self.trackers[self.trackers['fields'] != 0]
+
+    # Decode a PSN_DATA_TRACKER_LIST payload into the tracker rows and return the number
+    # of trackers written. Malformed chunks are skipped and counted in self.errors.
+    def decode_tracker_list(self, data, offset=0, end=None):
+        mv = data if isinstance(data, memoryview) else memoryview(data)
+        if end is None:
+            end = len(mv)
+        count = self._decode_uniform(mv, offset, end)
+        if count >= 0:
+            return count
+
+        buf = self._buffer
+        capacity = len(self.trackers)
+        unpack_header = CHUNK_HEADER.unpack_from
+        unpack_fields = FIELDS.unpack_from
+        pack_fields = FIELDS.pack_into
+        subchunks = TRACKER_SUBCHUNKS
+        decoded = self._decoded
+        count = 0
+
+        while offset + 4 <= end:
+            header, = unpack_header(mv, offset)
+            tracker_id = header & 0xFFFF
+            tracker_end = offset + 4 + ((header >> 16) & 0x7FFF)
+            offset += 4
+            if tracker_end > end:
+                self.errors += 1
+                return count
+            if tracker_id >= capacity:
+                self.errors += 1
+                offset = tracker_end
+                continue
+
+            row = tracker_id * ROW_SIZE
+            fields, = unpack_fields(buf, row + FIELDS_OFFSET)
+            previous = decoded.get(tracker_id)
+            if previous is not None and previous[0] == mv[offset:tracker_end]:
+                pack_fields(buf, row + FIELDS_OFFSET, fields | previous[1])
+                offset = tracker_end
+                count += 1
+                continue
+
+            tracker_start = offset
+            tracker_fields = 0
+            errors = self.errors
+            while offset + 4 <= tracker_end:
+                header, = unpack_header(mv, offset)
+                data_len = (header >> 16) & 0x7FFF
+                offset += 4
+                layout = subchunks.get(header & 0xFFFF)
+                if layout is None or layout[1] != data_len or offset + data_len > tracker_end:
+                    if layout is not None:
+                        self.errors += 1
+                    offset += data_len
+                    continue
+                start = row + layout[0]
+                buf[start:start + data_len] = mv[offset:offset + data_len]
+                tracker_fields |= layout[2]
+                offset += data_len
+            pack_fields(buf, row + FIELDS_OFFSET, fields | tracker_fields)
+            if self.errors == errors:
+                decoded[tracker_id] = (bytes(mv[tracker_start:tracker_end]), tracker_fields)
+            else:
+                decoded.pop(tracker_id, None)
+            offset = tracker_end
+            count += 1
+
+        if offset != end:
+            self.errors += 1
+        return count
+
+    # Fast path for the common case where every tracker in the list carries the same
+    # sub-chunks in the same order: check the layout once against all trackers with NumPy
+    # and copy each field column in a single vectorized assignment. Returns -1 when the
+    # list does not have a uniform layout, leaving the frame untouched.
+    def _decode_uniform(self, mv, offset, end):
+        if offset + 4 > end:
+            return -1
+        header, = CHUNK_HEADER.unpack_from(mv, offset)
+        stride = 4 + ((header >> 16) & 0x7FFF)
+        length = end - offset
+        if stride % 4 or length % stride:
+            return -1
+
+        # Layout of the first tracker: (position in tracker, offset in row, length)
+        copies = []
+        fields = 0
+        position = 4
+        while position + 4 <= stride:
+            header, = CHUNK_HEADER.unpack_from(mv, offset + position)
+            data_len = (header >> 16) & 0x7FFF
+            layout = TRACKER_SUBCHUNKS.get(header & 0xFFFF)
+            if layout is None or layout[1] != data_len or fields & layout[2]:
+                return -1
+            copies.append((position + 4, layout[0], data_len))
+            fields |= layout[2]
+            position += 4 + data_len
+        if position != stride:
+            return -1
+
+        count = length // stride
+        block = np.frombuffer(mv, dtype=np.uint8, count=length, offset=offset).reshape(count, stride)
+        words = block.view(WORD_DTYPE)
+        ids = words[:, 0] & 0xFFFF
+        # Every tracker must have the same length and sub-chunk headers as the first one
+        header_columns = [0] + [(position - 4) // 4 for position, _, _ in copies]
+        headers = words[:, header_columns]
+        headers[:, 0] >>= 16
+        if not (headers == headers[0]).all() or ids.max() >= len(self.trackers):
+            return -1
+
+        # Rows are rewritten below, so the bytes remembered by the per-tracker path are stale
+        if self._decoded:
+            self._decoded.clear()
+        rows = self._bytes
+        for position, row_offset, data_len in copies:
+            rows[ids, row_offset:row_offset + data_len] = block[:, position:position + data_len]
+        self.trackers['fields'][ids] |= fields
+        return count
+
+    # Only the active rows are pickled, so forwarding a frame stays proportional to the
+    # number of trackers actually in it
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state['_buffer']
+        state['capacity'] = len(self.trackers)
+        state['trackers'] = self.active()
+        return state
+
+    def __setstate__(self, state):
+        rows = state.pop('trackers')
+        self.__init__(state.pop('capacity'))
+        self.__dict__.update(state)
+        self.trackers[rows['id']] = rows
+
+    def __str__(self):
+        return (f"Packet Timestamp: {self.packet_timestamp}, Frame ID: {self.frame_id}, "
+                f"Frame Packet Count: {self.frame_packet_count}, "
+                f"Trackers: {int(np.count_nonzero(self.trackers['fields']))}")
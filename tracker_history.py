@@ -0,0 +1,142 @@
+import numpy as np
+from tracker_frame import MAX_TRACKERS, FIELD_POS
+from frame_assembler import FIELD_STALE
+
+# Samples kept per tracker
+HISTORY_DEPTH = 256
+# How far past its newest sample a tracker's position is extrapolated, in packet
+# timestamp units (microseconds)
+MAX_EXTRAPOLATION = 50000
+
+LINEAR = 'linear'
+CUBIC = 'cubic'
+
+
+# Recent positions of every tracker of one PSN source, in fixed-size ring buffers.
+#
+# times[id] and positions[id] are rings of depth samples, stamped with the frame's
+# packet_timestamp; heads[id] is the next slot to write and counts[id] the number of
+# valid samples. append() writes one frame for all its trackers at once, and every
+# query is answered with array operations over (tracker, time) pairs, so neither
+# side creates Python objects per sample.
+class TrackerHistory:
+    def __init__(self, capacity=MAX_TRACKERS, depth=HISTORY_DEPTH):
+        self.capacity = capacity
+        self.depth = depth
+        self.times = np.zeros((capacity, depth), dtype=np.int64)
+        self.positions = np.zeros((capacity, depth, 3), dtype=np.float32)
+        self.heads = np.zeros(capacity, dtype=np.int64)
+        self.counts = np.zeros(capacity, dtype=np.int64)
+
+    def clear(self):
+        self.heads[:] = 0
+        self.counts[:] = 0
+
+    # Record the position of every tracker received in the frame (stale rows carried over
+    # by the frame assembler are skipped)
+    def append(self, frame):
+        fields = frame.trackers['fields'][:self.capacity]
+        ids = np.flatnonzero((fields & FIELD_POS != 0) & (fields & FIELD_STALE == 0))
+        if not len(ids):
+            return 0
+        timestamp = frame.packet_timestamp
+        heads = self.heads[ids]
+        counts = self.counts[ids]
+        newest = self.times[ids, (heads - 1) % self.depth]
+        # A sample that is not newer than the last one means the server's clock was
+        # reset; that tracker's history starts over
+        restart = (counts > 0) & (newest >= timestamp)
+        if restart.any():
+            heads[restart] = 0
+            counts[restart] = 0
+        self.times[ids, heads] = timestamp
+        self.positions[ids, heads] = frame.trackers['pos'][ids]
+        self.heads[ids] = (heads + 1) % self.depth
+        self.counts[ids] = np.minimum(counts + 1, self.depth)
+        return len(ids)
+
+    # Ring slot of each tracker's k-th oldest sample
+    def _slot(self, ids, k):
+        return (self.heads[ids] - self.counts[ids] + k) % self.depth
+
+    # Number of samples of each tracker with a time <= t, by a bisection run for all
+    # (tracker, time) pairs at once
+    def _rank(self, ids, t):
+        low = np.zeros(len(ids), dtype=np.int64)
+        high = self.counts[ids].copy()
+        while True:
+            active = low < high
+            if not active.any():
+                return low
+            middle = (low + high) // 2
+            before = self.times[ids, self._slot(ids, middle)] <= t
+            low = np.where(active & before, middle + 1, low)
+            high = np.where(active & ~before, middle, high)
+
+    def _sample(self, ids, k):
+        slots = self._slot(ids, k)
+        return self.times[ids, slots].astype(np.float64), self.positions[ids, slots].astype(np.float64)
+
+    # Interpolated positions for matching arrays of tracker IDs and times. Returns
+    # (positions, valid): positions has shape (n, 3), and valid is False where the
+    # tracker has fewer than two samples, t is before its oldest sample or more than
+    # max_extrapolation past its newest one.
+    def interpolate(self, ids, t, method=LINEAR, max_extrapolation=MAX_EXTRAPOLATION):
+        ids = np.asarray(ids, dtype=np.int64)
+        t = np.broadcast_to(np.asarray(t, dtype=np.int64), ids.shape)
+        counts = self.counts[ids]
+        rank = self._rank(ids, t)
+        newest_time = self.times[ids, self._slot(ids, counts - 1)]
+        valid = (counts >= 2) & (rank > 0) & (t - newest_time <= max_extrapolation)
+
+        # Segment [k0, k1] containing t, or the last segment when extrapolating
+        k1 = np.clip(rank, 1, np.maximum(counts - 1, 1))
+        k0 = k1 - 1
+        t0, p0 = self._sample(ids, k0)
+        t1, p1 = self._sample(ids, k1)
+        span = np.maximum(t1 - t0, 1.0)
+        u = ((t - t0) / span)[:, None]
+
+        if method == LINEAR:
+            positions = p0 + (p1 - p0) * u
+        elif method == CUBIC:
+            # Cubic Hermite spline with finite-difference tangents, clamped at the ends
+            last = counts - 1
+            tb, pb = self._sample(ids, np.maximum(k0 - 1, 0))
+            ta, pa = self._sample(ids, np.minimum(k1 + 1, np.maximum(last, 0)))
+            m0 = (p1 - pb) / np.maximum(t1 - tb, 1.0)[:, None]
+            m1 = (pa - p0) / np.maximum(ta - t0, 1.0)[:, None]
+            extrapolating = (u > 1.0)[:, 0]
+            u = np.minimum(u, 1.0)
+            u2 = u * u
+            u3 = u2 * u
+            dt = span[:, None]
+            positions = ((2 * u3 - 3 * u2 + 1) * p0 + (u3 - 2 * u2 + u) * dt * m0 +
+                         (-2 * u3 + 3 * u2) * p1 + (u3 - u2) * dt * m1)
+            # Past the newest sample, continue along the end tangent
+            beyond = (t - t1)[:, None]
+            positions = np.where(extrapolating[:, None], p1 + m1 * beyond, positions)
+        else:
+            raise ValueError(f"Unknown interpolation method: {method}")
+        positions[~valid] = np.nan
+        return positions, valid
+
+    # Every tracker (or the given ones) at time t: (ids, positions, valid)
+    def at(self, t, ids=None, method=LINEAR, max_extrapolation=MAX_EXTRAPOLATION):
+        if ids is None:
+            ids = np.flatnonzero(self.counts)
+        positions, valid = self.interpolate(ids, t, method, max_extrapolation)
+        return np.asarray(ids), positions, valid
+
+    # One tracker resampled at several times: (positions, valid)
+    def resample(self, tracker_id, times, method=LINEAR, max_extrapolation=MAX_EXTRAPOLATION):
+        times = np.asarray(times, dtype=np.int64)
+        return self.interpolate(np.full(times.shape, tracker_id), times, method, max_extrapolation)
+
+    # The samples of one tracker with t0 <= time <= t1, oldest first: (times, positions)
+    def window(self, tracker_id, t0, t1):
+        count = self.counts[tracker_id]
+        slots = (self.heads[tracker_id] - count + np.arange(count)) % self.depth
+        times = self.times[tracker_id, slots]
+        keep = (times >= t0) & (times <= t1)
+        return times[keep], self.positions[tracker_id, slots[keep]]
@@ -0,0 +1,125 @@
+import time
+from collections import namedtuple
+
+# Events emitted when the tracker list announced by a PSN server changes
+TrackerAdded = namedtuple('TrackerAdded', 'source system_name tracker_id name')
+TrackerRemoved = namedtuple('TrackerRemoved', 'source system_name tracker_id name')
+TrackerRenamed = namedtuple('TrackerRenamed', 'source system_name tracker_id old_name name')
+
+
+class PendingTrackerList:
+    def __init__(self, frame_id, packet_count):
+        self.frame_id = frame_id
+        self.packet_count = packet_count
+        self.packets_received = 0
+        self.trackers = {}
+
+
+# Trackers announced in PSN info packets, keyed by (source IP, system name, tracker ID)
+# so several PSN servers can share a network without overwriting each other.
+#
+# update() compares the announced list with the current one and only touches the
+# entries that changed, returning TrackerAdded/TrackerRemoved/TrackerRenamed events
+# (also passed to every subscriber). A tracker list object that was already applied is
+# skipped without comparing it. Tracker lists split over several info packets are
+# collected until all frame_packet_count packets have arrived. The names dict maps
+# (source IP, tracker ID) to the tracker name, which is all a data packet carries; when
+# one system of a source drops a tracker ID that another system of the same source
+# still announces, that system's name takes its place.
+class TrackerRegistry:
+    def __init__(self):
+        self.trackers = {}
+        self.names = {}
+        self.last_seen = {}
+        self._systems = {}
+        self._pending = {}
+        self._applied = {}
+        self._subscribers = []
+
+    def subscribe(self, callback):
+        self._subscribers.append(callback)
+
+    def unsubscribe(self, callback):
+        self._subscribers.remove(callback)
+
+    def name(self, source, tracker_id, default=None):
+        return self.names.get((source, tracker_id), default)
+
+    def update(self, source, system_name, tracker_list, frame_id=0, frame_packet_count=1, now=None):
+        key = (source, system_name)
+        self.last_seen[key] = time.monotonic() if now is None else now
+
+        if frame_packet_count > 1:
+            pending = self._pending.get(key)
+            if pending is None or pending.frame_id != frame_id:
+                pending = self._pending[key] = PendingTrackerList(frame_id, frame_packet_count)
+            pending.trackers.update((tracker_id, name) for name, tracker_id in tracker_list)
+            pending.packets_received += 1
+            if pending.packets_received < pending.packet_count:
+                return []
+            del self._pending[key]
+            announced = pending.trackers
+        else:
+            # The decoder's info cache hands back the very same list for a repeated packet
+            if tracker_list is self._applied.get(key):
+                return []
+            self._applied[key] = tracker_list
+            announced = {tracker_id: name for name, tracker_id in tracker_list}
+
+        current = self._systems.get(key, {})
+        if announced == current:
+            return []
+
+        events = []
+        for tracker_id, name in announced.items():
+            old_name = current.get(tracker_id)
+            if old_name is None:
+                events.append(TrackerAdded(source, system_name, tracker_id, name))
+            elif old_name != name:
+                events.append(TrackerRenamed(source, system_name, tracker_id, old_name, name))
+            else:
+                continue
+            self.trackers[(source, system_name, tracker_id)] = name
+            self.names[(source, tracker_id)] = name
+        for tracker_id, name in current.items():
+            if tracker_id not in announced:
+                events.append(TrackerRemoved(source, system_name, tracker_id, name))
+                del self.trackers[(source, system_name, tracker_id)]
+        self._systems[key] = announced
+        for event in events:
+            if isinstance(event, TrackerRemoved):
+                self._forget_name(source, event.tracker_id)
+
+        self._notify(events)
+        return events
+
+    # Remove every system that has not sent an info packet for max_age seconds
+    def remove_stale(self, max_age, now=None):
+        if now is None:
+            now = time.monotonic()
+        events = []
+        for key, seen in list(self.last_seen.items()):
+            if now - seen < max_age:
+                continue
+            source, system_name = key
+            for tracker_id, name in self._systems.pop(key, {}).items():
+                events.append(TrackerRemoved(source, system_name, tracker_id, name))
+                del self.trackers[(source, system_name, tracker_id)]
+                self._forget_name(source, tracker_id)
+            del self.last_seen[key]
+            self._pending.pop(key, None)
+            self._applied.pop(key, None)
+        self._notify(events)
+        return events
+
+    def _forget_name(self, source, tracker_id):
+        for (system_source, _), announced in self._systems.items():
+            if system_source == source and tracker_id in announced:
+                self.names[(source, tracker_id)] = announced[tracker_id]
+                return
+        self.names.pop((source, tracker_id), None)
+
+    def _notify(self, events):
+        if events:
+            for callback in self._subscribers:
+                callback(events)
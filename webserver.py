@@ -1,4 +1,10 @@
-from flask import Flask
+import threading
+from flask import Flask, Response, request
+import receiver
+from metrics import CONTENT_TYPE
+
+# Run the PSN receiver in this process so its metrics can be served
+RUN_RECEIVER = True
 
 app = Flask(__name__)
 
@@ -6,5 +12,35 @@ app = Flask(__name__)
 def hello_world():
     return 'Hello, World!'
 
+# Receiver metrics in the Prometheus text exposition format
+@app.route('/metrics')
+def metrics():
+    return Response(receiver.metrics.render(), content_type=CONTENT_TYPE)
+
+# Serves JSON serialized once per version and shared by every request, with that
+# version's ETag
+def snapshot_response(etag, body):
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+    else:
+        response = Response(body, mimetype='application/json')
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+# Latest frame of every PSN source, with the fields each tracker was sent with
+@app.route('/api/state')
+def api_state():
+    snapshot = receiver.state_store.current
+    return snapshot_response(receiver.state_store.etag(snapshot), snapshot.state_json())
+
+# Trackers announced by every PSN server
+@app.route('/api/trackers')
+def api_trackers():
+    snapshot = receiver.state_store.current
+    return snapshot_response(receiver.state_store.trackers_etag(snapshot), snapshot.trackers_json())
+
 if __name__ == '__main__':
+    if RUN_RECEIVER:
+        threading.Thread(target=receiver.start_udp_receiver, name='PSNReceiver', daemon=True).start()
     app.run(host='0.0.0.0', port=5000)  # Replace 5000 with your desired port number
@@ -0,0 +1,237 @@
+import json
+import os
+import time
+from collections import namedtuple
+import numpy as np
+from tracker_frame import MAX_TRACKERS, FIELD_POS
+from frame_assembler import FIELD_STALE
+
+# Zone triggers: enter/exit/dwell events when trackers cross named 3D zones.
+#
+# Zones are read from the "zones" list of config.json. Every zone has a name and a type:
+#
+#   {"name": "Downstage", "type": "box", "min": [-4, -2, 0], "max": [4, 0, 3]}
+#   {"name": "Lift", "type": "cylinder", "center": [0, 3], "radius": 1.2, "z": [0, 3]}
+#   {"name": "Ramp", "type": "polygon", "points": [[-6, 2], [-3, 2], [-3, 5]], "z": [0, 3]}
+#
+# and may override the "zone_defaults" of hysteresis (metres a tracker must be inside
+# the zone to enter it and outside to leave it), debounce (seconds the change must
+# persist) and dwell (seconds inside before a ZoneDwell event, 0 for none).
+
+CONFIG_FILE = 'config.json'
+DEFAULT_HYSTERESIS = 0.1
+DEFAULT_DEBOUNCE = 0.1
+DEFAULT_DWELL = 0.0
+
+ZONE_TYPES = ('box', 'cylinder', 'polygon')
+
+Zone = namedtuple('Zone', 'name type params hysteresis debounce dwell')
+
+ZoneEntered = namedtuple('ZoneEntered', 'source zone tracker_id')
+ZoneExited = namedtuple('ZoneExited', 'source zone tracker_id')
+ZoneDwell = namedtuple('ZoneDwell', 'source zone tracker_id seconds')
+
+
+def load_zones(path=CONFIG_FILE):
+    if not os.path.exists(path) or os.path.getsize(path) == 0:
+        return []
+    with open(path) as f:
+        config = json.load(f)
+    defaults = config.get('zone_defaults', {})
+    zones = []
+    for entry in config.get('zones', []):
+        zone_type = entry.get('type')
+        if zone_type not in ZONE_TYPES:
+            raise ValueError(f"Zone {entry.get('name')!r} has unknown type {zone_type!r}")
+        params = {key: value for key, value in entry.items()
+                  if key not in ('name', 'type', 'hysteresis', 'debounce', 'dwell')}
+        zones.append(Zone(entry['name'], zone_type, params,
+                          entry.get('hysteresis', defaults.get('hysteresis', DEFAULT_HYSTERESIS)),
+                          entry.get('debounce', defaults.get('debounce', DEFAULT_DEBOUNCE)),
+                          entry.get('dwell', defaults.get('dwell', DEFAULT_DWELL))))
+    return zones
+
+
+# Combines a 2D signed distance with the distance outside a z range into the signed
+# distance to the extruded shape (negative inside)
+def _extrude(planar, z, z_min, z_max):
+    vertical = np.maximum(z_min - z, z - z_max)
+    outside = np.hypot(np.maximum(planar, 0), np.maximum(vertical, 0))
+    return outside + np.minimum(np.maximum(planar, vertical), 0)
+
+
+# Signed distance from every point to every zone, as one (points, zones) array. Zones of
+# a type share arrays, so each type is a single broadcast over all points and zones.
+# Polygon distances are exact only within the zone's hysteresis of its bounding box;
+# further out the distance to the bounding box is returned, which is a lower bound and
+# already past any threshold the engine tests.
+class ZoneShapes:
+    def __init__(self, zones):
+        self.zones = sorted(zones, key=lambda zone: ZONE_TYPES.index(zone.type))
+        boxes = [zone.params for zone in self.zones if zone.type == 'box']
+        cylinders = [zone.params for zone in self.zones if zone.type == 'cylinder']
+        polygons = [zone.params for zone in self.zones if zone.type == 'polygon']
+
+        self.box_min = np.array([box['min'] for box in boxes], dtype=np.float64).reshape(-1, 3)
+        self.box_max = np.array([box['max'] for box in boxes], dtype=np.float64).reshape(-1, 3)
+        self.box_centre = (self.box_min + self.box_max) / 2
+        self.box_half = (self.box_max - self.box_min) / 2
+        self.cylinder_center = np.array([c['center'][:2] for c in cylinders], dtype=np.float64).reshape(-1, 2)
+        self.cylinder_radius = np.array([c['radius'] for c in cylinders], dtype=np.float64)
+        self.cylinder_z = np.array([c['z'] for c in cylinders], dtype=np.float64).reshape(-1, 2)
+        # Polygons are padded to the same vertex count by repeating their first vertex;
+        # the zero-length edges this adds change neither test
+        vertex_count = max((len(p['points']) for p in polygons), default=1)
+        self.polygon_vertices = np.array([[point[:2] for point in p['points']] +
+                                          [p['points'][0][:2]] * (vertex_count - len(p['points']))
+                                          for p in polygons], dtype=np.float64).reshape(-1, vertex_count, 2)
+        # Edges as separate x and y arrays of shape (polygons, edges)
+        self.edge_ax = self.polygon_vertices[..., 0].copy()
+        self.edge_ay = self.polygon_vertices[..., 1].copy()
+        self.edge_bx = np.roll(self.edge_ax, -1, axis=1)
+        self.edge_by = np.roll(self.edge_ay, -1, axis=1)
+        self.edge_dx = self.edge_bx - self.edge_ax
+        self.edge_dy = self.edge_by - self.edge_ay
+        self.edge_inverse_length = 1.0 / np.maximum(self.edge_dx ** 2 + self.edge_dy ** 2, 1e-12)
+        self.polygon_z = np.array([p['z'] for p in polygons], dtype=np.float64).reshape(-1, 2)
+        low = self.polygon_vertices.min(axis=1) if len(polygons) else np.zeros((0, 2))
+        high = self.polygon_vertices.max(axis=1) if len(polygons) else np.zeros((0, 2))
+        self.polygon_centre = (low + high) / 2
+        self.polygon_half = (high - low) / 2
+        self.polygon_margin = np.array([zone.hysteresis for zone in self.zones if zone.type == 'polygon'])
+
+    def signed_distance(self, positions):
+        columns = []
+        if len(self.box_min):
+            q = np.abs(positions[:, None, :] - self.box_centre[None]) - self.box_half[None]
+            columns.append(np.linalg.norm(np.maximum(q, 0), axis=2) + np.minimum(q.max(axis=2), 0))
+        if len(self.cylinder_radius):
+            planar = np.linalg.norm(positions[:, None, :2] - self.cylinder_center[None], axis=2) - self.cylinder_radius
+            columns.append(_extrude(planar, positions[:, 2:3], self.cylinder_z[:, 0], self.cylinder_z[:, 1]))
+        if len(self.polygon_vertices):
+            columns.append(_extrude(self._polygon_distance(positions[:, :2]), positions[:, 2:3],
+                                    self.polygon_z[:, 0], self.polygon_z[:, 1]))
+        if not columns:
+            return np.zeros((len(positions), 0))
+        return np.concatenate(columns, axis=1)
+
+    # Signed 2D distance to each polygon. The distance to its bounding box is computed for
+    # every pair; only the pairs close enough to matter get the exact test.
+    def _polygon_distance(self, points):
+        q = np.abs(points[:, None, :] - self.polygon_centre[None]) - self.polygon_half[None]
+        distance = np.linalg.norm(np.maximum(q, 0), axis=2)
+        rows, polygons = np.nonzero(distance <= self.polygon_margin)
+        if len(rows):
+            distance[rows, polygons] = self._exact_polygon_distance(points[rows], polygons)
+        return distance
+
+    # Signed distance of (point, polygon) pairs: distance to the nearest edge, negative
+    # when the point is inside by the crossing number test. Shapes are (pairs, edges).
+    def _exact_polygon_distance(self, points, polygons):
+        px = points[:, 0:1]
+        py = points[:, 1:2]
+        ax, ay = self.edge_ax[polygons], self.edge_ay[polygons]
+        dx, dy = self.edge_dx[polygons], self.edge_dy[polygons]
+        rx, ry = px - ax, py - ay
+        t = np.clip((rx * dx + ry * dy) * self.edge_inverse_length[polygons], 0.0, 1.0)
+        ex, ey = rx - t * dx, ry - t * dy
+        distance = np.sqrt((ex * ex + ey * ey).min(axis=1))
+
+        by = self.edge_by[polygons]
+        straddles = (ay > py) != (by > py)
+        crosses = straddles & ((rx * dy < ry * dx) == (dy > 0))
+        inside = crosses.sum(axis=1) % 2 == 1
+        return np.where(inside, -distance, distance)
+
+
+# Per-source trigger state, indexed by (tracker ID, zone)
+class ZoneState:
+    def __init__(self, capacity, zone_count):
+        self.inside = np.zeros((capacity, zone_count), dtype=bool)
+        self.changing_since = np.full((capacity, zone_count), np.nan)
+        self.entered_at = np.full((capacity, zone_count), np.nan)
+        self.dwell_sent = np.zeros((capacity, zone_count), dtype=bool)
+
+
+# Evaluates every zone against every tracker of a frame in one pass. A tracker enters a
+# zone when it is hysteresis metres inside it and leaves when it is hysteresis metres
+# outside, and either change only takes effect once it has held for debounce seconds.
+# A tracker that is missing from its source's frames or only stale in them counts as
+# outside every zone, so it leaves the zones it was in once that has lasted for debounce
+# seconds. Events are returned from update() and passed to every subscriber.
+class ZoneEngine:
+    def __init__(self, zones, capacity=MAX_TRACKERS):
+        self.shapes = ZoneShapes(zones)
+        self.zones = self.shapes.zones
+        self.names = [zone.name for zone in self.zones]
+        self.capacity = capacity
+        self.hysteresis = np.array([zone.hysteresis for zone in self.zones], dtype=np.float64)
+        self.debounce = np.array([zone.debounce for zone in self.zones], dtype=np.float64)
+        self.dwell = np.array([zone.dwell for zone in self.zones], dtype=np.float64)
+        self.states = {}
+        self._subscribers = []
+
+    def subscribe(self, callback):
+        self._subscribers.append(callback)
+
+    def unsubscribe(self, callback):
+        self._subscribers.remove(callback)
+
+    def update(self, frame, now=None):
+        if not self.zones:
+            return []
+        if now is None:
+            now = time.monotonic()
+        fields = frame.trackers['fields'][:self.capacity]
+        present = (fields & FIELD_POS != 0) & (fields & FIELD_STALE == 0)
+        state = self.states.get(frame.source)
+        if state is None:
+            if not present.any():
+                return []
+            state = self.states[frame.source] = ZoneState(self.capacity, len(self.zones))
+        # Trackers with a position, and those still inside a zone that have none
+        ids = np.flatnonzero(present | state.inside[:len(fields)].any(axis=1))
+        if not len(ids):
+            return []
+
+        inside = state.inside[ids]
+        target = np.zeros_like(inside)
+        shown = present[ids]
+        distance = self.shapes.signed_distance(frame.trackers['pos'][ids[shown]].astype(np.float64))
+        target[shown] = np.where(inside[shown], distance <= self.hysteresis, distance <= -self.hysteresis)
+
+        changing = target != inside
+        since = state.changing_since[ids]
+        since = np.where(changing, np.where(np.isnan(since), now, since), np.nan)
+        flip = changing & (now - since >= self.debounce)
+        since[flip] = np.nan
+        inside = inside ^ flip
+        state.changing_since[ids] = since
+        state.inside[ids] = inside
+
+        entered_at = state.entered_at[ids]
+        dwell_sent = state.dwell_sent[ids]
+        entered = flip & inside
+        exited = flip & ~inside
+        entered_at[entered] = now
+        entered_at[exited] = np.nan
+        dwell_sent[flip] = False
+        dwelling = inside & ~dwell_sent & (self.dwell > 0) & (now - entered_at >= self.dwell)
+        dwell_sent |= dwelling
+        state.entered_at[ids] = entered_at
+        state.dwell_sent[ids] = dwell_sent
+
+        if not (flip.any() or dwelling.any()):
+            return []
+        events = []
+        source = frame.source
+        for row, column in zip(*np.nonzero(exited)):
+            events.append(ZoneExited(source, self.names[column], int(ids[row])))
+        for row, column in zip(*np.nonzero(entered)):
+            events.append(ZoneEntered(source, self.names[column], int(ids[row])))
+        for row, column in zip(*np.nonzero(dwelling)):
+            events.append(ZoneDwell(source, self.names[column], int(ids[row]),
+                                    float(now - entered_at[row, column])))
+        for callback in self._subscribers:
+            callback(events)
+        return events